@@ -0,0 +1,99 @@
+"""
+Scaling benchmark of the frame-parallel trajectory analysis (src.analysis.run_parallel).
+
+Builds a synthetic solvated system (a poly-alanine chain plus TIP3P-like water, --atoms atoms in total) with a
+--frames frame XTC trajectory, then times the analysis for each worker count and checks that every run
+produces byte-identical .xvg files.
+
+    python benchmarks/analysis_scaling.py --atoms 100000 --frames 10000 --workers 1 2 4 8
+"""
+import argparse
+import filecmp
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import MDAnalysis as mda  # type: ignore
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.analysis import run_parallel  # noqa: E402
+
+RESIDUE = [("N", (0.0, 0.0, 0.0)), ("H", (0.0, 1.0, 0.0)), ("CA", (1.4, 0.0, 0.0)), ("HA", (1.4, -0.6, 0.9)),
+           ("CB", (1.4, -1.0, -1.2)), ("C", (2.4, 0.5, 0.0)), ("O", (2.4, 1.7, 0.0))]
+WATER = [("O", (0.0, 0.0, 0.0)), ("H1", (0.96, 0.0, 0.0)), ("H2", (-0.24, 0.93, 0.0))]
+
+
+def build_system(workdir: Path, n_atoms: int, n_frames: int, n_residues: int = 300, seed: int = 0):
+    """Write workdir/system.gro and workdir/traj.xtc, unless they already exist."""
+    gro, xtc = workdir / "system.gro", workdir / "traj.xtc"
+    if gro.exists() and xtc.exists():
+        return gro, xtc
+    rng = np.random.default_rng(seed)
+    n_waters = (n_atoms - n_residues * len(RESIDUE)) // len(WATER)
+    box = (n_waters * 30.0) ** (1 / 3)  # ~30 Å^3 per water
+
+    names, resnames, resindex, positions = [], [], [], []
+    for r in range(n_residues):
+        # Compact random-walk chain around the box centre
+        origin = np.array([box / 2 + 3.8 * np.cos(r / 5) * (r % 20), box / 2 + 3.8 * np.sin(r / 5) * (r % 20), box / 2 + (r // 20) * 3.0])
+        for name, offset in RESIDUE:
+            names.append(name), resnames.append("ALA"), resindex.append(r), positions.append(origin + offset)
+    for w in range(n_waters):
+        origin = rng.uniform(0, box, 3)
+        for name, offset in WATER:
+            names.append(name), resnames.append("WAT"), resindex.append(n_residues + w), positions.append(origin + offset)
+
+    n = len(names)
+    u = mda.Universe.empty(n, n_residues=n_residues + n_waters, atom_resindex=np.array(resindex), trajectory=True)
+    u.add_TopologyAttr("names", names)
+    u.add_TopologyAttr("resnames", ["ALA"] * n_residues + ["WAT"] * n_waters)
+    u.add_TopologyAttr("resids", np.arange(1, n_residues + n_waters + 1))
+    u.add_TopologyAttr("masses", [{"N": 14.007, "C": 12.011, "O": 15.999, "H": 1.008}[x[0]] for x in names])
+    base = np.array(positions, dtype=np.float32)
+    u.atoms.positions = base
+    u.dimensions = [box, box, box, 90, 90, 90]
+    u.atoms.write(str(gro))
+    with mda.Writer(str(xtc), n) as writer:
+        for frame in range(n_frames):
+            u.atoms.positions = base + rng.normal(0, 0.3, base.shape).astype(np.float32)
+            u.trajectory.ts.time = frame * 10.0
+            writer.write(u.atoms)
+    return gro, xtc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--atoms", type=int, default=100_000)
+    parser.add_argument("--frames", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--workdir", type=Path, default=Path("benchmark_analysis"))
+    args = parser.parse_args()
+
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    gro, xtc = build_system(args.workdir, args.atoms, args.frames)
+    print(f"System: {args.atoms} atoms, {args.frames} frames ({time.perf_counter() - start:.1f} s to prepare)")
+
+    workers = [w for w in args.workers if w <= (os.cpu_count() or 1)]
+    baseline, reference_dir = None, None
+    print(f"{'workers':>8} {'time (s)':>10} {'speed-up':>9} {'identical':>10}")
+    for n_workers in workers:
+        out_dir = args.workdir / f"workers_{n_workers}"
+        out_dir.mkdir(exist_ok=True)
+        start = time.perf_counter()
+        analysis, state = run_parallel(gro, xtc, n_workers=n_workers, output_xtc=out_dir / "traj_noPBC.xtc")
+        analysis.write_outputs(state, out_dir)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        if reference_dir is None:
+            reference_dir, identical = out_dir, True
+        else:
+            names = [p.name for p in reference_dir.glob("*.xvg")]
+            _, mismatch, errors = filecmp.cmpfiles(reference_dir, out_dir, names, shallow=False)
+            identical = not mismatch and not errors
+        print(f"{n_workers:>8} {elapsed:>10.1f} {baseline / elapsed:>9.2f} {str(identical):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup import-time budget of the agents (src.agents, imported by main.py and by each batch worker).
+
+Imports the module in fresh interpreters, reports the median wall time and the slowest imports (python -X importtime),
+and fails if the median exceeds --budget seconds or if a heavy tool dependency was imported at startup: the tools in
+src.tools.map.TOOL_MAP and the LLM client are imported on their first call.
+
+    python benchmarks/import_time.py --budget 1.0 --repeats 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Imported by the tools or the first LLM call only
+LAZY_MODULES = ["litellm", "tiktoken", "paperqa", "pdbfixer", "openmm", "Bio", "MDAnalysis", "parmed", "numpy",
+                "sentence_transformers", "fitz", "pypdf"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def measure(module: str) -> tuple[float, list[str]]:
+    """Import time of module in a fresh interpreter, and the lazy modules it imported."""
+    out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout.splitlines()
+    return float(out[0]), out[1].split() if len(out) > 1 else []
+
+
+def slowest_imports(module: str, n: int = 10) -> list[tuple[int, str]]:
+    """(cumulative microseconds, module) of the n slowest imports, from python -X importtime."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="src.agents")
+    parser.add_argument("--budget", type=float, default=1.0, help="maximum median import time (s)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    times, imported = [], set()
+    for _ in range(args.repeats):
+        seconds, lazy = measure(args.module)
+        times.append(seconds)
+        imported.update(lazy)
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median:.3f} s, min {min(times):.3f} s, max {max(times):.3f} s "
+          f"({args.repeats} runs, budget {args.budget:.3f} s)")
+    print("Slowest imports (cumulative):")
+    for microseconds, name in slowest_imports(args.module):
+        print(f"  {microseconds / 1e6:8.3f} s  {name}")
+
+    failures = []
+    if median > args.budget:
+        failures.append(f"median import time {median:.3f} s exceeds the budget of {args.budget:.3f} s")
+    if imported:
+        failures.append(f"imported at startup instead of on first use: {', '.join(sorted(imported))}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -51,6 +51,9 @@ class CommandLineArgs:
 
     model_supports_system_messages: bool = True
 
+    hmr: bool = False
+    "Repartition hydrogen masses and run production MD with a 4 fs timestep."
+
 
 def main(config: CommandLineArgs):
     root_logger = utils.get_class_logger("Main")
@@ -78,6 +81,7 @@ def main(config: CommandLineArgs):
         md_temp=config.temp,
         md_duration=config.duration,
         model_supports_system_messages=config.model_supports_system_messages,
+        hmr=config.hmr,
     )
     prep_agent.setup_tools()
     pdb_file_path, ligand_name, plan, llm_cost = prep_agent.run()
@@ -100,6 +104,7 @@ def main(config: CommandLineArgs):
         md_duration=md_duration,
         model_supports_system_messages=config.model_supports_system_messages,
         plan=plan,
+        hmr=plan["parameters"]["hmr"],
     )
     md_agent.setup_tools()
 
@@ -2,16 +2,26 @@ import os
 from pathlib import Path
 from typing import Dict, Any, List
 import json
-from litellm import completion
+import functools
 from abc import ABC, abstractmethod
 import traceback
 from src import constants
 
 from src.tools.map import TOOL_MAP
 from src import utils, constants
-import tiktoken
 
-ENC = tiktoken.get_encoding("cl100k_base")
+
+# litellm and tiktoken take seconds to import: they are imported on the first LLM call and token count, not at startup
+def completion(*args, **kwargs):
+    import litellm
+    litellm.drop_params = True
+    return litellm.completion(*args, **kwargs)
+
+
+@functools.cache
+def _encoding():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
 
 
 class ToolOutputError(Exception):
@@ -31,6 +41,7 @@ class BaseAgent(ABC):
         md_temp: float | None = None,
         md_duration: float | None = None,
         model_supports_system_messages: bool = True,
+        hmr: bool = False,
     ):
         self.model_name = model_name
         self.temperature = temperature
@@ -39,6 +50,7 @@ class BaseAgent(ABC):
         self.ligand_name = ligand_name
         self.md_temp = md_temp
         self.md_duration = md_duration
+        self.hmr = hmr
 
         self.model_supports_system_messages = model_supports_system_messages
 
@@ -61,7 +73,7 @@ class BaseAgent(ABC):
     def _count_tokens(self, text):
         if not isinstance(text, str):
             text = json.dumps(text)
-        return len(ENC.encode(text))
+        return len(_encoding().encode(text))
     
     def _find_recent_block(self, messages):
         """
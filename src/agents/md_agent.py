@@ -1,14 +1,11 @@
 from pathlib import Path
 from typing import Dict, Any
 import json
-import litellm
 
 from src.agents.agent import BaseAgent, ToolOutputError
 from src.prompts import MD_SYSTEM_PROMPT
 from src.tools import tool_schema
 
-litellm.drop_params = True 
-
 
 class MDAgent(BaseAgent):
     MAX_ITERATION = 35
@@ -35,6 +32,7 @@ class MDAgent(BaseAgent):
         md_duration=None,
         model_supports_system_messages=True,
         plan: Dict[str, Any] = None,
+        hmr=False,
     ):
         super().__init__(
             model_name,
@@ -44,7 +42,8 @@ class MDAgent(BaseAgent):
             ligand_name,
             md_temp,
             md_duration,
-            model_supports_system_messages
+            model_supports_system_messages,
+            hmr,
         )
 
         self.structure_path = Path(structure_path)
@@ -57,7 +56,7 @@ class MDAgent(BaseAgent):
         self.logger.info(f"MDAgent initialized.")
 
     def _additional_check_for_errors_tool_output(self, tool_name, tool_call):
-        if (tool_name in ("gromacs_production", "gromacs_equil", "gromacs_analysis")) and (
+        if (tool_name in ("gromacs_production", "gromacs_equil", "gromacs_analysis", "gromacs_clustering")) and (
             " failed with return code " in tool_call
         ):
             return False
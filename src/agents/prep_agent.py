@@ -3,14 +3,12 @@ import json
 import sys
 from typing import Dict, Any, List
 from pydantic import BaseModel
-import litellm
 from src.tools import tool_schema
+from src.tools.RAG_tools import index_status, warm_up_documents
 from src.agents.agent import BaseAgent
 from src.prompts import PREP_SYSTEM_PROMPT
 
 
-litellm.drop_params = True
-
 
 class Tool(BaseModel):
     name: str
@@ -29,6 +27,7 @@ class PrepAgent(BaseAgent):
         md_temp=None,
         md_duration=None,
         model_supports_system_messages=True,
+        hmr=False,
     ):
         super().__init__(
             model_name,
@@ -38,7 +37,8 @@ class PrepAgent(BaseAgent):
             ligand_name,
             md_temp,
             md_duration,
-            model_supports_system_messages
+            model_supports_system_messages,
+            hmr,
         )
 
         self.messages: List[Dict[str, Any]] = []
@@ -46,7 +46,9 @@ class PrepAgent(BaseAgent):
         self.user_temp = None
         self.agent_plan = ""
 
-        self.logger.info(f"PrepAgent initialized.")
+        # Literature searches come early in planning: load the paper index while the first prompts are prepared
+        warm_up_documents()
+        self.logger.info(f"PrepAgent initialized. Paper index: {index_status()}.")
 
     def setup_tools(self):
         self.tool_schemas = tool_schema.create_tool_schema_prep(self.sandbox_dir)
@@ -190,6 +192,7 @@ class PrepAgent(BaseAgent):
                 {"step": "gromacs_equil", "description": "Perform energy minimization and equilibration."},
                 {"step": "gromacs_production", "description": "Run production MD simulation."},
                 {"step": "gromacs_analysis", "description": "Analyse production MD simulation."},
+                {"step": "gromacs_clustering", "description": "Cluster the trajectory into representative conformations."},
             ]
         else:
             steps = [
@@ -203,6 +206,7 @@ class PrepAgent(BaseAgent):
                 {"step": "gromacs_equil", "description": "Perform energy minimization and equilibration."},
                 {"step": "gromacs_production", "description": "Run production MD simulation."},
                 {"step": "gromacs_analysis", "description": "Analyse production MD simulation."},
+                {"step": "gromacs_clustering", "description": "Cluster the trajectory into representative conformations."},
             ]
 
         plan = {
@@ -210,7 +214,7 @@ class PrepAgent(BaseAgent):
             "pdb_file_path": self.pdb_file_path,
             "ligand": self.ligand_name,
             "plan": steps,
-            "parameters": {"temperature_k": float(temperature), "duration_ns": float(duration)},
+            "parameters": {"temperature_k": float(temperature), "duration_ns": float(duration), "hmr": self.hmr},
         }
 
         return plan
@@ -0,0 +1,35 @@
+from .cache import TrajectoryCache
+from .clustering import TrajectoryClustering, cluster_trajectory
+from .convergence import Convergence, assess_run, convergence_report
+from .edr import Energies, read_edr
+from .engine import AnalysisState, TrajectoryAnalysis
+from .interactions import InteractionFingerprint
+from .live import LiveAnalysis, load_live_state
+from .parallel import analyze_trajectory, frame_blocks, run_parallel
+from .results import Series, load_results, save_results, summarize_results
+from .xvg import read_xvg, write_xvg
+
+__all__ = [
+    "AnalysisState",
+    "Convergence",
+    "Energies",
+    "InteractionFingerprint",
+    "LiveAnalysis",
+    "Series",
+    "TrajectoryAnalysis",
+    "TrajectoryCache",
+    "TrajectoryClustering",
+    "analyze_trajectory",
+    "assess_run",
+    "cluster_trajectory",
+    "convergence_report",
+    "frame_blocks",
+    "load_live_state",
+    "load_results",
+    "run_parallel",
+    "read_edr",
+    "read_xvg",
+    "save_results",
+    "summarize_results",
+    "write_xvg",
+]
@@ -0,0 +1,180 @@
+"""
+Per-trajectory sidecar cache (.<name>.cache/ next to the .xtc): a frame-offset index for O(1) seeks and raw
+frame slicing, and an optional memory-mapped float32 array of the coordinates of selected atoms.
+The sidecar records the size and mtime of the trajectory and is rebuilt when the trajectory changes.
+"""
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+from numpy.lib.format import open_memmap
+from MDAnalysis.lib.formats.libmdaxdr import XTCFile  # type: ignore
+from src.utils import get_class_logger
+
+logger = get_class_logger(__name__)
+
+CACHE_VERSION = 1
+
+
+class TrajectoryCache:
+    """
+    Sidecar cache of an XTC trajectory.
+
+    Files in the sidecar directory:
+        meta.json     trajectory size/mtime, number of frames and atoms, state of the coordinate cache
+        offsets.npy   byte offset of every frame
+        coords.npy    (n_frames, n_selected, 3) float32 coordinates in Å (optional)
+        indices.npy   trajectory atom indices of the cached coordinates
+        times.npy     time of every frame in ps
+    """
+
+    def __init__(self, trajectory):
+        self.trajectory = Path(trajectory)
+        self.directory = self.trajectory.parent / f".{self.trajectory.name}.cache"
+        self._meta = None
+
+    # ------------------------------------------------------------------ metadata
+    def _stat(self) -> dict:
+        stat = self.trajectory.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @property
+    def meta(self) -> dict:
+        if self._meta is None:
+            path = self.directory / "meta.json"
+            self._meta = json.loads(path.read_text()) if path.exists() else {}
+        return self._meta
+
+    def _write_meta(self, **values) -> None:
+        self._meta = {**self.meta, **values, "version": CACHE_VERSION, **self._stat()}
+        (self.directory / "meta.json").write_text(json.dumps(self._meta, indent=2))
+
+    def is_valid(self) -> bool:
+        """True if the sidecar was built for the current version of the trajectory."""
+        meta = self.meta
+        return (self.trajectory.exists() and meta.get("version") == CACHE_VERSION
+                and all(meta.get(k) == v for k, v in self._stat().items()))
+
+    def invalidate(self) -> None:
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self._meta = None
+
+    def _ensure(self) -> None:
+        """Rebuild the frame-offset index if the sidecar is missing or stale."""
+        if self.is_valid() and (self.directory / "offsets.npy").exists():
+            return
+        if self.meta:
+            logger.info(f"{self.trajectory.name} changed since its cache was built, rebuilding it")
+        self.invalidate()
+        self.directory.mkdir(parents=True)
+        with XTCFile(str(self.trajectory)) as xtc:
+            offsets = np.asarray(xtc.offsets, dtype=np.int64)
+            n_atoms = xtc.n_atoms
+        np.save(self.directory / "offsets.npy", offsets)
+        self._write_meta(n_frames=len(offsets), n_atoms=n_atoms, coordinates=False)
+
+    # ------------------------------------------------------------------ frame index
+    def offsets(self) -> np.ndarray:
+        self._ensure()
+        return np.load(self.directory / "offsets.npy")
+
+    @property
+    def n_frames(self) -> int:
+        self._ensure()
+        return self.meta["n_frames"]
+
+    @property
+    def n_atoms(self) -> int:
+        self._ensure()
+        return self.meta["n_atoms"]
+
+    def read_frame(self, frame: int) -> tuple[np.ndarray, np.ndarray, float]:
+        """Positions (Å), box vectors (Å) and time (ps) of one frame, read with a single seek."""
+        with XTCFile(str(self.trajectory)) as xtc:
+            xtc.set_offsets(self.offsets())
+            xtc.seek(frame)
+            data = xtc.read()
+        return data.x * 10, data.box * 10, float(data.time)
+
+    def read_box(self, frame: int) -> np.ndarray:
+        """
+        Box vectors (Å) of one frame, read from its uncompressed XTC header (magic, atoms, step, time, then the 3x3
+        box in nm as big-endian floats): the coordinates are not decompressed.
+        """
+        with open(self.trajectory, "rb") as src:
+            src.seek(self.offsets()[frame] + 16)
+            box = np.frombuffer(src.read(36), dtype=">f4")
+        return box.reshape(3, 3).astype(np.float32) * 10
+
+    def extract_frames(self, frames, output) -> int:
+        """
+        Write the given frames (0-based, in the given order) to a new XTC file by copying their raw bytes:
+        no frame is decompressed. Returns the number of frames written.
+        """
+        offsets = self.offsets()
+        ends = np.append(offsets[1:], self._stat()["size"])
+        frames = [int(f) for f in frames]
+        with open(self.trajectory, "rb") as src, open(output, "wb") as out:
+            for frame in frames:
+                src.seek(offsets[frame])
+                out.write(src.read(ends[frame] - offsets[frame]))
+        return len(frames)
+
+    # ------------------------------------------------------------------ coordinate cache
+    def allocate_coordinates(self, indices, n_frames: int) -> Path:
+        """
+        Create an empty coords.npy for the atoms in indices, to be filled frame by frame (e.g. by analysis workers
+        opening it with np.load(path, mmap_mode="r+")). Call finalize_coordinates() once the trajectory is complete.
+        """
+        self.invalidate()
+        self.directory.mkdir(parents=True)
+        indices = np.asarray(indices, dtype=np.int64)
+        np.save(self.directory / "indices.npy", indices)
+        open_memmap(self.directory / "coords.npy", mode="w+", dtype=np.float32, shape=(n_frames, len(indices), 3)).flush()
+        return self.directory / "coords.npy"
+
+    def finalize_coordinates(self, times) -> None:
+        """Index the finished trajectory and mark the coordinates allocated with allocate_coordinates() as valid."""
+        with XTCFile(str(self.trajectory)) as xtc:
+            offsets = np.asarray(xtc.offsets, dtype=np.int64)
+            n_atoms = xtc.n_atoms
+        np.save(self.directory / "offsets.npy", offsets)
+        np.save(self.directory / "times.npy", np.asarray(times, dtype=np.float64))
+        self._write_meta(n_frames=len(offsets), n_atoms=n_atoms, coordinates=True)
+
+    def build_coordinates(self, indices) -> np.ndarray:
+        """Fill the coordinate cache for the atoms in indices with one sequential read of the trajectory."""
+        n_frames = self.n_frames
+        path = self.allocate_coordinates(indices, n_frames)
+        coords = np.load(path, mmap_mode="r+")
+        indices = np.load(self.directory / "indices.npy")
+        times = np.empty(n_frames)
+        with XTCFile(str(self.trajectory)) as xtc:
+            for i in range(n_frames):
+                data = xtc.read()
+                coords[i] = data.x[indices] * 10
+                times[i] = data.time
+        coords.flush()
+        del coords
+        self.finalize_coordinates(times)
+        return self.coordinates(indices)
+
+    def coordinates(self, indices=None) -> np.ndarray | None:
+        """
+        Read-only memory-mapped (n_frames, n_atoms, 3) coordinates in Å, or None if they are not cached
+        (or were cached for other atoms than indices).
+        """
+        if not (self.is_valid() and self.meta.get("coordinates")):
+            return None
+        if indices is not None and not np.array_equal(np.load(self.directory / "indices.npy"), np.asarray(indices)):
+            return None
+        return np.load(self.directory / "coords.npy", mmap_mode="r")
+
+    def times(self) -> np.ndarray | None:
+        path = self.directory / "times.npy"
+        return np.load(path) if self.is_valid() and path.exists() else None
+
+    def atom_indices(self) -> np.ndarray | None:
+        path = self.directory / "indices.npy"
+        return np.load(path) if self.is_valid() and path.exists() else None
@@ -0,0 +1,285 @@
+"""
+Conformational clustering of a PBC-corrected trajectory, to pick representative protein(+ligand) structures.
+
+Every frame is fitted on the Cα atoms to the average structure, and the distance between two frames (Cα and ligand
+heavy atoms) is the Euclidean distance between their fitted coordinates. This common-reference RMSD is an upper bound
+on the pairwise-fitted RMSD of gmx cluster, close to it within a conformational state and further above it between
+distant states, so clusters are somewhat tighter than gmx cluster's at the same cutoff. Pairwise distances are
+computed block by block as matrix products (|x_i|² + |x_j|² - 2 x_i·x_j), on a thread pool, and only the pairs within
+the cutoff are kept: no N×N matrix is ever stored. Up to CLUSTER_EXACT_MAX_FRAMES frames, and as long as the neighbour lists fit in
+CLUSTER_MAX_NEIGHBOR_PAIRS, the GROMOS algorithm of gmx cluster is used; beyond, an incremental leader clustering
+with a final nearest-leader assignment keeps the cost linear in the number of frames.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+import MDAnalysis as mda  # type: ignore
+from MDAnalysis.coordinates.memory import MemoryReader  # type: ignore
+from src import constants
+from src.analysis.cache import TrajectoryCache
+from src.analysis.engine import C_ALPHA, _is_element
+from src.analysis.xvg import write_xvg
+from src.utils import get_class_logger
+
+logger = get_class_logger(__name__)
+
+FIT_BLOCK_FRAMES = 1024
+
+
+def _fit_rotations(mobile: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """(frames, 3, 3) rotations R minimizing |(mobile - centre) R - reference| (Kabsch, row vectors) for a centred reference."""
+    h = np.einsum("fni,nj->fij", mobile - mobile.mean(axis=1, keepdims=True), reference)
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(u @ vt))
+    u[:, :, -1] *= d[:, None]
+    return u @ vt
+
+
+@dataclass
+class Clustering:
+    """Cluster index of every frame (0 = most populated), and the medoid frame of each cluster."""
+
+    labels: np.ndarray
+    medoids: np.ndarray
+    method: str
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.bincount(self.labels, minlength=len(self.medoids))
+
+
+class TrajectoryClustering:
+    """
+    Args:
+        coordinates: (frames, atoms, 3) coordinates in Å, e.g. the TrajectoryCache memmap of md_noPBC.xtc.
+        fit_atoms: indices (into the atoms of coordinates) of the fitting atoms, e.g. Cα.
+        rmsd_atoms: indices of the atoms whose RMSD is clustered, e.g. Cα and ligand heavy atoms.
+        n_workers: threads for the blocked RMSD products (default: ANALYSIS_WORKERS, else all cores).
+    """
+
+    def __init__(self, coordinates: np.ndarray, fit_atoms, rmsd_atoms, n_workers=None):
+        self.coordinates = coordinates
+        self.fit_atoms = np.asarray(fit_atoms)
+        self.rmsd_atoms = np.asarray(rmsd_atoms)
+        self.n_workers = n_workers or constants.ANALYSIS_WORKERS or os.cpu_count() or 1
+        self.features = self._fitted_features()
+        self.squared_norms = np.einsum("ij,ij->i", self.features, self.features)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.features)
+
+    def _fitted_features(self) -> np.ndarray:
+        """
+        (frames, 3 * rmsd atoms) float32 coordinates fitted on the average structure, scaled so that distances are the
+        common-reference RMSDs (an upper bound on the RMSDs after pairwise fitting).
+        """
+        n_frames = len(self.coordinates)
+        reference = np.asarray(self.coordinates[0, self.fit_atoms], dtype=float)
+        reference = reference - reference.mean(axis=0)
+        features = np.empty((n_frames, 3 * len(self.rmsd_atoms)), dtype=np.float32)
+        # Two passes: fit on the first frame, then on the average of the fitted frames
+        for _ in range(2):
+            total = np.zeros_like(reference)
+            for start in range(0, n_frames, FIT_BLOCK_FRAMES):
+                block = np.asarray(self.coordinates[start:start + FIT_BLOCK_FRAMES], dtype=float)
+                fit = block[:, self.fit_atoms]
+                centre = fit.mean(axis=1, keepdims=True)
+                rotations = _fit_rotations(fit, reference)
+                total += np.einsum("fni,fij->nj", fit - centre, rotations)
+                fitted = np.einsum("fni,fij->fnj", block[:, self.rmsd_atoms] - centre, rotations)
+                features[start:start + len(block)] = fitted.reshape(len(block), -1)
+            reference = total / n_frames
+            reference -= reference.mean(axis=0)
+        return features / np.sqrt(len(self.rmsd_atoms))
+
+    # ------------------------------------------------------------------ blocked distances
+    def _block_rows(self) -> list[tuple[int, int]]:
+        rows = max(1, constants.CLUSTER_BLOCK_ELEMENTS // max(self.n_frames, 1))
+        return [(start, min(start + rows, self.n_frames)) for start in range(0, self.n_frames, rows)]
+
+    def squared_rmsd(self, rows: slice, columns: np.ndarray | slice = slice(None)) -> np.ndarray:
+        """Squared RMSD (Å²) between the frames of rows and of columns, from one matrix product."""
+        d2 = self.squared_norms[rows, None] + self.squared_norms[None, columns] - 2 * (self.features[rows] @ self.features[columns].T)
+        return np.maximum(d2, 0)
+
+    def neighbour_lists(self, cutoff: float, max_pairs: int) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        CSR neighbour lists (row starts, int32 neighbours) of the frames within cutoff (Å) of each other, or None
+        if they would hold more than max_pairs pairs. Row blocks are computed on a thread pool.
+        """
+        cutoff2 = cutoff**2
+
+        def block(bounds):
+            start, stop = bounds
+            rows, cols = np.nonzero(self.squared_rmsd(slice(start, stop)) <= cutoff2)
+            keep = rows + start != cols
+            return np.bincount(rows[keep], minlength=stop - start), cols[keep].astype(np.int32)
+
+        counts, neighbours, n_pairs = [], [], 0
+        with ThreadPoolExecutor(self.n_workers) as pool:
+            for block_counts, block_neighbours in pool.map(block, self._block_rows()):
+                n_pairs += len(block_neighbours)
+                if n_pairs > max_pairs:
+                    return None
+                counts.append(block_counts)
+                neighbours.append(block_neighbours)
+        starts = np.concatenate([[0], np.cumsum(np.concatenate(counts))])
+        return starts, np.concatenate(neighbours)
+
+    # ------------------------------------------------------------------ algorithms
+    def gromos(self, neighbours: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        GROMOS clustering (Daura et al. 1999, as gmx cluster -method gromos): the frame with the most neighbours and
+        its neighbours form a cluster and are removed, until no frame is left. The centres are the medoids.
+        """
+        starts, cols = neighbours
+        counts = np.diff(starts).astype(np.int64)
+        alive = np.ones(self.n_frames, dtype=bool)
+        labels = np.full(self.n_frames, -1)
+        centres = []
+        while alive.any():
+            candidates = np.flatnonzero(alive)
+            if counts[candidates].max() == 0:
+                # Only isolated frames are left: one cluster each
+                labels[candidates] = len(centres) + np.arange(len(candidates))
+                centres.extend(candidates.tolist())
+                break
+            centre = int(candidates[np.argmax(counts[candidates])])
+            members = cols[starts[centre]:starts[centre + 1]]
+            members = np.append(members[alive[members]], centre)
+            labels[members] = len(centres)
+            centres.append(centre)
+            alive[members] = False
+            # The removed frames no longer count as neighbours of the remaining ones
+            removed = np.concatenate([cols[starts[m]:starts[m + 1]] for m in members])
+            counts -= np.bincount(removed, minlength=self.n_frames)
+        return labels, np.array(centres)
+
+    def leader(self, cutoff: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Incremental leader clustering: frames are visited in order and become a new leader when no leader is within
+        cutoff; every frame is then assigned to its nearest leader, and the medoid of each cluster is the member
+        closest to the cluster mean. Memory and time are linear in the number of frames.
+        """
+        cutoff2 = cutoff**2
+        leaders: list[int] = []
+        for start, stop in self._block_rows():
+            frames = np.arange(start, stop)
+            if leaders:
+                frames = frames[self.squared_rmsd(slice(start, stop), np.array(leaders)).min(axis=1) > cutoff2]
+            block_leaders: list[int] = []
+            for frame in frames:
+                if not block_leaders or self.squared_rmsd(slice(frame, frame + 1), np.array(block_leaders)).min() > cutoff2:
+                    block_leaders.append(int(frame))
+            leaders.extend(block_leaders)
+
+        leaders_array = np.array(leaders)
+        leader_rows = max(1, constants.CLUSTER_BLOCK_ELEMENTS // len(leaders_array))
+        bounds = [(s, min(s + leader_rows, self.n_frames)) for s in range(0, self.n_frames, leader_rows)]
+        with ThreadPoolExecutor(self.n_workers) as pool:
+            labels = np.concatenate(list(pool.map(
+                lambda b: self.squared_rmsd(slice(*b), leaders_array).argmin(axis=1), bounds)))
+
+        medoids = np.empty(len(leaders_array), dtype=int)
+        for k in range(len(leaders_array)):
+            members = np.flatnonzero(labels == k)
+            mean = self.features[members].mean(axis=0)
+            medoids[k] = members[np.argmin(((self.features[members] - mean) ** 2).sum(axis=1))]
+        return labels, medoids
+
+    def run(self, cutoff: float) -> Clustering:
+        """Cluster with a cutoff in Å; clusters are numbered by decreasing population."""
+        neighbours = None
+        if self.n_frames <= constants.CLUSTER_EXACT_MAX_FRAMES:
+            neighbours = self.neighbour_lists(cutoff, constants.CLUSTER_MAX_NEIGHBOR_PAIRS)
+        if neighbours is not None:
+            (labels, medoids), method = self.gromos(neighbours), "gromos"
+        else:
+            (labels, medoids), method = self.leader(cutoff), "leader"
+        order = np.argsort(-np.bincount(labels, minlength=len(medoids)), kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return Clustering(labels=rank[labels], medoids=medoids[order], method=method)
+
+    def rmsd_to_medoids(self, clustering: Clustering) -> np.ndarray:
+        """RMSD (Å) of every frame to the medoid of its cluster."""
+        difference = self.features - self.features[clustering.medoids[clustering.labels]]
+        return np.sqrt(np.einsum("ij,ij->i", difference, difference))
+
+
+def cluster_trajectory(sandbox_dir: str, input_xtc: str = "md.xtc", ligand_name=None,
+                       cutoff: float = constants.CLUSTER_CUTOFF, n_workers=None) -> str:
+    """
+    Cluster the PBC-corrected trajectory <name>_noPBC.xtc written by the trajectory analysis and write
+    clusters.csv (populations and medoids), clust-id.xvg (cluster of every frame) and the medoid structures
+    of the most populated clusters to clusters/cluster_NNN.pdb. Returns a short report. cutoff is in nm.
+    """
+    sandbox = Path(sandbox_dir)
+    stem = Path(input_xtc).stem
+    trajectory = sandbox / f"{stem}_noPBC.xtc"
+    if not trajectory.exists():
+        raise FileNotFoundError(f"{trajectory.name} not found: run the trajectory analysis first")
+    topology = sandbox / f"{stem}_solute.tpr"
+    if not topology.exists():
+        topology = sandbox / f"{stem}.tpr"
+
+    start = time.perf_counter()
+    universe = mda.Universe(str(topology))
+    solute = universe.select_atoms("protein")
+    ligand = universe.select_atoms(f"resname {ligand_name}") if ligand_name else universe.atoms[[]]
+    solute = solute | ligand
+    cache = TrajectoryCache(trajectory)
+    coordinates = cache.coordinates(solute.ix)
+    if coordinates is None:
+        logger.info(f"Caching the protein(+ligand) coordinates of {trajectory.name}")
+        coordinates = cache.build_coordinates(solute.ix)
+    times = cache.times()
+
+    calpha = solute.select_atoms(C_ALPHA)
+    ligand_heavy = ligand[~_is_element(ligand, "H")] if len(ligand) else ligand
+    fit_atoms = np.flatnonzero(np.isin(solute.ix, calpha.ix))
+    rmsd_atoms = np.flatnonzero(np.isin(solute.ix, calpha.ix) | np.isin(solute.ix, ligand_heavy.ix))
+    clustering_run = TrajectoryClustering(coordinates, fit_atoms, rmsd_atoms, n_workers=n_workers)
+    clustering = clustering_run.run(cutoff * 10)
+    rmsd = clustering_run.rmsd_to_medoids(clustering) / 10
+    sizes = clustering.sizes
+
+    # Medoid structures of the most populated clusters
+    pdb_dir = sandbox / "clusters"
+    pdb_dir.mkdir(exist_ok=True)
+    universe.load_new(np.zeros((1, len(universe.atoms), 3), dtype=np.float32), format=MemoryReader)
+    structure = mda.Merge(solute)
+    pdb_files = {}
+    for k, medoid in enumerate(clustering.medoids[:constants.CLUSTER_PDB_COUNT]):
+        structure.atoms.positions = coordinates[medoid]
+        pdb_files[k] = pdb_dir / f"cluster_{k + 1:03d}.pdb"
+        structure.atoms.write(str(pdb_files[k]))
+
+    csv_path = sandbox / "clusters.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cluster", "size", "fraction", "medoid_frame", "medoid_time_ps", "mean_rmsd_nm", "max_rmsd_nm", "medoid_pdb"])
+        for k, medoid in enumerate(clustering.medoids):
+            members = clustering.labels == k
+            writer.writerow([k + 1, sizes[k], f"{sizes[k] / clustering_run.n_frames:.4f}",
+                             medoid, f"{times[medoid]:.3f}", f"{rmsd[members].mean():.4f}", f"{rmsd[members].max():.4f}",
+                             pdb_files[k].relative_to(sandbox) if k in pdb_files else ""])
+    xvg_path = sandbox / "clust-id.xvg"
+    write_xvg(xvg_path, times / 1000, clustering.labels + 1, "Cluster index", "Time (ns)", "Cluster")
+
+    selection = "Cα" + (f" + {ligand_name} heavy atoms" if len(ligand) else "")
+    lines = [f"Clustered {clustering_run.n_frames} frames of {trajectory.name} ({selection}, fit on Cα, cutoff {cutoff} nm, "
+             f"{clustering.method} method) into {len(sizes)} clusters in {time.perf_counter() - start:.1f} s.",
+             "  RMSDs are computed after fitting every frame to the average structure: an upper bound on the "
+             "pairwise-fitted RMSD of gmx cluster, so clusters are somewhat tighter at the same cutoff."]
+    for k in range(min(5, len(sizes))):
+        lines.append(f"  Cluster {k + 1}: {sizes[k]} frames ({sizes[k] / clustering_run.n_frames:.0%}), medoid at "
+                     f"{times[clustering.medoids[k]]:.0f} ps, mean RMSD to medoid {rmsd[clustering.labels == k].mean():.3f} nm")
+    lines.append(f"Files written: {csv_path.name}, {xvg_path.name}, "
+                 f"{len(pdb_files)} medoid structure(s) in {pdb_dir.name}/")
+    return "\n".join(lines)
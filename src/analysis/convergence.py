@@ -0,0 +1,161 @@
+"""
+Convergence of the production run: block averages, autocorrelation times and effective sample sizes of the
+observables of the streamed analysis (backbone RMSD, radius of gyration, ligand contacts and, when stored,
+the potential energy).
+
+For each observable, the initial transient is detected as the start that maximizes the number of uncorrelated
+samples in the rest of the run (Chodera, JCTC 2016). The statistical inefficiency g = 1 + 2 Σ (1 - t/N) C(t) of the
+remaining frames (autocorrelation from an FFT, summed up to its first zero crossing) gives the autocorrelation time
+and the effective sample size N/g, and the standard error of the mean is checked against Flyvbjerg–Petersen block
+averaging. An observable is converged when it has enough effective samples, its transient takes at most half the run
+and the means of the two halves of the equilibrated part agree within their errors; otherwise the production length
+that would satisfy these criteria is recommended.
+"""
+import csv
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+from src import constants
+from src.analysis.results import Series
+
+OBSERVABLES = ("rmsd", "gyrate", "ligand_contacts", "potential")
+EQUILIBRATION_CANDIDATES = 50  # transient lengths tried, evenly spaced over the first three quarters of the run
+MIN_BLOCKS = 8  # fewest blocks for a block-averaging error estimate
+CONVERGENCE_FILE = "convergence.csv"
+
+
+def autocorrelation(y: np.ndarray) -> np.ndarray:
+    """Normalized autocorrelation function of y for lags 0..N-1, from a zero-padded FFT."""
+    n = len(y)
+    d = y - y.mean()
+    spectrum = np.fft.rfft(d, 2 * n)
+    acf = np.fft.irfft(spectrum * spectrum.conj(), 2 * n)[:n]
+    return acf / acf[0] if acf[0] > 0 else np.zeros(n)
+
+
+def statistical_inefficiency(y: np.ndarray) -> float:
+    """g = 1 + 2 Σ (1 - t/N) C(t), summed until C(t) first drops to zero; 1 for uncorrelated or constant data."""
+    n = len(y)
+    if n < 3:
+        return 1.0
+    acf = autocorrelation(np.asarray(y, dtype=float))[1:]
+    if not acf.any():
+        return 1.0
+    cut = np.flatnonzero(acf <= 0)
+    lags = np.arange(1, (cut[0] if len(cut) else n - 1) + 1)
+    return max(1.0, 1.0 + 2.0 * float(np.sum((1 - lags / n) * acf[:len(lags)])))
+
+
+def detect_equilibration(y: np.ndarray) -> tuple[int, float, float]:
+    """First frame of the equilibrated part, with its statistical inefficiency and effective sample size."""
+    n = len(y)
+    best = (0, 1.0, 0.0)
+    for t0 in np.unique(np.linspace(0, 3 * n // 4, EQUILIBRATION_CANDIDATES).astype(int)):
+        g = statistical_inefficiency(y[t0:])
+        n_effective = (n - t0) / g
+        if n_effective > best[2]:
+            best = (int(t0), g, n_effective)
+    return best
+
+
+def blocking_sem(y: np.ndarray) -> float:
+    """Flyvbjerg–Petersen block-averaging standard error: largest estimate over blockings with MIN_BLOCKS blocks or more."""
+    sems = []
+    blocks = np.asarray(y, dtype=float)
+    while len(blocks) >= MIN_BLOCKS:
+        sems.append(blocks.std(ddof=1) / math.sqrt(len(blocks)))
+        blocks = blocks[:len(blocks) // 2 * 2].reshape(-1, 2).mean(axis=1)
+    return max(sems) if sems else float("nan")
+
+
+@dataclass
+class Convergence:
+    """Convergence of one observable; times in ns."""
+    name: str
+    unit: str
+    duration: float
+    equilibration_time: float
+    mean: float
+    sem: float
+    block_sem: float
+    autocorrelation_time: float
+    n_effective: float
+    half_means: tuple[float, float]
+    reasons: list[str] = field(default_factory=list)
+    required_duration: float = 0.0
+
+    @property
+    def converged(self) -> bool:
+        return not self.reasons
+
+
+def assess(name: str, series: Series, min_effective: int = constants.CONVERGENCE_MIN_SAMPLES) -> Convergence:
+    """Convergence of the first column of a time series (x in ns)."""
+    x, y = np.asarray(series.x, dtype=float), series.values[0]
+    n = len(y)
+    dt = float(np.median(np.diff(x))) if n > 1 else 0.0
+    duration = x[-1] - x[0] + dt if n else 0.0
+    t0, g, n_effective = detect_equilibration(y)
+    equilibrated = y[t0:]
+    sem = equilibrated.std() * math.sqrt(g / len(equilibrated))
+
+    half = len(equilibrated) // 2
+    first, second = equilibrated[:half], equilibrated[half:]
+    half_means = (float(first.mean()), float(second.mean())) if half else (float(y.mean()),) * 2
+    half_error = math.hypot(*(h.std() * math.sqrt(statistical_inefficiency(h) / len(h)) for h in (first, second))) if half else 0.0
+
+    result = Convergence(name, series.unit, duration, t0 * dt, float(equilibrated.mean()), sem, blocking_sem(equilibrated),
+                         (g - 1) / 2 * dt, n_effective, half_means)
+    required = duration
+    if n_effective < min_effective:
+        result.reasons.append(f"{n_effective:.0f} effective samples (< {min_effective})")
+        required = max(required, t0 * dt + min_effective * g * dt)
+    if t0 > n * constants.CONVERGENCE_MAX_EQUILIBRATION_FRACTION:
+        result.reasons.append(f"still relaxing for the first {t0 * dt:.3g} ns")
+        required = max(required, 2 * duration)
+    if abs(half_means[1] - half_means[0]) > 2 * half_error:
+        result.reasons.append(f"halves differ ({half_means[0]:.3g} vs {half_means[1]:.3g})")
+        required = max(required, 2 * duration)
+    result.required_duration = required
+    return result
+
+
+def assess_run(series: dict[str, Series], observables=OBSERVABLES) -> list[Convergence]:
+    """Convergence of the observables present in series (with at least MIN_BLOCKS frames)."""
+    return [assess(name, series[name]) for name in observables
+            if name in series and series[name].kind == "time" and len(series[name].x) >= MIN_BLOCKS]
+
+
+def convergence_report(results: list[Convergence]) -> list[str]:
+    """Report lines: one per observable, then the verdict and the recommended extension of the production run."""
+    if not results:
+        return ["Convergence: not enough frames to assess the convergence of the run."]
+    lines = ["Convergence (equilibrated part of the run; tau = autocorrelation time, N_eff = effective samples):"]
+    for r in results:
+        unit = f" {r.unit}" if r.unit else ""
+        lines.append(f"  {r.name}: mean {r.mean:.3g} ± {r.sem:.2g}{unit} (block averaging ± {r.block_sem:.2g}), "
+                     f"transient {r.equilibration_time:.3g} ns, tau {r.autocorrelation_time:.3g} ns, N_eff {r.n_effective:.0f}"
+                     + (" - converged" if r.converged else f" - NOT converged: {'; '.join(r.reasons)}"))
+    duration = max(r.duration for r in results)
+    required = max(r.required_duration for r in results)
+    if required <= duration:
+        lines.append(f"The {duration:.3g} ns run is long enough for these observables.")
+    else:
+        extension = math.ceil((required - duration) * 10) / 10
+        lines.append(f"The {duration:.3g} ns run is too short: extend the production by at least {extension:.3g} ns "
+                     f"(md_duration of about {duration + extension:.3g} ns).")
+    return lines
+
+
+def write_convergence(results: list[Convergence], path: str | Path) -> Path:
+    """convergence.csv: one row per observable."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["observable", "unit", "mean", "sem", "block_sem", "equilibration_time_ns", "autocorrelation_time_ns",
+                         "n_effective", "first_half_mean", "second_half_mean", "converged", "required_duration_ns"])
+        for r in results:
+            writer.writerow([r.name, r.unit, f"{r.mean:.6g}", f"{r.sem:.6g}", f"{r.block_sem:.6g}", f"{r.equilibration_time:.6g}",
+                             f"{r.autocorrelation_time:.6g}", f"{r.n_effective:.1f}", f"{r.half_means[0]:.6g}",
+                             f"{r.half_means[1]:.6g}", r.converged, f"{r.required_duration:.6g}"])
+    return Path(path)
@@ -0,0 +1,545 @@
+"""
+Single-pass trajectory analysis replacing the chain of gmx trjconv/rms/rmsf/gyrate/hbond calls.
+Each frame is decoded once, made whole and centred (as trjconv -pbc mol -center -ur compact), written to <name>_noPBC.xtc
+and fed to accumulators whose results are written to the same .xvg files the GROMACS tools produced.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+import MDAnalysis as mda  # type: ignore
+from MDAnalysis.coordinates.memory import MemoryReader  # type: ignore
+from MDAnalysis.lib.mdamath import make_whole, triclinic_vectors  # type: ignore
+from MDAnalysis.analysis.align import rotation_matrix  # type: ignore
+from MDAnalysis.lib.distances import calc_angles, capped_distance  # type: ignore
+from src import constants
+from src.analysis.results import Series
+from src.analysis.xvg import write_xvg
+
+# GROMACS default index groups, with Amber atom names
+BACKBONE = "protein and name N CA C"
+C_ALPHA = "protein and name CA"
+MAINCHAIN_H = "protein and name N CA C O OXT OC1 OC2 H H1 H2 H3 HN"
+SIDECHAIN = "protein and not name N CA C O OXT OC1 OC2 H H1 H2 H3 HN"
+WATER = "resname WAT HOH SOL"
+
+# The incremental PCA retains more modes than it reports, so that the reported ones are not biased by the truncation
+PCA_RETAINED_FACTOR = 10
+PCA_EXTREME_FRAMES = 10  # structures interpolated between the extreme projections on a mode
+PCA_EXTREME_MODES = 3
+
+# Translations (in box vectors) to the 27 cells around and including the unit cell, for the compact-cell wrapping
+_CELL_TRANSLATIONS = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=float)
+
+# gmx hbond geometric criteria
+HBOND_DISTANCE = 3.5  # Å, donor-acceptor
+HBOND_ANGLE = 30.0  # degrees, hydrogen-donor-acceptor
+
+
+def _kabsch(mobile: np.ndarray, reference: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, float]:
+    """Mass-weighted least-squares fit of mobile onto the centred reference; returns the fitted coordinates and the RMSD."""
+    mobile = mobile - np.average(mobile, axis=0, weights=weights)
+    rotation, rmsd = rotation_matrix(mobile, reference, weights=weights)
+    return mobile @ rotation.T, rmsd
+
+
+def _centred(positions: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    return positions - np.average(positions, axis=0, weights=weights)
+
+
+class TimeSeries:
+    """Per-frame values kept with their frame indices, so that blocks of frames can be merged in any order."""
+
+    def __init__(self):
+        self.frames: list[int] = []
+        self.times: list[float] = []
+        self.values: list = []
+
+    def update(self, frame: int, time: float, value) -> None:
+        self.frames.append(frame)
+        self.times.append(time)
+        self.values.append(value)
+
+    def merge(self, other: "TimeSeries") -> "TimeSeries":
+        self.frames.extend(other.frames)
+        self.times.extend(other.times)
+        self.values.extend(other.values)
+        return self
+
+    def results(self) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(np.asarray(self.frames), kind="stable")
+        return np.asarray(self.times)[order], np.asarray(self.values, dtype=float)[order]
+
+
+class PositionFluctuation:
+    """Streaming per-atom mean and variance of positions (Welford), mergeable with Chan's parallel formula."""
+
+    def __init__(self, n_atoms: int):
+        self.count = 0
+        self.mean = np.zeros((n_atoms, 3))
+        self.m2 = np.zeros((n_atoms, 3))
+
+    def update(self, positions: np.ndarray) -> None:
+        self.count += 1
+        delta = positions - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (positions - self.mean)
+
+    def merge(self, other: "PositionFluctuation") -> "PositionFluctuation":
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / total)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.count * other.count / total)
+        self.count = total
+        return self
+
+    def results(self) -> np.ndarray:
+        """Root mean square fluctuation of each atom (same units as the positions)."""
+        return np.sqrt(self.m2.sum(axis=1) / max(self.count, 1))
+
+
+class IncrementalPCA:
+    """
+    Streaming principal component analysis of flattened coordinates (incremental SVD, as scikit-learn's
+    IncrementalPCA). Frames are buffered in batches of batch_size and each batch is folded into the retained
+    singular vectors, so memory does not depend on the number of frames; states of different blocks of frames
+    are combined with merge(). The total variance is tracked exactly, including the truncated modes.
+    """
+
+    def __init__(self, n_features: int, n_components: int, batch_size: int):
+        self.n_components, self.batch_size = n_components, batch_size
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.basis = np.zeros((0, n_features))  # singular values x right singular vectors, one row per mode
+        self.sum_of_squares = 0.0
+        self.buffer: list[np.ndarray] = []
+        self.reference: np.ndarray | None = None  # fit reference of the coordinates, for projections
+
+    def update(self, values: np.ndarray) -> None:
+        self.buffer.append(np.asarray(values, dtype=float).ravel())
+        if len(self.buffer) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.buffer:
+            return
+        rows = np.array(self.buffer)
+        self.buffer = []
+        mean = rows.mean(axis=0)
+        centred = rows - mean
+        self._combine(len(rows), mean, centred, float((centred**2).sum()))
+
+    def _combine(self, count: int, mean: np.ndarray, basis: np.ndarray, sum_of_squares: float) -> None:
+        total = self.count + count
+        correction = np.sqrt(self.count * count / total) * (self.mean - mean)
+        _, singular, vt = np.linalg.svd(np.vstack([self.basis, basis, correction]), full_matrices=False)
+        k = min(self.n_components, len(singular))
+        self.basis = singular[:k, None] * vt[:k]
+        self.sum_of_squares += sum_of_squares + float(correction @ correction)
+        self.mean = self.mean + (mean - self.mean) * (count / total)
+        self.count = total
+
+    def merge(self, other: "IncrementalPCA") -> "IncrementalPCA":
+        self._flush()
+        other._flush()
+        if other.count:
+            self._combine(other.count, other.mean, other.basis, other.sum_of_squares)
+        if self.reference is None:
+            self.reference = other.reference
+        return self
+
+    def results(self) -> tuple[np.ndarray, np.ndarray, float]:
+        """Eigenvalues, unit eigenvectors (one row per mode, largest component positive) and total variance."""
+        self._flush()
+        singular = np.linalg.norm(self.basis, axis=1)
+        components = self.basis / np.where(singular > 0, singular, 1)[:, None]
+        signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+        components *= np.where(signs == 0, 1, signs)[:, None]
+        dof = max(self.count - 1, 1)
+        return singular**2 / dof, components, self.sum_of_squares / dof
+
+
+def _kabsch_batch(mobile: np.ndarray, reference: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Mass-weighted fit of a batch of frames (frames, atoms, 3) onto the centred reference, as _kabsch."""
+    mobile = mobile - np.einsum("fni,n->fi", mobile, weights / weights.sum())[:, None]
+    h = np.einsum("fni,n,nj->fij", mobile, weights, reference)
+    u, _, vt = np.linalg.svd(h)
+    u[:, :, -1] *= np.sign(np.linalg.det(u @ vt))[:, None]
+    return mobile @ (u @ vt)
+
+
+def _is_element(atoms, symbol: str) -> np.ndarray:
+    if hasattr(atoms, "elements") and any(atoms.elements):
+        return np.array([e.capitalize() == symbol for e in atoms.elements])
+    # Fall back on names, ignoring ions such as Na+
+    return np.array([n.upper().startswith(symbol.upper()) and n[-1] not in "+-" for n in atoms.names])
+
+
+def donor_hydrogen_pairs(atoms) -> tuple[np.ndarray, np.ndarray]:
+    """Indices (ix) of the N/O donors and of their hydrogens, one entry per hydrogen."""
+    universe = atoms.universe
+    polar = _is_element(universe.atoms, "N") | _is_element(universe.atoms, "O")
+    hydrogen = _is_element(universe.atoms, "H")
+    has_bonds = hasattr(universe, "bonds") and len(universe.bonds) > 0
+
+    donors, hydrogens = [], []
+    for h in atoms[hydrogen[atoms.ix]]:
+        if has_bonds:
+            heavy = [a for a in h.bonded_atoms if polar[a.ix]]
+        else:
+            # Amber/GROMACS atom order: a hydrogen follows the heavy atom it is bonded to
+            previous = [a for a in h.residue.atoms if a.ix < h.ix and not hydrogen[a.ix]]
+            heavy = [previous[-1]] if previous and polar[previous[-1].ix] else []
+        if heavy:
+            donors.append(heavy[0].ix)
+            hydrogens.append(h.ix)
+    return np.array(donors, dtype=int), np.array(hydrogens, dtype=int)
+
+
+class HydrogenBondCounter:
+    """
+    Hydrogen bonds between two atom groups with the gmx hbond criteria (donor-acceptor distance and
+    hydrogen-donor-acceptor angle). Donors are N/O bonded to a hydrogen, acceptors are all N/O atoms.
+    """
+
+    def __init__(self, universe, group_a, group_b):
+        atoms = universe.atoms
+        donors, hydrogens = donor_hydrogen_pairs(atoms)
+        acceptors = np.flatnonzero(_is_element(atoms, "N") | _is_element(atoms, "O"))
+
+        in_a = np.zeros(len(atoms), dtype=bool)
+        in_a[group_a.ix] = True
+        in_b = np.zeros(len(atoms), dtype=bool)
+        in_b[group_b.ix] = True
+        # Directed searches: donors of one group against acceptors of the other
+        self.searches = [self._search(donors[in_a[donors]], hydrogens[in_a[donors]], acceptors[in_b[acceptors]])]
+        if not np.array_equal(in_a, in_b):
+            self.searches.append(self._search(donors[in_b[donors]], hydrogens[in_b[donors]], acceptors[in_a[acceptors]]))
+
+    @staticmethod
+    def _search(donors: np.ndarray, hydrogens: np.ndarray, acceptors: np.ndarray) -> tuple:
+        """
+        Distances are searched between unique donor heavy atoms and acceptors, then each pair is expanded to the
+        hydrogens of its donor, so that water donors (two hydrogens each) are not searched twice.
+        """
+        heavy, inverse = np.unique(donors, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        counts = np.bincount(inverse, minlength=len(heavy))
+        starts = np.cumsum(counts) - counts
+        return heavy, hydrogens[order], starts, counts, acceptors
+
+    def count(self, positions: np.ndarray, box) -> tuple[int, int]:
+        """Number of hydrogen bonds and of donor-acceptor pairs within HBOND_DISTANCE in one frame."""
+        n_hbonds = n_pairs = 0
+        for heavy, hydrogens, starts, counts, acceptors in self.searches:
+            if len(heavy) == 0 or len(acceptors) == 0:
+                continue
+            pairs = capped_distance(positions[acceptors], positions[heavy], HBOND_DISTANCE, box=box, return_distances=False)
+            a, d = pairs[:, 0], pairs[:, 1]
+            keep = heavy[d] != acceptors[a]
+            a, d = a[keep], d[keep]
+            n_pairs += len(d)
+            # One (donor, hydrogen, acceptor) triplet per hydrogen of each donor
+            n_h = counts[d]
+            offsets = np.arange(n_h.sum()) - np.repeat(np.cumsum(n_h) - n_h, n_h)
+            h = hydrogens[np.repeat(starts[d], n_h) + offsets]
+            d, a = heavy[np.repeat(d, n_h)], acceptors[np.repeat(a, n_h)]
+            angles = np.degrees(calc_angles(positions[h], positions[d], positions[a], box=box))
+            n_hbonds += int(np.count_nonzero(angles <= HBOND_ANGLE))
+        return n_hbonds, n_pairs
+
+
+@dataclass
+class AnalysisState:
+    """Accumulators of one block of frames; states of different blocks are combined with merge()."""
+
+    rmsd: TimeSeries = field(default_factory=TimeSeries)
+    rmsd_xtal: TimeSeries = field(default_factory=TimeSeries)
+    gyrate: TimeSeries = field(default_factory=TimeSeries)
+    rmsf: PositionFluctuation | None = None
+    pca: IncrementalPCA | None = None
+    hbonds: dict[str, TimeSeries] = field(default_factory=dict)
+
+    def merge(self, other: "AnalysisState") -> "AnalysisState":
+        self.rmsd.merge(other.rmsd)
+        self.rmsd_xtal.merge(other.rmsd_xtal)
+        self.gyrate.merge(other.gyrate)
+        if self.rmsf is None:
+            self.rmsf = other.rmsf
+        elif other.rmsf is not None:
+            self.rmsf.merge(other.rmsf)
+        if self.pca is None:
+            self.pca = other.pca
+        elif other.pca is not None:
+            self.pca.merge(other.pca)
+        for name, series in other.hbonds.items():
+            self.hbonds.setdefault(name, TimeSeries()).merge(series)
+        return self
+
+
+class TrajectoryAnalysis:
+    """
+    Backbone RMSD (to the first frame, as md.tpr, and to the minimized structure, as em.tpr), per-residue Cα RMSF,
+    radius of gyration and hydrogen-bond counts computed in a single streaming read of the trajectory.
+
+    Args:
+        topology: run input with bonds, e.g. md.tpr (md_solute.tpr for a solute-only trajectory).
+        trajectory: md.xtc, or None to feed frames one by one with feed() (on-the-fly analysis).
+        reference: optional (topology, coordinates) of the reference structure for rmsd_xtal, e.g. (em.tpr, em.gro).
+        ligand_name: residue name of the ligand, if any.
+    """
+
+    def __init__(self, topology, trajectory, reference=None, ligand_name=None):
+        self.topology, self.trajectory, self.reference, self.ligand_name = topology, trajectory, reference, ligand_name
+        if trajectory is not None:
+            self.universe = u = mda.Universe(str(topology), str(trajectory))
+        else:
+            self.universe = u = mda.Universe(str(topology))
+            u.load_new(np.zeros((1, u.atoms.n_atoms, 3), dtype=np.float32), format=MemoryReader)
+
+        self.protein = u.select_atoms("protein")
+        self.ligand = u.select_atoms(f"resname {ligand_name}") if ligand_name else u.atoms[[]]
+        self.solute = solute = self.protein | self.ligand
+        has_bonds = hasattr(u, "bonds") and len(u.bonds) > 0
+        # Without bonds (e.g. a .gro topology) the solute is assumed whole
+        self.solute_fragments = [f for f in solute.fragments] if has_bonds and len(solute) else []
+        rest = u.atoms - self.protein
+        self.rest_residue_starts = np.flatnonzero(np.diff(rest.resindices, prepend=-1)) if len(rest) else None
+        self.rest = rest
+
+        self.backbone = u.select_atoms(BACKBONE)
+        self.calpha = u.select_atoms(C_ALPHA)
+        self.water = u.select_atoms(WATER)
+
+        self.backbone_reference = self.calpha_reference = None
+        if trajectory is not None:
+            self._remove_pbc(u.trajectory[0])
+            self._set_references()
+        self.xtal_reference = self._reference_backbone()
+
+        self.hbond_groups = {
+            "mainchain": (u.select_atoms(MAINCHAIN_H), u.select_atoms(MAINCHAIN_H)),
+            "sidechain": (u.select_atoms(SIDECHAIN), u.select_atoms(SIDECHAIN)),
+        }
+        if len(self.water):
+            self.hbond_groups["prot_wat"] = (self.protein, self.water)
+        if len(self.ligand):
+            self.hbond_groups["prot_lig"] = (self.protein, self.ligand)
+        self.hbond_counters = {name: HydrogenBondCounter(u, a, b) for name, (a, b) in self.hbond_groups.items()}
+
+    def _set_references(self) -> None:
+        """Reference for rmsd.xvg / rmsf.xvg: the current (first) frame, i.e. the md.tpr starting structure."""
+        self.backbone_reference = _centred(self.backbone.positions.astype(float), self.backbone.masses)
+        self.calpha_reference = _centred(self.calpha.positions.astype(float), self.calpha.masses)
+
+    def _reference_backbone(self) -> np.ndarray | None:
+        if self.reference is None:
+            return None
+        ref = mda.Universe(*(str(p) for p in self.reference))
+        ref_backbone = ref.select_atoms(BACKBONE)
+        if len(ref_backbone) != len(self.backbone):
+            return None
+        if hasattr(ref, "bonds") and len(ref.bonds):
+            ref.select_atoms("protein").unwrap(compound="fragments")
+        return _centred(ref_backbone.positions.astype(float), ref_backbone.masses)
+
+    def _remove_pbc(self, ts) -> None:
+        """
+        As trjconv -pbc mol -center -ur compact: make the solute molecules whole, put the protein centre in the box
+        centre and move every other residue (by its centre) to its periodic image closest to the box centre, i.e.
+        into the compact (Wigner-Seitz) cell, the truncated octahedron for tleap's solvateoct boxes. All in place on ts.
+        """
+        for fragment in self.solute_fragments:
+            make_whole(fragment)
+        if ts.dimensions is None:
+            return
+        box = triclinic_vectors(ts.dimensions)
+        positions = self.universe.atoms.positions
+        positions += box.sum(axis=0) / 2 - self.protein.positions.mean(axis=0)
+        if self.rest_residue_starts is not None:
+            rest = positions[self.rest.ix]
+            counts = np.diff(np.append(self.rest_residue_starts, len(rest)))
+            centres = np.add.reduceat(rest, self.rest_residue_starts, axis=0) / counts[:, None]
+            shifts = np.floor(centres @ np.linalg.inv(box)) @ box
+            # From the unit cell, the closest image to the centre is among the 27 neighbouring cell translations
+            offsets = centres - shifts - box.sum(axis=0) / 2
+            distances = np.linalg.norm(offsets[:, None, :] + _CELL_TRANSLATIONS @ box, axis=2)
+            shifts -= _CELL_TRANSLATIONS[distances.argmin(axis=1)] @ box
+            positions[self.rest.ix] = rest - np.repeat(shifts, counts, axis=0)
+        self.universe.atoms.positions = positions
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.universe.trajectory)
+
+    def new_state(self) -> AnalysisState:
+        n_components = min(3 * len(self.backbone), PCA_RETAINED_FACTOR * constants.PCA_COMPONENTS)
+        return AnalysisState(rmsf=PositionFluctuation(len(self.calpha)),
+                             pca=IncrementalPCA(3 * len(self.backbone), n_components, constants.PCA_BATCH_FRAMES),
+                             hbonds={name: TimeSeries() for name in self.hbond_counters})
+
+    def run(self, start: int = 0, stop: int | None = None, output_xtc=None, coordinates=None) -> AnalysisState:
+        """
+        Analyse frames [start, stop), optionally writing the PBC-corrected frames to output_xtc and
+        the solute coordinates to the rows [start, stop) of coordinates (e.g. a TrajectoryCache memmap).
+        """
+        state = self.new_state()
+        writer = mda.Writer(str(output_xtc), n_atoms=self.universe.atoms.n_atoms) if output_xtc else None
+        try:
+            for ts in self.universe.trajectory[start:stop]:
+                self._remove_pbc(ts)
+                if writer is not None:
+                    writer.write(self.universe.atoms)
+                if coordinates is not None:
+                    coordinates[ts.frame] = self.solute.positions
+                self._analyse_frame(state, ts)
+        finally:
+            if writer is not None:
+                writer.close()
+        return state
+
+    def feed(self, state: AnalysisState, frame: int, time: float, positions: np.ndarray, dimensions, step: int | None = None,
+             writer=None):
+        """
+        Analyse one frame given as raw positions (Å) and box dimensions, for trajectories read outside MDAnalysis
+        (trajectory=None). The first frame fed becomes the RMSD/RMSF reference. Returns the PBC-corrected timestep.
+        """
+        ts = self.universe.trajectory.ts
+        ts.positions = positions
+        ts.dimensions = dimensions
+        ts.frame, ts.time = frame, time
+        ts.data["step"] = frame if step is None else step
+        self._remove_pbc(ts)
+        if self.backbone_reference is None:
+            self._set_references()
+        if writer is not None:
+            writer.write(self.universe.atoms)
+        self._analyse_frame(state, ts)
+        return ts
+
+    def _analyse_frame(self, state: AnalysisState, ts) -> None:
+        frame, time = ts.frame, ts.time
+        fitted, rmsd = _kabsch(self.backbone.positions.astype(float), self.backbone_reference, self.backbone.masses)
+        state.rmsd.update(frame, time, rmsd)
+        # Essential dynamics on the backbone fitted for the RMSD
+        state.pca.update(fitted)
+        if state.pca.reference is None:
+            state.pca.reference = self.backbone_reference
+        if self.xtal_reference is not None:
+            _, rmsd = _kabsch(self.backbone.positions.astype(float), self.xtal_reference, self.backbone.masses)
+            state.rmsd_xtal.update(frame, time, rmsd)
+
+        fitted, _ = _kabsch(self.calpha.positions.astype(float), self.calpha_reference, self.calpha.masses)
+        state.rmsf.update(fitted)
+
+        masses = self.protein.masses
+        d = self.protein.positions - np.average(self.protein.positions, axis=0, weights=masses)
+        d2 = d**2
+        total = masses.sum()
+        rg = np.sqrt(np.dot(masses, d2.sum(axis=1)) / total)
+        rg_axes = np.sqrt(np.dot(masses, d2.sum(axis=1, keepdims=True) - d2) / total)
+        state.gyrate.update(frame, time, [rg, *rg_axes])
+
+        positions = self.universe.atoms.positions
+        for name, counter in self.hbond_counters.items():
+            state.hbonds[name].update(frame, time, counter.count(positions, ts.dimensions))
+
+    def write_outputs(self, state: AnalysisState, output_dir) -> list[Path]:
+        """Write rmsd.xvg, rmsd_xtal.xvg, rmsf.xvg, gyrate.xvg and hbnum_*.xvg (lengths in nm) to output_dir."""
+        output_dir = Path(output_dir)
+        written = []
+
+        def write(name, *args, **kwargs):
+            write_xvg(output_dir / name, *args, **kwargs)
+            written.append(output_dir / name)
+
+        for name, series in (("rmsd.xvg", state.rmsd), ("rmsd_xtal.xvg", state.rmsd_xtal)):
+            if series.frames:
+                times, values = series.results()
+                write(name, times / 1000, values / 10, "RMSD", "Time (ns)", "RMSD (nm)")
+
+        write("rmsf.xvg", self.calpha.resids, state.rmsf.results() / 10, "RMS fluctuation", "Residue", "(nm)")
+
+        times, values = state.gyrate.results()
+        write("gyrate.xvg", times, values.T / 10, "Radius of gyration (total and around axes)", "Time (ps)", "Rg (nm)",
+              legends=["Rg", "Rg\\sX\\N", "Rg\\sY\\N", "Rg\\sZ\\N"])
+
+        for name, series in state.hbonds.items():
+            times, values = series.results()
+            write(f"hbnum_{name}.xvg", times / 1000, values.T, "Hydrogen Bonds", "Time (ns)", "Number",
+                  legends=["Hydrogen bonds", f"Pairs within {HBOND_DISTANCE / 10:g} nm"])
+        return written
+
+    def series(self, state: AnalysisState) -> dict[str, Series]:
+        """The results of write_outputs() as results-store series (src.analysis.results), in ns and nm."""
+        series = {}
+        for name, ts in (("rmsd", state.rmsd), ("rmsd_xtal", state.rmsd_xtal)):
+            if ts.frames:
+                times, values = ts.results()
+                series[name] = Series(times / 1000, values / 10, unit="nm", columns=["backbone RMSD"])
+        series["rmsf"] = Series(self.calpha.resids, state.rmsf.results() / 10, kind="residue", unit="nm",
+                                columns=["C-alpha RMSF"])
+        times, values = state.gyrate.results()
+        series["gyrate"] = Series(times / 1000, values.T / 10, unit="nm", columns=["Rg", "Rg_x", "Rg_y", "Rg_z"])
+        for name, ts in state.hbonds.items():
+            times, values = ts.results()
+            series[f"hbnum_{name}"] = Series(times / 1000, values.T, columns=["hydrogen bonds", "pairs within cutoff"])
+        if state.pca is not None and state.pca.count > 1:
+            eigenvalues, _, total_variance = state.pca.results()
+            series["pca_variance"] = Series(np.arange(1, len(eigenvalues) + 1), 100 * eigenvalues / total_variance,
+                                            kind="index", unit="%", columns=["variance of each backbone mode"])
+        return series
+
+    def pca_projections(self, state: AnalysisState, coordinates) -> np.ndarray:
+        """
+        (frames, PCA_COMPONENTS) projections of the backbone on the essential modes, from the solute coordinates of
+        every frame (e.g. the TrajectoryCache memmap of the PBC-corrected trajectory), read in fixed-size batches and
+        fitted on the reference of the PCA (the RMSD reference).
+        """
+        _, components, _ = state.pca.results()
+        components = components[:constants.PCA_COMPONENTS]
+        backbone = np.searchsorted(self.solute.ix, self.backbone.ix)
+        masses = self.backbone.masses
+        batch = constants.PCA_BATCH_FRAMES
+        projections = np.empty((len(coordinates), len(components)))
+        for start in range(0, len(coordinates), batch):
+            block = np.asarray(coordinates[start:start + batch, backbone], dtype=float)
+            fitted = _kabsch_batch(block, state.pca.reference, masses).reshape(len(block), -1)
+            projections[start:start + len(block)] = (fitted - state.pca.mean) @ components.T
+        return projections
+
+    def write_essential_dynamics(self, state: AnalysisState, coordinates, times, output_dir) -> list[Path]:
+        """
+        As gmx covar + gmx anaeig on the backbone: eigenval.xvg (nm²), proj.xvg (projections on the first
+        PCA_COMPONENTS modes, nm), pca.npz (mean structure, modes, eigenvalues and projections) and
+        pca_extreme_pc<k>.pdb (structures interpolated between the extreme projections on the first modes, as -extr).
+        """
+        output_dir = Path(output_dir)
+        eigenvalues, components, total_variance = state.pca.results()
+        projections = self.pca_projections(state, coordinates)
+        times = np.asarray(times, dtype=float)
+        n_components = projections.shape[1]
+        written = [output_dir / name for name in ("eigenval.xvg", "proj.xvg", "pca.npz")]
+
+        write_xvg(written[0], np.arange(1, len(eigenvalues) + 1), eigenvalues / 100, "Eigenvalues of the covariance matrix",
+                  "Eigenvector index", "(nm\\S2\\N)")
+        write_xvg(written[1], times / 1000, projections.T / 10, "Projection on the eigenvectors", "Time (ns)", "(nm)",
+                  legends=[f"PC{k + 1}" for k in range(n_components)])
+        np.savez_compressed(written[2], eigenvalues=eigenvalues / 100, total_variance=total_variance / 100,
+                            mean=state.pca.mean.reshape(-1, 3) / 10, modes=components[:n_components].reshape(n_components, -1, 3),
+                            projections=projections / 10, times=times, resids=self.backbone.resids,
+                            names=self.backbone.names.astype(str))
+
+        structure = mda.Merge(self.backbone)
+        structure.load_new(np.zeros((PCA_EXTREME_FRAMES, len(self.backbone), 3), dtype=np.float32), format=MemoryReader)
+        for k in range(min(PCA_EXTREME_MODES, n_components)):
+            amplitudes = np.linspace(projections[:, k].min(), projections[:, k].max(), PCA_EXTREME_FRAMES)
+            frames = state.pca.mean + amplitudes[:, None] * components[k]
+            path = output_dir / f"pca_extreme_pc{k + 1}.pdb"
+            with mda.Writer(str(path), n_atoms=len(self.backbone), multiframe=True) as writer:
+                for ts, frame in zip(structure.trajectory, frames):
+                    ts.positions = frame.reshape(-1, 3)
+                    writer.write(structure.atoms)
+            written.append(path)
+        return written
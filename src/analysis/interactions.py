@@ -0,0 +1,305 @@
+"""
+Protein–ligand interaction fingerprints: for every frame and protein residue, whether the residue makes a contact,
+a hydrogen bond, a salt bridge or a π-stacking interaction with the ligand.
+
+Frames are processed in batches of the cached (PBC-corrected) solute coordinates. For each batch, the binding site
+is restricted to the residues near the sphere enclosing the ligand in any frame of the batch, and the frames of the
+batch are laid out side by side on a lattice so that a single cell-list/KD-tree search (capped_distance) finds the
+ligand–binding-site pairs of all frames at once; angles are then evaluated on these pairs only.
+"""
+import csv
+from pathlib import Path
+import numpy as np
+from MDAnalysis.lib.distances import capped_distance  # type: ignore
+from src.analysis.engine import HBOND_ANGLE, HBOND_DISTANCE, _is_element, donor_hydrogen_pairs
+
+CONTACT_DISTANCE = 4.0  # Å, between heavy atoms
+SALT_BRIDGE_DISTANCE = 4.0  # Å, between oppositely charged atoms
+PI_STACKING_DISTANCE = 5.5  # Å, between ring centroids, face-to-face (normals within PI_PARALLEL_ANGLE)
+PI_T_SHAPED_DISTANCE = 6.5  # Å, between ring centroids, edge-to-face (normals beyond PI_T_SHAPED_ANGLE)
+PI_PARALLEL_ANGLE = 30.0  # degrees
+PI_T_SHAPED_ANGLE = 60.0  # degrees
+RING_RADIUS = 1.5  # Å, centroid to ring atom, bounds the ring atoms around a centroid
+LIGAND_CHARGE_THRESHOLD = 0.5  # e, net charge of a ligand heavy atom and its hydrogens for a charged group
+
+# Binding-site radius around the sphere enclosing the ligand: any atom of an interacting group lies within it
+POCKET_CUTOFF = max(CONTACT_DISTANCE, HBOND_DISTANCE, SALT_BRIDGE_DISTANCE, PI_T_SHAPED_DISTANCE + 2 * RING_RADIUS)
+MAX_BATCH_FRAMES = 512
+MAX_BATCH_COORDINATES = 2_000_000  # frames x atoms per batch, bounds the batch memory
+
+INTERACTIONS = ("contact", "hbond", "salt_bridge", "pi_stacking")
+
+# Aromatic rings of the protein, atoms in ring order (Amber residue names)
+_PHE_RING = ("CG", "CD1", "CE1", "CZ", "CE2", "CD2")
+_HIS_RING = ("CG", "ND1", "CE1", "NE2", "CD2")
+PROTEIN_RINGS = {
+    "PHE": [_PHE_RING], "TYR": [_PHE_RING],
+    "TRP": [("CD2", "CE2", "CZ2", "CH2", "CZ3", "CE3"), ("CG", "CD1", "NE1", "CE2", "CD2")],
+    "HIS": [_HIS_RING], "HIE": [_HIS_RING], "HID": [_HIS_RING], "HIP": [_HIS_RING],
+}
+PROTEIN_CATIONS = {"LYS": ("NZ",), "ARG": ("NE", "NH1", "NH2"), "HIP": ("ND1", "NE2")}
+PROTEIN_ANIONS = {"ASP": ("OD1", "OD2"), "GLU": ("OE1", "OE2")}
+C_TERMINAL_OXYGENS = ("OXT", "OC1", "OC2")
+
+
+def _ligand_rings(ligand) -> list[list[int]]:
+    """
+    5- and 6-membered rings of the ligand bond graph whose atoms are all C/N/O/S with at most three bonds
+    (sp2-like), as lists of ix in ring order. Empty without bonds.
+    """
+    if not (hasattr(ligand.universe, "bonds") and len(ligand.universe.bonds)):
+        return []
+    members = set(ligand.ix.tolist())
+    neighbours = {a.ix: [b.ix for b in a.bonded_atoms if b.ix in members] for a in ligand}
+    ring_element = np.any([_is_element(ligand, symbol) for symbol in "CNOS"], axis=0)
+    planar = {a.ix for a, ok in zip(ligand, ring_element) if ok and len(a.bonded_atoms) <= 3}
+
+    rings, seen = [], set()
+
+    def extend(path):
+        for nxt in neighbours[path[-1]]:
+            if nxt == path[0] and len(path) in (5, 6):
+                key = frozenset(path)
+                if key not in seen:
+                    seen.add(key)
+                    rings.append(list(path))
+            elif nxt > path[0] and nxt not in path and nxt in planar and len(path) < 6:
+                extend(path + [nxt])
+
+    for start in sorted(planar):
+        extend([start])
+    return rings
+
+
+def _ring_geometry(coords: np.ndarray, rings: list[list[int]]) -> tuple[np.ndarray, np.ndarray]:
+    """Centroids and unit normals (frames, rings, 3) of rings given as local atom indices in ring order."""
+    n_frames = coords.shape[0]
+    centroids = np.empty((n_frames, len(rings), 3))
+    normals = np.empty((n_frames, len(rings), 3))
+    for k, ring in enumerate(rings):
+        atoms = coords[:, ring].astype(float)
+        centroids[:, k] = atoms.mean(axis=1)
+        normal = np.cross(atoms[:, 2] - atoms[:, 0], atoms[:, 4] - atoms[:, 0])
+        normals[:, k] = normal / np.linalg.norm(normal, axis=1, keepdims=True)
+    return centroids, normals
+
+
+class InteractionFingerprint:
+    """
+    Per-frame, per-residue protein–ligand interaction fingerprint.
+
+    Args:
+        atoms: the atoms of the coordinate array passed to run(), e.g. the solute of a TrajectoryAnalysis,
+            whose coordinates are cached by TrajectoryCache. Must contain the protein and the ligand.
+        ligand_name: residue name of the ligand.
+    """
+
+    def __init__(self, atoms, ligand_name: str):
+        self.atoms = atoms
+        self.ligand_name = ligand_name
+        local = np.full(len(atoms.universe.atoms), -1)
+        local[atoms.ix] = np.arange(len(atoms))
+
+        protein = atoms.select_atoms("protein")
+        ligand = atoms.select_atoms(f"resname {ligand_name}")
+        if len(ligand) == 0:
+            raise ValueError(f"No atoms of ligand {ligand_name} in the analysed atoms")
+        self.residues = protein.residues
+        self.residue_of = np.full(len(atoms), -1)
+        self.residue_of[local[protein.ix]] = np.searchsorted(self.residues.resindices, protein.resindices)
+
+        heavy = ~_is_element(atoms, "H")
+        polar = _is_element(atoms, "N") | _is_element(atoms, "O")
+        is_ligand = np.zeros(len(atoms), dtype=bool)
+        is_ligand[local[ligand.ix]] = True
+        is_protein = self.residue_of >= 0
+
+        self.ligand_heavy = np.flatnonzero(is_ligand & heavy)
+        self.protein_heavy = np.flatnonzero(is_protein & heavy)
+
+        donors, hydrogens = donor_hydrogen_pairs(atoms)
+        donors, hydrogens = local[donors], local[hydrogens]
+        self.ligand_donors = (donors[is_ligand[donors]], hydrogens[is_ligand[donors]])
+        self.protein_donors = (donors[is_protein[donors]], hydrogens[is_protein[donors]])
+        self.ligand_acceptors = np.flatnonzero(is_ligand & polar)
+        self.protein_acceptors = np.flatnonzero(is_protein & polar)
+
+        # Charged groups
+        names, resnames = atoms.names, atoms.resnames
+        cation = np.array([n in PROTEIN_CATIONS.get(r, ()) for n, r in zip(names, resnames)]) & is_protein
+        anion = np.array([n in PROTEIN_ANIONS.get(r, ()) or n in C_TERMINAL_OXYGENS for n, r in zip(names, resnames)]) & is_protein
+        self.protein_cations, self.protein_anions = np.flatnonzero(cation), np.flatnonzero(anion)
+        self.ligand_cations, self.ligand_anions = self._ligand_charged_atoms(ligand, local)
+
+        # Aromatic rings, as local atom indices in ring order
+        self.protein_rings, self.protein_ring_residue = [], []
+        for residue in protein.residues:
+            for ring in PROTEIN_RINGS.get(residue.resname, []):
+                by_name = {a.name: a.ix for a in residue.atoms}
+                if all(name in by_name for name in ring):
+                    self.protein_rings.append([local[by_name[name]] for name in ring])
+                    self.protein_ring_residue.append(self.residue_of[local[by_name[ring[0]]]])
+        self.protein_ring_residue = np.array(self.protein_ring_residue, dtype=int)
+        self.ligand_rings = [[local[ix] for ix in ring] for ring in _ligand_rings(ligand)]
+
+    @staticmethod
+    def _ligand_charged_atoms(ligand, local) -> tuple[np.ndarray, np.ndarray]:
+        """Ligand N (cations) and O/S (anions) whose charge plus that of their hydrogens exceeds ±LIGAND_CHARGE_THRESHOLD."""
+        if not hasattr(ligand, "charges") or not np.any(ligand.charges):
+            return np.array([], dtype=int), np.array([], dtype=int)
+        hydrogen = _is_element(ligand.universe.atoms, "H")
+        nitrogen = _is_element(ligand, "N")
+        chalcogen = _is_element(ligand, "O") | _is_element(ligand, "S")
+        cations, anions = [], []
+        for atom, is_n, is_o in zip(ligand, nitrogen, chalcogen):
+            charge = atom.charge + sum(h.charge for h in atom.bonded_atoms if hydrogen[h.ix])
+            # Charged centres only: e.g. the carbon of a carboxylate carries a large positive partial charge
+            if is_n and charge >= LIGAND_CHARGE_THRESHOLD:
+                cations.append(local[atom.ix])
+            elif is_o and charge <= -LIGAND_CHARGE_THRESHOLD:
+                anions.append(local[atom.ix])
+        return np.array(cations, dtype=int), np.array(anions, dtype=int)
+
+    # ------------------------------------------------------------------ binding site
+    def binding_site(self, coords: np.ndarray) -> np.ndarray:
+        """
+        (residues,) mask of the residues that can interact with the ligand in any frame of coords: those with a heavy
+        atom within POCKET_CUTOFF of the sphere enclosing the ligand heavy atoms, in one of the frames.
+        """
+        ligand = coords[:, self.ligand_heavy]
+        centre = ligand.mean(axis=1, keepdims=True)
+        radius = np.sqrt(((ligand - centre) ** 2).sum(axis=2).max(axis=1))
+        distance = np.sqrt(((coords[:, self.protein_heavy] - centre) ** 2).sum(axis=2))
+        near = (distance <= (radius + POCKET_CUTOFF)[:, None]).any(axis=0)
+        site = np.zeros(len(self.residues), dtype=bool)
+        site[self.residue_of[self.protein_heavy[near]]] = True
+        return site
+
+    # ------------------------------------------------------------------ interactions
+    @staticmethod
+    def _lattice(points: list[np.ndarray], cutoff: float) -> np.ndarray:
+        """
+        (frames, 3) translations laying the frames of a batch out on a cubic lattice, with a spacing larger than
+        the extent of the points plus cutoff, so that no pair of points of different frames is within cutoff.
+        """
+        n_frames = len(points[0])
+        low = np.min([p.min(axis=(0, 1)) for p in points if p.size], axis=0)
+        high = np.max([p.max(axis=(0, 1)) for p in points if p.size], axis=0)
+        spacing = (high - low).max() + 2 * cutoff
+        side = int(np.ceil(n_frames ** (1 / 3) - 1e-9))
+        cell = np.arange(n_frames)
+        return np.stack([cell % side, cell // side % side, cell // side**2], axis=1) * spacing - low
+
+    @staticmethod
+    def _pairs(a: np.ndarray, b: np.ndarray, cutoff: float, shifts: np.ndarray) -> tuple[np.ndarray, ...]:
+        """
+        (frame, i, j) of all pairs a[:, i], b[:, j] of (frames, n, 3) points within cutoff in the same frame, from a
+        single cell-list/KD-tree search over all frames of the batch at once.
+        """
+        if a.shape[1] == 0 or b.shape[1] == 0:
+            empty = np.array([], dtype=int)
+            return empty, empty, empty
+        pairs = capped_distance((a + shifts[:, None]).reshape(-1, 3), (b + shifts[:, None]).reshape(-1, 3), cutoff,
+                                return_distances=False)
+        frame, i = np.divmod(pairs[:, 0], a.shape[1])
+        return frame, i, pairs[:, 1] % b.shape[1]
+
+    def _hbond_pairs(self, coords, donors, hydrogens, acceptors, shifts) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(frame, donor entry, acceptor) of the hydrogen bonds, with the gmx hbond criteria."""
+        frame, d, a = self._pairs(coords[:, donors], coords[:, acceptors], HBOND_DISTANCE, shifts)
+        donor, hydrogen, acceptor = coords[frame, donors[d]], coords[frame, hydrogens[d]], coords[frame, acceptors[a]]
+        d_a, d_h = acceptor - donor, hydrogen - donor
+        cos = (d_a * d_h).sum(axis=1) / (np.linalg.norm(d_a, axis=1) * np.linalg.norm(d_h, axis=1) + 1e-12)
+        keep = cos >= np.cos(np.radians(HBOND_ANGLE))
+        return frame[keep], d[keep], a[keep]
+
+    def fingerprint_batch(self, coords: np.ndarray) -> np.ndarray:
+        """(frames, residues) bit field of the interactions (bit i for INTERACTIONS[i]) in a batch of frames."""
+        coords = np.asarray(coords, dtype=np.float64)
+        site = self.binding_site(coords)
+        in_site = lambda atoms: atoms[site[self.residue_of[atoms]]]
+        bits = np.zeros((len(coords), len(self.residues)), dtype=np.uint8)
+
+        def mark(frame, residue, interaction):
+            bits[frame, residue] |= np.uint8(1 << INTERACTIONS.index(interaction))
+
+        protein = in_site(self.protein_heavy)
+        shifts = self._lattice([coords[:, self.ligand_heavy], coords[:, protein]], POCKET_CUTOFF)
+
+        frame, _, j = self._pairs(coords[:, self.ligand_heavy], coords[:, protein], CONTACT_DISTANCE, shifts)
+        mark(frame, self.residue_of[protein[j]], "contact")
+
+        # Protein donors -> ligand acceptors, then ligand donors -> protein acceptors
+        donor_site = site[self.residue_of[self.protein_donors[0]]]
+        donors, hydrogens = self.protein_donors[0][donor_site], self.protein_donors[1][donor_site]
+        frame, d, _ = self._hbond_pairs(coords, donors, hydrogens, self.ligand_acceptors, shifts)
+        mark(frame, self.residue_of[donors[d]], "hbond")
+        acceptors = in_site(self.protein_acceptors)
+        frame, _, a = self._hbond_pairs(coords, *self.ligand_donors, acceptors, shifts)
+        mark(frame, self.residue_of[acceptors[a]], "hbond")
+
+        for protein_atoms, ligand_atoms in ((self.protein_cations, self.ligand_anions), (self.protein_anions, self.ligand_cations)):
+            protein_atoms = in_site(protein_atoms)
+            frame, _, j = self._pairs(coords[:, ligand_atoms], coords[:, protein_atoms], SALT_BRIDGE_DISTANCE, shifts)
+            mark(frame, self.residue_of[protein_atoms[j]], "salt_bridge")
+
+        rings = [k for k, r in enumerate(self.protein_ring_residue) if site[r]]
+        if rings and self.ligand_rings:
+            p_centroids, p_normals = _ring_geometry(coords, [self.protein_rings[k] for k in rings])
+            l_centroids, l_normals = _ring_geometry(coords, self.ligand_rings)
+            frame, i, j = self._pairs(l_centroids, p_centroids, PI_T_SHAPED_DISTANCE, shifts)
+            distance = np.linalg.norm(l_centroids[frame, i] - p_centroids[frame, j], axis=1)
+            angle = np.degrees(np.arccos(np.clip(np.abs((l_normals[frame, i] * p_normals[frame, j]).sum(axis=1)), 0, 1)))
+            stacked = ((distance <= PI_STACKING_DISTANCE) & (angle <= PI_PARALLEL_ANGLE)) | (angle >= PI_T_SHAPED_ANGLE)
+            mark(frame[stacked], self.protein_ring_residue[rings][j[stacked]], "pi_stacking")
+        return bits
+
+    def run(self, coords: np.ndarray) -> np.ndarray:
+        """(frames, residues) uint8 fingerprint of all frames of coords (e.g. a TrajectoryCache memmap, in Å)."""
+        fingerprint = np.zeros((len(coords), len(self.residues)), dtype=np.uint8)
+        batch = int(np.clip(MAX_BATCH_COORDINATES // max(coords.shape[1], 1), 1, MAX_BATCH_FRAMES))
+        for start in range(0, len(coords), batch):
+            fingerprint[start:start + batch] = self.fingerprint_batch(coords[start:start + batch])
+        return fingerprint
+
+    # ------------------------------------------------------------------ outputs
+    def occupancy(self, fingerprint: np.ndarray) -> np.ndarray:
+        """(residues, interactions + 1) fraction of frames with each interaction, then with any interaction."""
+        columns = [(fingerprint >> bit) & 1 for bit in range(len(INTERACTIONS))] + [fingerprint > 0]
+        return np.stack([c.mean(axis=0) for c in columns], axis=1)
+
+    def write_outputs(self, fingerprint: np.ndarray, times, output_dir) -> list[Path]:
+        """
+        Write interactions.csv (occupancy per interacting residue) and interaction_fingerprint.npz
+        (per-frame bit field of the interacting residues, bit i for INTERACTIONS[i]) to output_dir.
+        """
+        output_dir = Path(output_dir)
+        occupancy = self.occupancy(fingerprint)
+        interacting = np.flatnonzero(occupancy[:, -1] > 0)
+
+        csv_path = output_dir / "interactions.csv"
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["residue", "resid", "resname", *INTERACTIONS, "any"])
+            for r in interacting:
+                residue = self.residues[r]
+                writer.writerow([f"{residue.resname}{residue.resid}", residue.resid, residue.resname,
+                                 *(f"{v:.3f}" for v in occupancy[r])])
+
+        npz_path = output_dir / "interaction_fingerprint.npz"
+        np.savez_compressed(npz_path, times=np.asarray(times), resids=self.residues.resids[interacting],
+                            resnames=self.residues.resnames[interacting].astype(str),
+                            fingerprint=fingerprint[:, interacting], interactions=np.array(INTERACTIONS))
+        return [csv_path, npz_path]
+
+    def summary(self, fingerprint: np.ndarray, top: int = 10) -> list[str]:
+        """Report lines: number of interacting residues and the most persistent ones with their interaction types."""
+        occupancy = self.occupancy(fingerprint)
+        order = [r for r in np.argsort(-occupancy[:, -1], kind="stable") if occupancy[r, -1] > 0]
+        lines = [f"Protein-{self.ligand_name} interactions: {len(order)} residues interact with the ligand "
+                 f"in at least one of {len(fingerprint)} frames."]
+        for r in order[:top]:
+            residue = self.residues[r]
+            kinds = ", ".join(f"{name} {occupancy[r, i]:.0%}" for i, name in enumerate(INTERACTIONS) if occupancy[r, i] > 0)
+            lines.append(f"  {residue.resname}{residue.resid}: {occupancy[r, -1]:.0%} of frames ({kinds})")
+        return lines
@@ -0,0 +1,293 @@
+"""
+On-the-fly analysis of a trajectory that mdrun is still writing. The growing .xtc is polled, only frames that are
+completely flushed to disk are decoded, and each new frame goes through the same PBC removal and accumulators as
+TrajectoryAnalysis.run(), while <name>_noPBC.xtc and the solute coordinates are written incrementally.
+When mdrun exits, only the frames written since the last poll remain to be analysed; the final state is saved
+next to the trajectory and reused by analyze_trajectory() as long as the trajectory is unchanged.
+"""
+import pickle
+import struct
+import time
+from pathlib import Path
+import numpy as np
+import MDAnalysis as mda  # type: ignore
+from MDAnalysis.lib.distances import capped_distance  # type: ignore
+from MDAnalysis.lib.formats.libmdaxdr import XTCFile  # type: ignore
+from MDAnalysis.lib.mdamath import triclinic_box  # type: ignore
+from src import constants
+from src.analysis.cache import TrajectoryCache
+from src.analysis.engine import AnalysisState, TrajectoryAnalysis
+from src.utils import get_class_logger
+
+logger = get_class_logger(__name__)
+
+LIVE_STATE_VERSION = 2  # 2: AnalysisState carries the incremental PCA
+
+# XTC frame layout (big-endian XDR): magic, natoms, step, time, box[9], then for natoms > 9 the compressed block
+# header (lsize, precision, minint[3], maxint[3], smallidx, byte count) followed by the bytes padded to 4
+_XTC_MAGIC = 1995
+_XTC_HEADER = struct.Struct(">iiif9f")
+_XTC_COMPRESSED_HEADER = struct.Struct(">if3i3iii")
+
+
+def complete_xtc_frames(path, offset: int = 0) -> tuple[list[int], int]:
+    """
+    Byte offsets of the frames of an XTC file that are completely written, starting at offset (a frame boundary),
+    and the offset where the next frame starts. Only the frame headers are read, so this is cheap enough to call repeatedly on a file that is still growing.
+    """
+    offsets = []
+    size = Path(path).stat().st_size
+    with open(path, "rb") as f:
+        while offset + _XTC_HEADER.size + 4 <= size:
+            f.seek(offset)
+            header = f.read(_XTC_HEADER.size + _XTC_COMPRESSED_HEADER.size)
+            magic, natoms = struct.unpack(">ii", header[:8])
+            if magic != _XTC_MAGIC:
+                raise ValueError(f"{path} is not an XTC file or is corrupted at byte {offset}")
+            if natoms <= 9:
+                frame_size = _XTC_HEADER.size + 4 + 12 * natoms  # uncompressed coordinates
+            else:
+                if len(header) < _XTC_HEADER.size + _XTC_COMPRESSED_HEADER.size:
+                    break
+                n_bytes = _XTC_COMPRESSED_HEADER.unpack_from(header, _XTC_HEADER.size)[-1]
+                frame_size = _XTC_HEADER.size + _XTC_COMPRESSED_HEADER.size + (n_bytes + 3) // 4 * 4
+            if offset + frame_size > size:
+                break
+            offsets.append(offset)
+            offset += frame_size
+    return offsets, offset
+
+
+def live_state_path(trajectory) -> Path:
+    trajectory = Path(trajectory)
+    return trajectory.parent / f".{trajectory.name}.live.pkl"
+
+
+def load_live_state(trajectory, topology, ligand_name=None) -> dict | None:
+    """
+    The state saved by LiveAnalysis.finalize() for trajectory, or None if there is none or if the trajectory,
+    its topology, the ligand or the PBC-corrected output changed since it was saved.
+    """
+    path = live_state_path(trajectory)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            record = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logger.warning(f"Ignoring unreadable live analysis state {path.name}: {e}")
+        return None
+    stat = Path(trajectory).stat()
+    output_cache = TrajectoryCache(record.get("output_xtc", ""))
+    if (record.get("version") != LIVE_STATE_VERSION or record["size"] != stat.st_size
+            or record["mtime_ns"] != stat.st_mtime_ns or record["topology"] != Path(topology).name
+            or record["ligand_name"] != ligand_name or not output_cache.is_valid()
+            or output_cache.n_frames != record["n_frames"]):
+        return None
+    return record
+
+
+class LiveAnalysis:
+    """
+    Incremental analysis of a trajectory written by a running mdrun.
+
+    Args:
+        sandbox_dir: run directory holding md.tpr (and md_solute.tpr for the reduced output policy).
+        trajectory: name of the trajectory in sandbox_dir, e.g. md.xtc.
+        ligand_name: residue name of the ligand, if any.
+        interval: seconds between two polls of the trajectory.
+    """
+
+    def __init__(self, sandbox_dir, trajectory: str = "md.xtc", ligand_name=None,
+                 interval: float = constants.LIVE_ANALYSIS_INTERVAL):
+        self.sandbox = Path(sandbox_dir)
+        self.trajectory = self.sandbox / trajectory
+        self.stem = Path(trajectory).stem
+        self.output_xtc = self.sandbox / f"{self.stem}_noPBC.xtc"
+        self.status_log = self.sandbox / f"{self.stem}_live_analysis.log"
+        self.ligand_name = ligand_name
+        self.interval = interval
+        self.started = time.time()
+
+        self.analysis: TrajectoryAnalysis | None = None
+        self.topology: Path | None = None
+        self.state = AnalysisState()
+        self.offsets: list[int] = []
+        self.next_offset = 0
+        self.writer = None
+        self.coordinates_file = None
+        self.warnings: dict[str, str] = {}
+        self.rg_reference: float | None = None
+        self.error: Exception | None = None
+
+    # ------------------------------------------------------------------ setup
+    def _topology_for(self, n_atoms: int) -> Path | None:
+        """md_solute.tpr for a solute-only trajectory (reduced output policy), else md.tpr; None until one matches."""
+        for name in (f"{self.stem}_solute.tpr", f"{self.stem}.tpr"):
+            path = self.sandbox / name
+            if path.exists() and path.stat().st_mtime >= self.started - 1:
+                if mda.Universe(str(path)).atoms.n_atoms == n_atoms:
+                    return path
+        return None
+
+    def _setup(self) -> bool:
+        with open(self.trajectory, "rb") as f:
+            header = f.read(_XTC_HEADER.size)
+        if len(header) < _XTC_HEADER.size:
+            return False
+        n_atoms = struct.unpack(">ii", header[:8])[1]
+        self.topology = self._topology_for(n_atoms)
+        if self.topology is None:
+            return False
+        reference = (self.sandbox / "em.tpr", self.sandbox / "em.gro")
+        if not all(p.exists() for p in reference):
+            reference = None
+        self.analysis = TrajectoryAnalysis(self.topology, None, reference, self.ligand_name)
+        self.state = self.analysis.new_state()
+        TrajectoryCache(self.output_xtc).invalidate()
+        self.writer = mda.Writer(str(self.output_xtc), n_atoms=self.analysis.universe.atoms.n_atoms)
+        self.coordinates_file = open(self._coordinates_path(), "wb")
+        self.status_log.write_text("", encoding="utf-8")
+        logger.info(f"Live analysis of {self.trajectory.name} started with {self.topology.name}")
+        return True
+
+    def _coordinates_path(self) -> Path:
+        return self.sandbox / f".{self.output_xtc.name}.live.f32"
+
+    # ------------------------------------------------------------------ polling
+    def poll(self) -> int:
+        """Analyse the frames completed since the last call; returns the number of new frames."""
+        # Ignore a trajectory left over from an earlier run until mdrun starts rewriting it
+        if not self.trajectory.exists() or self.trajectory.stat().st_mtime < self.started - 1:
+            return 0
+        if self.analysis is None and not self._setup():
+            return 0
+        new_offsets, self.next_offset = complete_xtc_frames(self.trajectory, self.next_offset)
+        if not new_offsets:
+            return 0
+
+        first = len(self.offsets)
+        self.offsets.extend(new_offsets)
+        analysis = self.analysis
+        with XTCFile(str(self.trajectory)) as xtc:
+            xtc.set_offsets(np.asarray(self.offsets, dtype=np.int64))
+            xtc.seek(first)
+            for frame in range(first, len(self.offsets)):
+                data = xtc.read()
+                # Same unit conversion as the MDAnalysis XTC reader, so that results match a post-run analysis
+                dimensions = triclinic_box(*data.box)
+                dimensions[:3] *= 10
+                ts = analysis.feed(self.state, frame, float(data.time), data.x * 10, dimensions,
+                                   step=int(data.step), writer=self.writer)
+                self.coordinates_file.write(np.ascontiguousarray(analysis.solute.positions, dtype=np.float32).tobytes())
+        self._check_stability(ts)
+        return len(new_offsets)
+
+    def _log_status(self, line: str) -> None:
+        with open(self.status_log, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%H:%M:%S')}  {line}\n")
+
+    def _warn(self, key: str, message: str) -> None:
+        if key not in self.warnings:
+            self.warnings[key] = message
+            logger.warning(message)
+            self._log_status(f"WARNING: {message}")
+
+    def _check_stability(self, ts) -> None:
+        """Flag the run from its latest frame: large backbone RMSD, protein expansion/collapse, unbound ligand."""
+        time_ns = ts.time / 1000
+        rmsd = self.state.rmsd.values[-1] / 10
+        rg = self.state.gyrate.values[-1][0] / 10
+        if self.rg_reference is None:
+            self.rg_reference = self.state.gyrate.values[0][0] / 10
+        rg_change = rg / self.rg_reference - 1
+
+        if rmsd > constants.LIVE_MAX_RMSD:
+            self._warn("rmsd", f"Backbone RMSD reached {rmsd:.2f} nm at {time_ns:.2f} ns "
+                               f"(limit {constants.LIVE_MAX_RMSD} nm): the protein may be unfolding or unstable.")
+        if abs(rg_change) > constants.LIVE_MAX_RG_CHANGE:
+            self._warn("gyrate", f"Radius of gyration changed by {rg_change:+.0%} at {time_ns:.2f} ns "
+                                 f"({self.rg_reference:.2f} -> {rg:.2f} nm): the protein is expanding or collapsing.")
+        ligand, protein = self.analysis.ligand, self.analysis.protein
+        if len(ligand):
+            pairs = capped_distance(ligand.positions, protein.positions, constants.LIVE_LIGAND_CONTACT * 10,
+                                    box=ts.dimensions, return_distances=False)
+            if len(pairs) == 0:
+                self._warn("ligand", f"Ligand {self.ligand_name} has no protein atom within "
+                                     f"{constants.LIVE_LIGAND_CONTACT} nm at {time_ns:.2f} ns: it left the binding site.")
+
+        self._log_status(f"frames {len(self.offsets):6d}  t {time_ns:9.3f} ns  RMSD {rmsd:6.3f} nm  Rg {rg:6.3f} nm")
+
+    # ------------------------------------------------------------------ completion
+    def finalize(self) -> None:
+        """Close <name>_noPBC.xtc, fill its coordinate cache and save the state for analyze_trajectory()."""
+        self.writer.close()
+        self.writer = None
+        self.coordinates_file.close()
+        n_frames = len(self.offsets)
+        cache = TrajectoryCache(self.output_xtc)
+        coordinates = np.load(cache.allocate_coordinates(self.analysis.solute.ix, n_frames), mmap_mode="r+")
+        if n_frames:
+            # Copied block by block through a memory map, so memory use does not grow with the run length
+            raw = np.memmap(self._coordinates_path(), dtype=np.float32, mode="r", shape=coordinates.shape)
+            for start in range(0, n_frames, constants.ANALYSIS_BLOCK_FRAMES):
+                coordinates[start:start + constants.ANALYSIS_BLOCK_FRAMES] = raw[start:start + constants.ANALYSIS_BLOCK_FRAMES]
+            del raw
+        coordinates.flush()
+        del coordinates
+        self._coordinates_path().unlink()
+        cache.finalize_coordinates(self.state.rmsd.results()[0])
+
+        stat = self.trajectory.stat()
+        record = {"version": LIVE_STATE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                  "n_frames": n_frames, "topology": self.topology.name, "ligand_name": self.ligand_name,
+                  "output_xtc": str(self.output_xtc), "warnings": list(self.warnings.values()), "state": self.state}
+        with open(live_state_path(self.trajectory), "wb") as f:
+            pickle.dump(record, f)
+
+    def _abort(self) -> None:
+        """
+        Remove what this run's analysis wrote. Nothing is touched if it never started (e.g. mdrun skipped because the
+        run was already finished): the cache and live state of the earlier run stay valid.
+        """
+        if self.analysis is None:
+            return
+        if self.writer is not None:
+            self.writer.close()
+        if self.coordinates_file is not None:
+            self.coordinates_file.close()
+            self._coordinates_path().unlink(missing_ok=True)
+        TrajectoryCache(self.output_xtc).invalidate()
+        live_state_path(self.trajectory).unlink(missing_ok=True)
+
+    def follow(self, process) -> str:
+        """
+        Poll the trajectory until process (the subprocess.Popen running mdrun) exits, then analyse the last frames.
+        Never raises: a failure of the live analysis is reported and only leaves the post-run analysis to do.
+        """
+        try:
+            while process.poll() is None:
+                time.sleep(self.interval)
+                self.poll()
+            self.poll()
+            if process.returncode != 0 or self.analysis is None:
+                self._abort()
+                return "Live analysis: no complete trajectory written by this run."
+            self.finalize()
+        except Exception as e:
+            logger.exception("Live analysis failed, the trajectory will be analysed after the run")
+            self.error = e
+            self._abort()
+            process.wait()
+            return f"Live analysis stopped ({type(e).__name__}: {e}); run gromacs_analysis for the full analysis."
+        return self.summary()
+
+    def summary(self) -> str:
+        lines = [f"Live analysis: {len(self.offsets)} frames of {self.trajectory.name} analysed during the run "
+                 f"(status in {self.status_log.name}); gromacs_analysis will reuse them."]
+        if self.warnings:
+            lines.extend(f"WARNING: {w}" for w in self.warnings.values())
+        else:
+            lines.append("No instability detected (backbone RMSD, radius of gyration"
+                         + (", ligand contacts)." if len(self.analysis.ligand) else ")."))
+        return "\n".join(lines)
@@ -0,0 +1,190 @@
+"""
+Frame-parallel trajectory analysis (split-apply-combine). The trajectory is cut into fixed blocks of frames,
+each block is analysed by TrajectoryAnalysis.run() on a process pool, and the block states are merged in block
+order: time series are concatenated, RMSF moments are combined with Chan's formula, the incremental PCA
+factors are merged by a stacked SVD and hydrogen-bond counts are kept per frame. Since the blocks do not depend on the worker count and are always merged in the same order,
+the results are bit-for-bit identical whatever the number of workers or the order in which blocks complete.
+"""
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from src import constants
+from src.analysis.cache import TrajectoryCache
+from src.analysis.convergence import CONVERGENCE_FILE, assess_run, convergence_report, write_convergence
+from src.analysis.edr import read_edr
+from src.analysis.engine import AnalysisState, TrajectoryAnalysis
+from src.analysis.interactions import InteractionFingerprint
+from src.analysis.live import load_live_state
+from src.analysis.results import RESULTS_FILE, Series, save_results, summarize_results
+
+_worker_analysis: TrajectoryAnalysis | None = None
+
+
+def _init_worker(analysis_args: tuple) -> None:
+    global _worker_analysis
+    _worker_analysis = TrajectoryAnalysis(*analysis_args)
+
+
+def _analyse_block(analysis: TrajectoryAnalysis, start: int, stop: int, part_xtc, coordinates_path) -> AnalysisState:
+    coordinates = np.load(coordinates_path, mmap_mode="r+") if coordinates_path else None
+    state = analysis.run(start, stop, output_xtc=part_xtc, coordinates=coordinates)
+    if coordinates is not None:
+        coordinates.flush()
+    return state
+
+
+def _run_block(start: int, stop: int, part_xtc, coordinates_path) -> AnalysisState:
+    return _analyse_block(_worker_analysis, start, stop, part_xtc, coordinates_path)
+
+
+def frame_blocks(n_frames: int, block_size: int = constants.ANALYSIS_BLOCK_FRAMES) -> list[tuple[int, int]]:
+    """[start, stop) frame ranges of consecutive blocks of at most block_size frames."""
+    return [(start, min(start + block_size, n_frames)) for start in range(0, n_frames, block_size)]
+
+
+def concatenate_xtc(parts: list[Path], output_xtc: Path) -> None:
+    """Join XTC files frame by frame; XTC frames are self-contained, so the files are simply appended."""
+    with open(output_xtc, "wb") as out:
+        for part in parts:
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, out)
+            part.unlink()
+
+
+def run_parallel(topology, trajectory, reference=None, ligand_name=None, output_xtc=None, n_workers=None,
+                 block_size: int = constants.ANALYSIS_BLOCK_FRAMES, cache_coordinates: bool = True) -> tuple[TrajectoryAnalysis, AnalysisState]:
+    """
+    Analyse the trajectory block by block on n_workers processes (default: ANALYSIS_WORKERS, else all cores).
+    With output_xtc and cache_coordinates, the solute coordinates are also stored in the TrajectoryCache of output_xtc
+    during the same pass. Returns the TrajectoryAnalysis of the main process (for writing outputs) and the merged state.
+    """
+    analysis_args = (topology, trajectory, reference, ligand_name)
+    analysis = TrajectoryAnalysis(*analysis_args)  # also builds the XTC offsets reused by the workers
+    blocks = frame_blocks(analysis.n_frames, block_size)
+    if output_xtc is not None:
+        output_xtc = Path(output_xtc)
+        parts = [output_xtc.with_name(f".{output_xtc.stem}.part{i:05d}.xtc") for i in range(len(blocks))]
+    else:
+        parts = [None] * len(blocks)
+    cache = TrajectoryCache(output_xtc) if output_xtc is not None and cache_coordinates else None
+    coordinates_path = cache.allocate_coordinates(analysis.solute.ix, analysis.n_frames) if cache else None
+
+    n_workers = n_workers or constants.ANALYSIS_WORKERS or os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(blocks)))
+    starts, stops = [b[0] for b in blocks], [b[1] for b in blocks]
+    if n_workers == 1:
+        states = [_analyse_block(analysis, start, stop, part, coordinates_path) for start, stop, part in zip(starts, stops, parts)]
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(analysis_args,)) as pool:
+            # map() returns the states in block order whatever the completion order
+            states = list(pool.map(_run_block, starts, stops, parts, [coordinates_path] * len(blocks)))
+
+    state = AnalysisState()
+    for block_state in states:
+        state.merge(block_state)
+    if output_xtc is not None:
+        concatenate_xtc(parts, output_xtc)
+    if cache is not None:
+        cache.finalize_coordinates(state.rmsd.results()[0])
+    return analysis, state
+
+
+def essential_dynamics_summary(state: AnalysisState) -> str:
+    """One line on the variance captured by the first essential modes."""
+    eigenvalues, _, total_variance = state.pca.results()
+    fractions = np.cumsum(eigenvalues) / total_variance if total_variance > 0 else np.zeros(len(eigenvalues))
+    first = min(3, len(eigenvalues))
+    return (f"Essential dynamics (backbone PCA): total variance {total_variance / 100:.4f} nm², PC1 {100 * fractions[0]:.1f}%, "
+            f"PC1-{first} {100 * fractions[first - 1]:.1f}% of the fluctuations.")
+
+
+def analyze_trajectory(sandbox_dir: str, input_xtc: str, ligand_name=None, n_workers=None) -> str:
+    """
+    Run the trajectory analysis of input_xtc in sandbox_dir and return a short report of the files written.
+    With a ligand, protein-ligand interaction fingerprints are computed from the cached coordinates (interactions.csv).
+    Uses <name>_solute.tpr for solute-only trajectories (reduced output policy), else <name>.tpr.
+    """
+    sandbox = Path(sandbox_dir)
+    stem = Path(input_xtc).stem
+    topology = sandbox / f"{stem}_solute.tpr"
+    if not topology.exists():
+        topology = sandbox / f"{stem}.tpr"
+    reference = (sandbox / "em.tpr", sandbox / "em.gro")
+    if not all(p.exists() for p in reference):
+        reference = None
+
+    start = time.perf_counter()
+    output_xtc = sandbox / f"{stem}_noPBC.xtc"
+    live = load_live_state(sandbox / input_xtc, topology, ligand_name)
+    if live is not None:
+        # Analysed on the fly during production (src.analysis.live): only the output files remain to be written
+        analysis, state = TrajectoryAnalysis(topology, None, reference, ligand_name), live["state"]
+        n_frames = live["n_frames"]
+        how = "during the production run (live analysis state reused)"
+    else:
+        analysis, state = run_parallel(topology, sandbox / input_xtc, reference, ligand_name, output_xtc=output_xtc, n_workers=n_workers)
+        n_frames = analysis.n_frames
+        how = f"in {len(frame_blocks(n_frames))} block(s)"
+    written = analysis.write_outputs(state, sandbox)
+
+    lines = [f"Analysed {n_frames} frames of {input_xtc} ({topology.name}) {how} "
+             f"in {time.perf_counter() - start:.1f} s.",
+             f"PBC-corrected trajectory written to {output_xtc.name}, with its frame index and memory-mapped "
+             f"protein(+ligand) coordinates cached in {TrajectoryCache(output_xtc).directory.name}/."]
+    if reference is None or analysis.xtal_reference is None:
+        lines.append("rmsd_xtal.xvg not written: em.tpr/em.gro missing or backbone does not match the trajectory.")
+    if "prot_wat" not in analysis.hbond_counters:
+        lines.append("No water in the trajectory, skipping protein-water hydrogen bonds.")
+    if live is not None:
+        lines.extend(f"WARNING (live analysis): {w}" for w in live["warnings"])
+    for name, series in state.hbonds.items():
+        total = sum(int(v[0]) for v in series.values)
+        lines.append(f"hbnum_{name}: {total} hydrogen bonds in total, {total / max(len(series.values), 1):.1f} per frame")
+
+    series = analysis.series(state)
+    cache = TrajectoryCache(output_xtc)
+    coordinates = cache.coordinates(analysis.solute.ix)
+    # Essential dynamics: the modes were accumulated during the analysis pass, the projections are read from the
+    # cached PBC-corrected solute coordinates
+    if coordinates is None:
+        lines.append(f"No cached coordinates for {output_xtc.name}, skipping the essential dynamics (PCA).")
+    elif state.pca.count > 1:
+        written += analysis.write_essential_dynamics(state, coordinates, cache.times(), sandbox)
+        lines.append(essential_dynamics_summary(state))
+
+    # Protein-ligand interaction fingerprint, from the cached PBC-corrected solute coordinates
+    if len(analysis.ligand):
+        if coordinates is not None:
+            fingerprint = InteractionFingerprint(analysis.solute, ligand_name)
+            bits = fingerprint.run(coordinates)
+            written += fingerprint.write_outputs(bits, cache.times(), sandbox)
+            lines.extend(fingerprint.summary(bits))
+            series["ligand_contacts"] = Series(cache.times() / 1000, (bits & 1).sum(axis=1),
+                                               columns=[f"residues in contact with {ligand_name}"])
+        else:
+            lines.append(f"No cached coordinates for {output_xtc.name}, skipping protein-ligand interaction fingerprints.")
+
+    # Production energies from <name>.edr, for the convergence of the potential energy
+    edr_path = sandbox / f"{stem}.edr"
+    if edr_path.exists():
+        try:
+            energies = read_edr(edr_path)
+            series["potential"] = Series(energies.time / 1000, energies["Potential"], unit="kJ/mol", columns=["Potential"])
+        except (ValueError, KeyError) as e:
+            lines.append(f"Energies of {edr_path.name} not read: {e}")
+
+    # Is the run long enough? Block averages, autocorrelation times and effective sample sizes of the observables
+    convergence = assess_run(series)
+    if convergence:
+        written.append(write_convergence(convergence, sandbox / CONVERGENCE_FILE))
+    lines.extend(convergence_report(convergence))
+
+    # Compact store of all the series, summarized so that analysis.txt can be written without reading the .xvg files
+    written.append(save_results(sandbox / RESULTS_FILE, series))
+    lines.append("Files written: " + ", ".join(p.name for p in written))
+    lines.append(f"Summary of {RESULTS_FILE} (the same as the summarize_analysis tool):")
+    lines.append(summarize_results(sandbox / RESULTS_FILE))
+    return "\n".join(lines)
@@ -0,0 +1,116 @@
+"""
+Compact results store of a trajectory analysis run and token-efficient summaries of it.
+
+All the series of a run (time series, per-residue profiles, eigenvalues) are kept in a single columnar .npz file,
+next to a JSON description of their axes and units. The summary gives, per series, the statistics an analysis
+needs (mean/std, drift, block-averaged convergence and a downsampled trend) in a few lines, so that the agent
+reads a few hundred tokens instead of the raw .xvg files, which do not fit in its context and get truncated.
+"""
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+from src import constants
+
+RESULTS_FILE = "analysis_results.npz"
+
+
+@dataclass
+class Series:
+    """
+    One series of a results store.
+
+    Args:
+        x: abscissa (time in ns, residue number or mode index).
+        values: (n_columns, len(x)) values; the first column is the one summarized.
+        kind: "time", "residue" or "index", selects the statistics of the summary.
+        unit: unit of the values.
+        columns: name of each column.
+    """
+    x: np.ndarray
+    values: np.ndarray
+    kind: str = "time"
+    unit: str = ""
+    columns: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.x = np.asarray(self.x)
+        self.values = np.atleast_2d(np.asarray(self.values, dtype=float))
+        if not self.columns:
+            self.columns = [f"y{i}" for i in range(len(self.values))]
+
+
+def save_results(path: str | Path, series: dict[str, Series]) -> Path:
+    """Write the series to a compressed .npz file (one x and one values array per series, plus their metadata)."""
+    arrays, metadata = {}, {}
+    for name, s in series.items():
+        arrays[f"{name}.x"], arrays[f"{name}.values"] = s.x, s.values
+        metadata[name] = {"kind": s.kind, "unit": s.unit, "columns": s.columns}
+    np.savez_compressed(path, metadata=np.array(json.dumps(metadata)), **arrays)
+    return Path(path)
+
+
+def load_results(path: str | Path) -> dict[str, Series]:
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        return {name: Series(data[f"{name}.x"], data[f"{name}.values"], **meta) for name, meta in metadata.items()}
+
+
+def _fmt(values) -> str:
+    return " ".join(f"{v:.3g}" for v in np.atleast_1d(values))
+
+
+def downsample(y: np.ndarray, points: int) -> np.ndarray:
+    """Means of (at most) points consecutive bins of y, a trend that keeps the whole series instead of its ends."""
+    return np.array([b.mean() for b in np.array_split(y, min(points, len(y)))])
+
+
+def block_averages(y: np.ndarray, n_blocks: int) -> tuple[np.ndarray, float]:
+    """Means of n_blocks consecutive blocks of y and the standard error of the mean estimated from them."""
+    blocks = downsample(y, n_blocks)
+    sem = blocks.std(ddof=1) / np.sqrt(len(blocks)) if len(blocks) > 1 else float("nan")
+    return blocks, sem
+
+
+def drift(x: np.ndarray, y: np.ndarray) -> float:
+    """Least-squares slope of y against x (per unit of x)."""
+    if len(x) < 2 or np.ptp(x) == 0:
+        return 0.0
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def summarize_series(name: str, series: Series, points: int = constants.SUMMARY_POINTS,
+                     n_blocks: int = constants.SUMMARY_BLOCKS) -> list[str]:
+    """A few lines of statistics on the first column of a series."""
+    x, y = series.x, series.values[0]
+    unit = f" {series.unit}" if series.unit else ""
+    label = f"{series.columns[0]}, {series.unit}" if series.unit else series.columns[0]
+    if not len(y):
+        return [f"{name}: no data"]
+    if series.kind == "time":
+        blocks, sem = block_averages(y, n_blocks)
+        slope = drift(x, y)
+        return [f"{name} ({label}, {len(y)} frames over {x[0]:.3g}-{x[-1]:.3g} ns): "
+                f"mean {y.mean():.3g} ± {y.std():.3g} (std), range {y.min():.3g}-{y.max():.3g}, "
+                f"drift {slope:+.3g}{unit}/ns ({slope * np.ptp(x):+.3g} over the run)",
+                f"  block means ({len(blocks)} blocks) {_fmt(blocks)}, SEM {sem:.2g}",
+                f"  trend ({min(points, len(y))} points) {_fmt(downsample(y, points))}"]
+    if series.kind == "residue":
+        top = np.argsort(y)[::-1][:constants.SUMMARY_TOP_RESIDUES]
+        return [f"{name} ({label}, {len(y)} residues): mean {y.mean():.3g} ± {y.std():.3g}, "
+                f"highest " + ", ".join(f"{x[i]} ({y[i]:.3g})" for i in top),
+                f"  profile ({min(points, len(y))} segments) {_fmt(downsample(y, points))}"]
+    return [f"{name} ({label}): {_fmt(y[:points])}" + (" ..." if len(y) > points else "")]
+
+
+def summarize_results(path: str | Path, names=None, points: int = constants.SUMMARY_POINTS) -> str:
+    """Summary of the series of a results store (all of them, or those in names)."""
+    results = load_results(path)
+    lines = []
+    for name, series in results.items():
+        if names is None or name in names:
+            lines.extend(summarize_series(name, series, points=points))
+    missing = sorted(set(names or ()) - set(results))
+    if missing:
+        lines.append(f"Not in {Path(path).name}: {', '.join(missing)}. Available: {', '.join(results)}")
+    return "\n".join(lines)
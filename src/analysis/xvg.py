@@ -0,0 +1,43 @@
+from pathlib import Path
+import numpy as np
+
+
+def write_xvg(path: str | Path, x, columns, title: str, xlabel: str, ylabel: str, legends=None) -> None:
+    """
+    Write data in the Grace .xvg format produced by the GROMACS analysis tools.
+
+    Args:
+        path: output file.
+        x: values of the first column (time or residue number).
+        columns: one array per y column, or a single array.
+        title, xlabel, ylabel: plot labels.
+        legends: optional legend for each y column.
+    """
+    x = np.asarray(x)
+    columns = np.atleast_2d(np.asarray(columns, dtype=float))  # (n_columns, len(x))
+
+    lines = [
+        "# Created by DynaMate trajectory analysis",
+        f'@    title "{title}"',
+        f'@    xaxis  label "{xlabel}"',
+        f'@    yaxis  label "{ylabel}"',
+        "@TYPE xy",
+    ]
+    if legends:
+        lines.append("@ view 0.15, 0.15, 0.75, 0.85")
+        lines.append("@ legend on")
+        lines.extend(f'@ s{i} legend "{legend}"' for i, legend in enumerate(legends))
+    for i, value in enumerate(x):
+        first = f"{value:10d}" if np.issubdtype(x.dtype, np.integer) else f"{value:12.7f}"
+        lines.append(first + "".join(f"  {y:12.7f}" for y in columns[:, i]))
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def read_xvg(path: str | Path) -> np.ndarray:
+    """Numeric data of an .xvg file as a 2D array (one row per data line), skipping the # and @ header lines."""
+    rows = []
+    for line in Path(path).read_text(encoding="utf-8", errors="replace").splitlines():
+        if line.startswith(("#", "@")) or not line.strip():
+            continue
+        rows.append([float(v) for v in line.split()])
+    return np.array(rows)
@@ -4,6 +4,25 @@ MAX_CHARACTERS_TO_LOG = 5000
 SUMMARY_OUTPUT_TOKENS = 6000
 MAX_CONTEXT_TOKENS = 32000
 PAPER_DIR = Path(__file__).resolve().parent.parent / "my_papers"
+PAPER_INDEX_DIR = PAPER_DIR / ".paper_index"  # versioned paperqa index of PAPER_DIR with its content-hash manifest
+PAPER_INGEST_WORKERS = 8  # PDFs parsed and embedded concurrently when the index is updated
+# Persistent cache of search_papers answers, keyed by the normalized query, the index version and the query settings.
+# With PAPER_CACHE_SIMILARITY, a question differing from a cached one only by stopwords (e.g. "the", "of"), word order
+# or plural endings, and sharing at least this fraction of its words (Jaccard index), reuses its answer. Questions
+# differing by any other word (residue, ligand or PDB ID...) never share answers. None for exact matches only
+PAPER_CACHE_FILE = PAPER_INDEX_DIR / "query_cache.sqlite"
+PAPER_CACHE_MAX_ENTRIES = 1000
+PAPER_CACHE_SIMILARITY = None
+# Retrieval backend of search_papers: "paperqa" (remote embeddings and LLM) or "local" (src.tools.local_index: local
+# embedding model and on-disk vector index, exact top-k search; only the optional answer synthesis uses the LLM)
+PAPER_SEARCH_BACKEND = "paperqa"
+LOCAL_EMBEDDING_MODEL = "hashing"  # "hashing" (no dependency) or a sentence-transformers model name or directory
+LOCAL_EMBEDDING_DIM = 4096  # dimension of the "hashing" embedding
+LOCAL_EMBEDDING_BATCH = 64  # chunks embedded per batch
+LOCAL_CHUNK_SIZE = 800  # characters
+LOCAL_CHUNK_OVERLAP = 100
+LOCAL_TOP_K = 8  # passages retrieved per query
+LOCAL_SYNTHESIZE_ANSWER = True  # False: return the passages without any LLM call
 MODEL_NAME = "openrouter/openai/gpt-4.1-2025-04-14"
 TEMPERATURE = 0.1
 
@@ -16,4 +35,79 @@ DATA_DIR = Path(__file__).resolve().parent.parent / "sandbox"
 AGENT_LOGS = Path(__file__).resolve().parent.parent / "agent_logs"
 JSON_LOG_FILE = AGENT_LOGS / "agent_runs.jsonl"
 
-MMPBSA_ENV_DIR = Path("/path/to/your/envs/mmpbsa")
\ No newline at end of file
+MMPBSA_ENV_DIR = Path("/path/to/your/envs/mmpbsa")
+MMPBSA_WORKERS = None  # concurrent gmx_MMPBSA processes over chunks of frames; None = all available cores
+# Adaptive MMPBSA sampling: MMPBSA_ADAPTIVE_INITIAL_FRAMES evenly spaced frames first, then the stride is halved
+# until the standard error of ΔG_bind (kcal/mol) reaches MMPBSA_TARGET_SEM or the sampled frames are correlated
+MMPBSA_ADAPTIVE = False
+MMPBSA_ADAPTIVE_INITIAL_FRAMES = 16
+MMPBSA_TARGET_SEM = 0.5
+MMPBSA_ADAPTIVE_MAX_INEFFICIENCY = 2.0
+# Tiered ranking of several runs: generalized Born for all of them, Poisson-Boltzmann for the MMPBSA_ESCALATE_TOP best
+# and for those whose GB estimate is within MMPBSA_ESCALATE_SIGMAS standard errors of the last of them
+MMPBSA_ESCALATE_TOP = 3
+MMPBSA_ESCALATE_SIGMAS = 2.0
+MMPBSA_DATABASE = DATA_DIR / "binding_energies.sqlite"  # binding free energies of all the runs, keyed by PDB ID, ligand, temperature and run
+
+# Solvent box built by tleap: "octahedron" (solvateoct) or "rectangular" (solvatebox), and the solute-to-edge buffer in Å
+BOX_SHAPE = "octahedron"
+SOLVENT_BUFFER = 16.0
+REFERENCE_SOLVENT_BUFFER = 16.0  # buffer of the historical rectangular box, used as the baseline in the solvation report
+
+# Integration timestep (ps) for production MD, with and without hydrogen mass repartitioning (HMR)
+MD_TIMESTEP = 0.002
+HMR_TIMESTEP = 0.004
+HMR_HYDROGEN_MASS = 3.024  # amu, hydrogen mass after repartitioning (water hydrogens are left untouched)
+MD_OUTPUT_INTERVAL = 10.0  # ps between energy/log/coordinate outputs in production MD
+
+# Production output policy: "full" writes the whole system to md.xtc, "reduced" writes only protein(+ligand)
+# to md.xtc and keeps sparse full-system snapshots in md.trr (restarts use md.cpt)
+PRODUCTION_OUTPUT_POLICY = "full"
+ANALYSIS_TARGET_FRAMES = 1000  # frames in the reduced analysis trajectory
+ANALYSIS_MIN_FRAME_INTERVAL = 1.0  # ps, finer sampling does not help the standard analyses
+FULL_SYSTEM_FRAMES = 10  # full-system frames kept in md.trr in reduced mode
+
+# Energy minimization: steepest descent removes clashes in segments of EM_SD_STEPS steps, until the maximum force
+# drops below EM_TOLERANCE (kJ/mol/nm) or progress slows (Fmax lowered by less than EM_SD_MIN_PROGRESS over a
+# segment, at most EM_SD_MAX_SEGMENTS segments); conjugate gradient (with flexible water) then takes over.
+# EM_MAX_STEPS is the step budget of the whole minimization (and of the former single-stage steepest descent)
+EM_TOLERANCE = 1000.0
+EM_SD_STEPS = 500
+EM_SD_MAX_SEGMENTS = 10
+EM_SD_MIN_PROGRESS = 0.1
+EM_MAX_STEPS = 50000
+
+# Trajectory analysis is split into blocks of frames analysed on a process pool. Blocks are fixed by
+# ANALYSIS_BLOCK_FRAMES (not by the worker count), so results are identical for any number of workers.
+ANALYSIS_BLOCK_FRAMES = 250
+ANALYSIS_WORKERS = None  # None = all available cores
+
+# On-the-fly analysis of md.xtc while mdrun is running: new frames are analysed every LIVE_ANALYSIS_INTERVAL
+# seconds and the run is flagged as unstable past these limits (the run itself is never stopped)
+LIVE_ANALYSIS_INTERVAL = 30.0  # s
+LIVE_MAX_RMSD = 0.5  # nm, backbone RMSD to the first frame
+LIVE_MAX_RG_CHANGE = 0.15  # relative change of the protein radius of gyration
+LIVE_LIGAND_CONTACT = 0.8  # nm, ligand flagged as unbound if no protein atom is closer
+
+# Conformational clustering of md_noPBC.xtc (RMSD of Cα + ligand heavy atoms after a Cα fit). GROMOS clustering
+# on sparse neighbour lists up to CLUSTER_EXACT_MAX_FRAMES frames, incremental leader clustering beyond
+CLUSTER_CUTOFF = 0.2  # nm
+CLUSTER_EXACT_MAX_FRAMES = 20000
+CLUSTER_MAX_NEIGHBOR_PAIRS = 50_000_000  # neighbour list budget of GROMOS clustering (int32 indices)
+CLUSTER_BLOCK_ELEMENTS = 16_000_000  # pairwise RMSD entries computed per block
+CLUSTER_PDB_COUNT = 10  # medoid structures written for the most populated clusters
+
+# Essential dynamics: incremental PCA of the fitted backbone coordinates, updated in batches of PCA_BATCH_FRAMES frames
+PCA_COMPONENTS = 10  # modes reported and projected
+PCA_BATCH_FRAMES = 64
+
+# Summaries of analysis_results.npz given to the agent: trend points and convergence blocks per time series
+SUMMARY_POINTS = 10
+SUMMARY_BLOCKS = 5
+SUMMARY_TOP_RESIDUES = 5
+
+# Convergence of the production run (src.analysis.convergence): an observable is converged with at least
+# CONVERGENCE_MIN_SAMPLES effective (uncorrelated) samples after an initial transient of at most
+# CONVERGENCE_MAX_EQUILIBRATION_FRACTION of the run
+CONVERGENCE_MIN_SAMPLES = 20
+CONVERGENCE_MAX_EQUILIBRATION_FRACTION = 0.5
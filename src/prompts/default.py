@@ -23,7 +23,8 @@ MD_SYSTEM_PROMPT = """You are an MD execution assistant. You have access to tool
             Next, equilibrate with short NVT and NPT runs.
             Finally, perform the production run. Use a default of 0.1 ns unless the user specifies otherwise.
             After production run is complete, perform a basic analysis of the trajectory including RMSD, RMSF calculations, radius of gyration, and hydrogen bond analysis.
-            The analysis of these plots should be saved as a text file named "analysis.txt" in the sandbox directory.
+            Then cluster the trajectory to extract representative conformations.
+            The analysis of these plots should be saved as a text file named "analysis.txt" in the sandbox directory. Base it on the summary of the analysis results (summarize_analysis tool) rather than on the raw .xvg files. Report whether the production run was long enough to converge, and the recommended extension if it was not.
 
             If any step fails, retry after analyzing the provided error message and make
             corrections to the inputs for the current step.
@@ -24,13 +24,59 @@ else
 fi
 
 #------- ENERGY MINIMISATION ------------
+# Stage 1: steepest descent (em_sd.mdp) to remove clashes, in segments em_sd_1, em_sd_2... continuing from each
+# other, until Fmax < emtol or progress slows: Fmax lowered by less than EM_SD_MIN_PROGRESS (fraction) over a segment.
+# Finished segments are kept, so an interrupted stage resumes; the last one is copied to em_sd.gro/.tpr/.edr
+SD_MAX_SEGMENTS=${EM_SD_MAX_SEGMENTS:-10}
+SD_MIN_PROGRESS=${EM_SD_MIN_PROGRESS:-0.1}
+if ! ls em.gro 1> /dev/null 2>&1 && ! ls em_sd.gro 1> /dev/null 2>&1; then
+	SD_INPUT=$INPUT_GRO
+	PREV_FMAX=""
+	for SEG in $(seq 1 $SD_MAX_SEGMENTS); do
+		if ! ls em_sd_$SEG.gro 1> /dev/null 2>&1; then
+			$GMX grompp -f em_sd.mdp -c $SD_INPUT -p topol.top -o em_sd_$SEG.tpr >> $LOG_FILE 2>&1
+			$GMX mdrun -v -deffnm em_sd_$SEG >> $LOG_FILE 2>&1
+			if [ ! -f em_sd_$SEG.gro ]; then
+				echo "Error: Failed to create 'em_sd_$SEG.gro'" >> $LOG_FILE 2>&1
+				exit 1
+			fi
+		fi
+		SD_INPUT=em_sd_$SEG.gro
+		LAST_SEG=$SEG
+		if grep -q "converged to Fmax" em_sd_$SEG.log; then
+			break
+		fi
+		FMAX=$(grep "Maximum force" em_sd_$SEG.log | tail -1 | awk '{print $4}')
+		if [ -n "$PREV_FMAX" ] && awk -v p="$PREV_FMAX" -v f="$FMAX" -v m="$SD_MIN_PROGRESS" 'BEGIN { exit !(f > p * (1 - m)) }'; then
+			echo "Steepest descent slowed down (Fmax $PREV_FMAX -> $FMAX in segment $SEG), switching to conjugate gradient." >> $LOG_FILE 2>&1
+			break
+		fi
+		PREV_FMAX=$FMAX
+	done
+
+	for ext in gro tpr edr; do
+		cp em_sd_$LAST_SEG.$ext em_sd.$ext
+	done
+	for SEG in $(seq 1 $LAST_SEG); do
+		cat em_sd_$SEG.log
+	done > em_sd.log
+	echo "'em_sd.gro' created after $LAST_SEG steepest-descent segment(s)" >> $LOG_FILE 2>&1
+fi
+
+# Stage 2: conjugate gradient (em.mdp) from the steepest-descent structure, unless it already converged
 if ! ls em.gro 1> /dev/null 2>&1; then
-	$GMX grompp -f em.mdp -c $INPUT_GRO -p topol.top -o em.tpr >> $LOG_FILE 2>&1
-	$GMX mdrun -v -deffnm em >> $LOG_FILE 2>&1
+	if grep -q "converged to Fmax" em_sd.log; then
+		echo "Steepest descent converged, skipping conjugate gradient." >> $LOG_FILE 2>&1
+		for ext in gro tpr edr; do
+			cp em_sd.$ext em.$ext
+		done
+	else
+		$GMX grompp -f em.mdp -c em_sd.gro -p topol.top -o em.tpr >> $LOG_FILE 2>&1
+		$GMX mdrun -v -deffnm em >> $LOG_FILE 2>&1
+	fi
 
 	if [ -f em.gro ]; then
 	        echo "'em.gro' created"
-		echo "11 0" | $GMX energy -f em.edr -o potential.xvg >> $LOG_FILE 2>&1
 	else
 		echo "Error: Failed to create 'em.gro'" >> $LOG_FILE 2>&1
 		exit 1
@@ -161,71 +207,23 @@ else
 	fi
 fi
 
-#------ Update Water_and_ions is no ions present -----
-if ! grep -q "Cl-" index.ndx && ! grep -q "Na+" index.ndx; then
-	nvt_file="nvt.mdp"
-	npt_file="npt.mdp"
-	original="Protein Water_and_ions"
-	
-	if [ -n "$LIGNAME" ]; then
-		replacement="Protein_$LIGNAME Water"
-		if grep "Protein_$LIGNAME" index.ndx; then
-			echo "Protein_$LIGNAME already in index.ndx" >> $LOG_FILE 2>&1
-		else
-			echo -e "1 | 13\nq" | $GMX make_ndx -f em.gro -n index.ndx -o index.ndx >> $LOG_FILE 2>&1
-		fi
-	else
-		replacement="Protein Water"
-	fi
-	
-    if grep "$original" "$nvt_file"; then
-		sed -i "s|$original|$replacement|" "$nvt_file"
-		echo "$replacement added successfully to tc-grps group in $nvt_file." >> $LOG_FILE 2>&1
-	else
-		echo "tc-grps line was not found in $nvt_file." >> $LOG_FILE 2>&1
-	fi
-
-	if grep "$original" "$npt_file"; then
-		sed -i "s|$original|$replacement|" "$npt_file"
-		echo "$replacement added successfully to tc-grps group in $npt_file." >> $LOG_FILE 2>&1
+#------ Create Protein_ligand group used as tc-grps -----
+if [ -n "$LIGNAME" ]; then
+	if grep -q "Protein_$LIGNAME" index.ndx; then
+		echo "Protein_$LIGNAME already in index.ndx" >> $LOG_FILE 2>&1
 	else
-		echo "tc-grps line was not found in $npt_file." >> $LOG_FILE 2>&1
+		echo -e "1 | 13\nq" | $GMX make_ndx -f em.gro -n index.ndx -o index.ndx >> $LOG_FILE 2>&1
 	fi
-
-else
-	echo "Ions present. Keeping Water_and_ions group." >> $LOG_FILE 2>&1
 fi
-#-------- UPDATE TEMP GROUPS NPT, NVT, MD.MDP FILES if there are ions -----
-
-if grep -q "Cl-" index.ndx || grep -q "Na+" index.ndx; then
-	if [ -n "$LIGNAME" ]; then	
-		nvt_file="nvt.mdp"
-		npt_file="npt.mdp"
-
-		original="Protein Water_and_ions"
-		replacement="Protein_$LIGNAME Water_and_ions"
-		
-		if grep "Protein_$LIGNAME" index.ndx; then
-			echo "Protein_$LIGNAME already in index.ndx" >> $LOG_FILE 2>&1
-		else
-			echo -e "1 | 13\nq" | $GMX make_ndx -f em.gro -n index.ndx -o index.ndx >> $LOG_FILE 2>&1
-		fi
 
-		if grep "$original" "$nvt_file"; then
-			sed -i "s|$original|$replacement|" "$nvt_file"
-			echo "Protein_$LIGNAME added successfully to tc-grps group in $nvt_file." >> $LOG_FILE 2>&1
-		else
-			echo "tc-grps line "Protein Water_and_ions" was not found in $nvt_file." >> $LOG_FILE 2>&1
-		fi
-
-		if grep "$original" "$npt_file"; then
-			sed -i "s|$original|$replacement|" "$npt_file"
-			echo "Protein_$LIGNAME added successfully to tc-grps group in $npt_file." >> $LOG_FILE 2>&1
-		else
-			echo "tc-grps line "Protein Water_and_ions" was not found in $npt_file." >> $LOG_FILE 2>&1
-		fi
+#------ Check that the tc-grps written in nvt.mdp and npt.mdp exist -----
+for group in $(grep -E "^tc-grps" nvt.mdp npt.mdp | cut -d "=" -f 2 | cut -d ";" -f 1 | tr ' ' '\n' | sort -u); do
+	if ! grep -q "\[ $group \]" index.ndx; then
+		echo "Error: tc-grps group '$group' is missing from index.ndx" >> $LOG_FILE 2>&1
+		exit 1
 	fi
-fi
+done
+
 #--------------- NVT --------------------
 
 if ! ls nvt.gro 1> /dev/null 2>&1; then
@@ -235,7 +233,6 @@ if ! ls nvt.gro 1> /dev/null 2>&1; then
         
 	if [ -f nvt.gro ]; then
 	    echo "'nvt.gro' created" >> $LOG_FILE 2>&1
-		echo -e "Temperature \n 0" | $GMX energy -f nvt.edr -o temperature.xvg >> $LOG_FILE 2>&1
 	else
 		echo "Error: Failed to create 'nvt.gro'" >> $LOG_FILE 2>&1
 		exit 1
@@ -251,8 +248,6 @@ if ! ls npt.gro 1> /dev/null 2>&1; then
 
 	if [ -f npt.gro ]; then
 	    echo "'npt.gro' created" >> $LOG_FILE 2>&1
-		echo -e "Pressure \n 0" | $GMX energy -f npt.edr -o pressure.xvg >> $LOG_FILE 2>&1
-		echo -e "Density \n 0" | $GMX energy -f npt.edr -o density.xvg >> $LOG_FILE 2>&1
 	else
 		echo "Error: Failed to create 'npt.gro'" >> $LOG_FILE 2>&1
 		exit 1
@@ -18,61 +18,22 @@ else
     LIGNAME=""
 fi
 
-#------- EDIT MD.MDP FILE ------------
-
-# if no ions are present, update md.mdp such that Water_and_ions group is changed to Water only
-# if ligand, Protein Water becomes Protein_ligand Water
-if ! grep -q "Cl-" index.ndx && ! grep -q "Na+" index.ndx; then
-	md_file="md.mdp"
-    original="Protein Water_and_ions"
-	
-	if [ -n "$LIGNAME" ]; then
-		replacement="Protein_$LIGNAME Water"
-		if grep "Protein_$LIGNAME" index.ndx; then
-			echo "Protein_$LIGNAME already in index.ndx"
-		else
-			echo -e "1 | 13\nq" | $GMX make_ndx -f em.gro -n index.ndx -o index.ndx
-		fi
-	else
-		replacement="Protein Water"
-	fi
-
-	if grep "$original" "$md_file"; then
-		sed -i "s|$original|$replacement|" "$md_file"
-		echo "$replacement added successfully to tc-grps group in $md_file."
-	else
-		echo "tc-grps line was not found in $md_file."
-	fi
-else
-	echo "Ions present. Keeping Water_and_ions group."
-fi
-
-# if ions are present, but ligand exists, update md.mdp accordingly
-if grep -q "Cl-" index.ndx || grep -q "Na+" index.ndx; then
-    if [ -n "$LIGNAME" ]; then	
-        md_file="md.mdp" 
-
-        original="Protein Water_and_ions"
-        replacement="Protein_$LIGNAME Water_and_ions"
-        
-        if grep "Protein_$LIGNAME" index.ndx; then
-            echo "Protein_$LIGNAME already in index.ndx"
-        else
-            echo -e "1 | 13\nq" | $GMX make_ndx -f em.gro -n index.ndx -o index.ndx
-        fi
-
-        if grep "$original" "$md_file"; then
-            sed -i "s|$original|$replacement|" "$md_file"
-            echo "Protein_$LIGNAME added successfully to tc-grps group in $md_file."
-        else
-            echo "tc-grps line "Protein Water_and_ions" was not found in $md_file."
-        fi
-    fi
-fi
-
 #------- PRODUCTION MD ------------
 if ! ls md.gro 1> /dev/null 2>&1; then
     $GMX grompp -f md.mdp -c $INPUT_GRO -t $NPT_CPT_FILE -p topol.top -n index.ndx -o md.tpr >> $LOG_FILE 2>&1
+
+    #------- SOLUTE-ONLY RUN INPUT (reduced output policy) ------------
+    # md.xtc only holds the compressed-x-grps group, so analysis needs a run input with the same atoms.
+    # It is written before mdrun so that md.xtc can be analysed while it is being written
+    SOLUTE_GROUP=$(grep -E "^compressed-x-grps" md.mdp | cut -d "=" -f 2 | awk '{print $1}')
+    if [ -n "$SOLUTE_GROUP" ]; then
+        echo "$SOLUTE_GROUP" | $GMX convert-tpr -s md.tpr -n index.ndx -o md_solute.tpr >> $LOG_FILE 2>&1
+        echo "'md_solute.tpr' created for the $SOLUTE_GROUP-only trajectory md.xtc" >> $LOG_FILE 2>&1
+    else
+        # Full-system md.xtc: a solute-only run input left by an earlier reduced run would no longer match it
+        rm -f md_solute.tpr
+    fi
+
     echo "y" | $GMX mdrun -v -deffnm md >> $LOG_FILE 2>&1
 else
     echo "'md.gro' already exists. Skipping production MD."
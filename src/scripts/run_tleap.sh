@@ -1,14 +1,30 @@
 #!/bin/bash
-# Usage: ./run_tleap.sh input.pdb
+# Usage: ./run_tleap.sh sandbox_dir input.pdb pdb_id [box_shape] [buffer] [align]
 
-if [ $# -ne 3 ]; then
-    echo "Usage: $0 sandbox_dir input.pdb pdb_id"
+if [ $# -lt 3 ]; then
+    echo "Usage: $0 sandbox_dir input.pdb pdb_id [box_shape (octahedron|rectangular)] [buffer (Å)] [align (1|0)]"
     exit 1
 fi
 
 SANDBOX_DIR=$1
 PDBFILE=$2
 PDB_ID=$3
+BOX_SHAPE=${4:-octahedron}
+BUFFER=${5:-16}
+ALIGN=${6:-1}
+
+# Rotate the solute onto its principal axes so that the box wraps it with minimal volume
+if [ "$ALIGN" -eq 1 ]; then
+    ALIGN_CMD="alignaxes mol"
+else
+    ALIGN_CMD=""
+fi
+
+if [ "$BOX_SHAPE" = "octahedron" ]; then
+    SOLVATE_CMD="solvateoct mol TIP3PBOX ${BUFFER}"
+else
+    SOLVATE_CMD="solvatebox mol TIP3PBOX ${BUFFER}"
+fi
 
 # Create tleap input file
 cat > leap.in << EOF
@@ -19,7 +35,8 @@ source leaprc.water.tip3p
 addPdbAtomMap { { "CH3"  "C" } { "HH31" "H1" } { "HH32" "H2" } { "HH33" "H3" } }
 
 mol = loadpdb ${SANDBOX_DIR}/${PDBFILE}
-solvatebox mol TIP3PBOX 16
+${ALIGN_CMD}
+${SOLVATE_CMD}
 addions mol Cl- 0 # Neutralize system
 addions mol Na+ 0 # Neutralize system
 
@@ -38,4 +55,4 @@ if [ $? -ne 0 ]; then
     echo "tleap failed to generate output files."
 else
     echo "${PDBFILE} processed. Generated ${PDB_ID}.prmtop, ${PDB_ID}.inpcrd, and ${PDB_ID}_tleap.pdb."
-fi
\ No newline at end of file
+fi
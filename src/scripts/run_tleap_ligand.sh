@@ -1,8 +1,8 @@
 #!/bin/bash
-# Usage: ./run_tleap.sh input.pdb
+# Usage: ./run_tleap_ligand.sh sandbox_dir complex_pdb frcmod_file prepi_file [box_shape] [buffer] [align]
 
-if [ $# -ne 4 ]; then
-    echo "Usage: $0 sandbox_dir complex_pdb frcmod_file prepi_file"
+if [ $# -lt 4 ]; then
+    echo "Usage: $0 sandbox_dir complex_pdb frcmod_file prepi_file [box_shape (octahedron|rectangular)] [buffer (Å)] [align (1|0)]"
     exit 1
 fi
 
@@ -10,6 +10,22 @@ SANDBOX_DIR=$1 # PDBFILE already has sandbox path
 PDBFILE=$2
 FRCMOD_FILE=$3
 PREPI_FILE=$4
+BOX_SHAPE=${5:-octahedron}
+BUFFER=${6:-16}
+ALIGN=${7:-1}
+
+# Rotate the solute onto its principal axes so that the box wraps it with minimal volume
+if [ "$ALIGN" -eq 1 ]; then
+    ALIGN_CMD="alignaxes mol"
+else
+    ALIGN_CMD=""
+fi
+
+if [ "$BOX_SHAPE" = "octahedron" ]; then
+    SOLVATE_CMD="solvateoct mol TIP3PBOX ${BUFFER}"
+else
+    SOLVATE_CMD="solvatebox mol TIP3PBOX ${BUFFER}"
+fi
 
 # Create tleap input file
 cat > leap.in << EOF
@@ -26,7 +42,8 @@ loadamberparams ${SANDBOX_DIR}/${FRCMOD_FILE}
 
 # PDBFILE already has sandbox path
 mol = loadpdb ${PDBFILE}
-solvatebox mol TIP3PBOX 16
+${ALIGN_CMD}
+${SOLVATE_CMD}
 addions mol Cl- 0 # Neutralize system
 addions mol Na+ 0 # Neutralize system
 
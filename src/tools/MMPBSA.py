@@ -1,23 +1,62 @@
+import csv
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import subprocess, shlex
+import numpy as np
+import MDAnalysis as mda
+from MDAnalysis.lib.formats.libmdaxdr import XTCFile  # type: ignore
 from tkinter import constants
 import parmed as pmd # type: ignore
 import sys
 import re
 import os
 from src import constants
+from src.analysis import TrajectoryCache
+from src.analysis.convergence import statistical_inefficiency
+from src.tools.mmpbsa_results import parse_energy_csv, record_mmpbsa_results
 
-def run_gmxMMPBSA(sandbox_dir: str, pdb_id: str, nsteps:str, nstxout_compressed:str, md_temp:str) -> str:
-    nframes=int(nsteps)/int(nstxout_compressed)
-    os.makedirs(f"{sandbox_dir}/gmx_MMPBSA", exist_ok=True)
-    MMPBSA_dir=f"{sandbox_dir}/gmx_MMPBSA"
-    mmpbsa_infile = open(f"{MMPBSA_dir}/mmpbsa.in", 'w' )
-    mmpbsa_infile.write(f'''&general
+MMPBSA_FRAME_INTERVAL = 5  # every 5th frame of md_noPBC.xtc
+MMPBSA_DIRS = {"pb": "gmx_MMPBSA", "gb": "gmx_MMPBSA_GB"}  # output directory of each solvation model
+
+def _read_mdp_value(mdp_file: Path, key: str) -> str | None:
+    """Return the value of a key in an .mdp file, or None if the key or file is missing."""
+    if not mdp_file.exists():
+        return None
+    for line in mdp_file.read_text(encoding="utf-8", errors="replace").splitlines():
+        entry = line.split(";")[0]
+        if "=" not in entry:
+            continue
+        name, value = entry.split("=", 1)
+        if name.strip().replace("_", "-") == key:
+            return value.strip()
+    return None
+
+
+def _write_mmpbsa_input(path, pdb_id: str, nframes, interval: int, md_temp, method: str = "pb") -> None:
+    """mmpbsa.in for the Poisson-Boltzmann (method="pb") or the generalized Born (method="gb") model."""
+    with open(path, "w") as mmpbsa_infile:
+        if method == "gb":
+            mmpbsa_infile.write(f'''&general
 sys_name={pdb_id}
 startframe=1
 endframe={int(float(nframes))}
-interval=5
+interval={interval}
+temperature={int(float(md_temp))}
+verbose=2
+/
+&gb
+  igb                  = 5                                              # GB model (OBC2)
+  saltcon              = 0.0                                            # Salt concentration (M), as istrng of the PB model
+/
+''')
+            return
+        mmpbsa_infile.write(f'''&general
+sys_name={pdb_id}
+startframe=1
+endframe={int(float(nframes))}
+interval={interval}
 temperature={int(float(md_temp))}
 verbose=2
 /
@@ -67,12 +106,279 @@ verbose=2
   npbverb              = 0                                             # Option to turn on verbose mode
 /
 ''')
-    mmpbsa_infile.close()
+
+
+# Molecule names of the solvent and ions in topol.top, never part of the complex
+SOLVENT_MOLECULES = {"SOL", "WAT", "HOH", "TIP3", "NA", "CL", "K", "MG", "ZN", "CA", "Na+", "Cl-", "K+"}
+
+
+def read_index_groups(index_file) -> dict[str, np.ndarray]:
+    """Groups of a GROMACS index file in file order (the order of the -cg group numbers): {name: 0-based atom indices}."""
+    groups, name = {}, None
+    for line in Path(index_file).read_text(encoding="utf-8", errors="replace").splitlines():
+        line = line.split(";")[0].strip()
+        if line.startswith("["):
+            name = line.strip("[] ")
+            groups[name] = []
+        elif line and name is not None:
+            groups[name].extend(int(a) - 1 for a in line.split())
+    return {name: np.array(atoms, dtype=np.int64) for name, atoms in groups.items()}
+
+
+def resolve_groups(groups: dict[str, np.ndarray], ligand_name=None) -> tuple[str, str]:
+    """
+    Names of the receptor and ligand groups of an index file: "Protein", and the group named after the ligand
+    residue (as created by make_ndx), else "Other".
+    """
+    if "Protein" not in groups:
+        raise ValueError(f"no Protein group in the index file (groups: {', '.join(groups)})")
+    for name in (ligand_name, "Other"):
+        if name and name in groups and len(groups[name]) and not np.isin(groups[name], groups["Protein"]).any():
+            return "Protein", name
+    raise ValueError(f"no ligand group {ligand_name or ''} or Other in the index file (groups: {', '.join(groups)})")
+
+
+def write_complex_topology(topol_file, n_atoms: int, output) -> Path:
+    """
+    Copy of topol.top whose [ molecules ] section keeps only the leading molecules making up the first n_atoms atoms
+    (receptor and ligand, without solvent and ions). Atom counts of the molecule types are read from topol.top and
+    the .itp files it includes from its directory.
+    """
+    topol_file = Path(topol_file)
+    counts = {}
+
+    def count_atoms(path: Path):
+        moltype, section = None, None
+        for line in path.read_text(encoding="utf-8", errors="replace").splitlines():
+            entry = line.split(";")[0].strip()
+            if entry.startswith("#include"):
+                include = topol_file.parent / entry.split(None, 1)[1].strip('"<> ')
+                if include.exists():
+                    count_atoms(include)
+            elif entry.startswith("["):
+                section = entry.strip("[] ")
+            elif entry and section == "moleculetype":
+                moltype = entry.split()[0]
+                counts[moltype] = 0
+                section = None
+            elif entry and section == "atoms" and moltype is not None and not entry.startswith("#"):
+                counts[moltype] += 1
+
+    count_atoms(topol_file)
+    lines = topol_file.read_text(encoding="utf-8", errors="replace").splitlines()
+    start = max(i for i, line in enumerate(lines) if line.split(";")[0].strip().replace(" ", "") == "[molecules]")
+    kept, total = lines[:start + 1], 0
+    for line in lines[start + 1:]:
+        fields = line.split(";")[0].split()
+        if len(fields) < 2 or total >= n_atoms:
+            if len(fields) < 2:
+                kept.append(line)
+            continue
+        name, number = fields[0], int(fields[1])
+        if name in SOLVENT_MOLECULES or name not in counts:
+            raise ValueError(f"{topol_file.name}: molecule {name} ({'solvent or ion' if name in counts else 'unknown atom count'}) "
+                             f"before the end of the complex at atom {n_atoms}")
+        take = min(number, (n_atoms - total) // max(counts[name], 1))
+        kept.append(f"{name:<20}{take}")
+        total += take * counts[name]
+    if total != n_atoms:
+        raise ValueError(f"{topol_file.name}: the leading molecules do not add up to the {n_atoms} complex atoms ({total})")
+    Path(output).write_text("\n".join(kept) + "\n", encoding="utf-8")
+    return Path(output)
+
+
+def prepare_complex(sandbox_dir: str, tpr_file: str, cache: TrajectoryCache, frames, output_dir, ligand_name=None) -> dict:
+    """
+    Inputs of gmx_MMPBSA reduced to the receptor-ligand complex, resolved by name from index.ndx: the given frames of
+    md_noPBC.xtc with only the complex atoms (md_complex.xtc, from the solute coordinate cache of the analysis when
+    it covers the complex, with the box of each frame read from its XTC header), the complex structure (complex.pdb, from tpr_file), an index with the receptor and ligand
+    as groups 0 and 1 (complex.ndx) and topol.top without solvent and ions (topol_complex.top). gmx_MMPBSA then
+    reads and strips only the complex, and its I/O and memory scale with the solute. Raises ValueError when the
+    complex is not the first atoms of the system.
+    """
+    groups = read_index_groups(f"{sandbox_dir}/index.ndx")
+    receptor_name, ligand_name = resolve_groups(groups, ligand_name)
+    receptor, ligand = groups[receptor_name], groups[ligand_name]
+    atoms = np.union1d(receptor, ligand)
+    if not np.array_equal(atoms, np.arange(len(atoms))) or len(atoms) > cache.n_atoms:
+        raise ValueError(f"groups {receptor_name} and {ligand_name} are not the first atoms of md_noPBC.xtc")
+    output_dir = Path(output_dir)
+    topology = write_complex_topology(f"{sandbox_dir}/topol.top", len(atoms), output_dir / "topol_complex.top")
+
+    universe = mda.Universe(str(tpr_file))
+    cached = cache.atom_indices()
+    coordinates = cache.coordinates() if cached is not None and np.isin(atoms, cached).all() else None
+    columns = np.searchsorted(cached, atoms) if coordinates is not None else None
+    times = cache.times()
+    trajectory = output_dir / "md_complex.xtc"
+    with XTCFile(str(trajectory), "w") as xtc:
+        for frame in frames:
+            if coordinates is not None:
+                positions, box, time_ps = coordinates[frame, columns], cache.read_box(int(frame)), times[frame]
+            else:
+                positions, box, time_ps = cache.read_frame(int(frame))
+                positions = positions[atoms]
+            xtc.write(positions / 10, box / 10, int(frame), float(time_ps))
+
+    structure = output_dir / "complex.pdb"
+    complex_atoms = universe.atoms[atoms]
+    complex_atoms.positions = coordinates[frames[0], columns] if coordinates is not None else cache.read_frame(int(frames[0]))[0][atoms]
+    complex_atoms.write(str(structure))
+    with open(output_dir / "complex.ndx", "w") as ndx:
+        for name, group in ((receptor_name, receptor), (ligand_name, ligand)):
+            ndx.write(f"[ {name} ]\n")
+            ndx.writelines(" ".join(str(a + 1) for a in group[i:i + 15]) + "\n" for i in range(0, len(group), 15))
+    return {"structure": structure, "trajectory": trajectory, "index": output_dir / "complex.ndx", "topology": topology,
+            "groups": (receptor_name, ligand_name), "n_atoms": len(atoms), "from_cache": coordinates is not None}
+
+
+def merge_energy_csvs(paths, output_csv, output_dat, frames=None, source: str | None = None,
+                      correct_correlation: bool = False) -> int:
+    """
+    Concatenate the per-frame energies of frame chunks into one energy .csv and write the statistics over all frames
+    (average, SD, SEM) in a FINAL_RESULTS_MMPBSA.dat summary. Without frames, rows are kept in chunk order and
+    renumbered as in a single run; with frames (the 0-based md_noPBC.xtc frame of each row, in chunk order), rows are
+    sorted by frame and numbered by it. source describes the chunks in the .dat header. The SEM is SD / sqrt(frames),
+    as in a single gmx_MMPBSA run, or with correct_correlation SD * sqrt(g / frames), g being the statistical
+    inefficiency of each term over the frames in frame order. Returns the number of frames.
+    """
+    chunks = [parse_energy_csv(p) for p in paths]
+    merged = {}
+    for key, (columns, _) in chunks[0].items():
+        rows = [chunk[key][1] for chunk in chunks if key in chunk]
+        table = np.concatenate(rows) if rows else np.zeros((0, len(columns)))
+        if frames is None:
+            table[:, 0] = np.arange(1, len(table) + 1)
+        else:
+            order = np.argsort(frames, kind="stable")
+            table = table[order]
+            table[:, 0] = np.asarray(frames)[order] + 1
+        merged[key] = (columns, table)
+
+    with open(output_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        model = None
+        for (key_model, section), (columns, table) in merged.items():
+            if key_model != model:
+                writer.writerow([f"{key_model}:"])
+                model = key_model
+            writer.writerow([section])
+            writer.writerow(columns)
+            writer.writerows([[int(row[0])] + [f"{v:.2f}" for v in row[1:]] for row in table])
+            writer.writerow([])
+
+    n_frames = max((len(table) for _, table in merged.values()), default=0)
+    sem_definition = ("SEM = SD * sqrt(g / frames), g the statistical inefficiency of the term" if correct_correlation
+                      else "SEM = SD / sqrt(frames)")
+    lines = [f"| Merged from {source or f'{len(paths)} frame chunks run in parallel'} ({n_frames} frames); "
+             f"statistics over all frames, {sem_definition}"]
+    model = None
+    for (key_model, section), (columns, table) in merged.items():
+        if key_model != model:
+            lines += ["", f"{key_model}:"]
+            model = key_model
+        delta = section.lower().startswith("delta")
+        lines += ["", "Delta (Complex - Receptor - Ligand):" if delta else f"{section.split()[0]}:",
+                  f"{'Energy Component':<20}{'Average':>12}{'SD':>12}{'SEM':>12}", "-" * 56]
+        for i, name in enumerate(columns[1:], start=1):
+            values = table[:, i]
+            label = f"Δ{name}" if delta and not name.startswith("Δ") else name
+            sd = values.std() if len(values) else float("nan")
+            g = statistical_inefficiency(values) if correct_correlation else 1.0
+            lines.append(f"{label:<20}{values.mean() if len(values) else float('nan'):>12.2f}{sd:>12.2f}"
+                         f"{sd * np.sqrt(g / max(len(values), 1)):>12.2f}")
+    Path(output_dat).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return n_frames
+
+
+def _run_chunk(cmd: list, chunk_dir: Path) -> int:
+    with open(chunk_dir / "gmx_MMPBSA.out", "w") as out:
+        return subprocess.run(cmd, cwd=chunk_dir, stdout=out, stderr=subprocess.STDOUT, text=True).returncode
+
+
+def run_gmxMMPBSA(sandbox_dir: str, pdb_id: str, nsteps:str, nstxout_compressed:str, md_temp:str, n_workers=None,
+                  adaptive: bool = False, method: str = "pb", ligand_name=None) -> str:
+    """
+    Binding free energy of the ligand with gmx_MMPBSA over every MMPBSA_FRAME_INTERVAL-th frame of md_noPBC.xtc
+    (or adaptively sampled frames), in gmx_MMPBSA/ with the Poisson-Boltzmann model or gmx_MMPBSA_GB/ with the
+    faster generalized Born model (method="gb"). The results are recorded in the binding free energy database
+    (constants.MMPBSA_DATABASE) under the name of sandbox_dir as run ID.
+    """
+    output = _run_gmxMMPBSA(sandbox_dir, pdb_id, nsteps, nstxout_compressed, md_temp, n_workers, adaptive, method, ligand_name)
+    if " failed with return code " in output:
+        return output
+    try:
+        results = record_mmpbsa_results(f"{sandbox_dir}/{MMPBSA_DIRS[method]}", pdb_id, ligand_name, md_temp,
+                                        run_id=Path(sandbox_dir).name, method=method)
+    except Exception as e:
+        return f"{output}\nCould not record the results in {constants.MMPBSA_DATABASE}: {e}"
+    summary = "; ".join(f"ΔG_bind ({r.method.upper()}) = {r.delta_g.average:.2f} ± {r.delta_g.sem:.2f} kcal/mol "
+                        f"(SD {r.delta_g.sd:.2f}, {r.n_frames} frames"
+                        + (f", {len(r.residues)} residues decomposed" if r.residues else "") + ")" for r in results)
+    return f"{output}\nRecorded in {constants.MMPBSA_DATABASE} (run {Path(sandbox_dir).name}): {summary or 'no ΔTOTAL found'}"
+
+
+def _run_gmxMMPBSA(sandbox_dir: str, pdb_id: str, nsteps:str, nstxout_compressed:str, md_temp:str, n_workers=None,
+                   adaptive: bool = False, method: str = "pb", ligand_name=None) -> str:
+    # The production md.mdp is the source of truth for the frame count (its timestep and output
+    # interval change with HMR), so prefer it over the values passed by the agent
+    md_mdp = Path(f"{sandbox_dir}/md.mdp")
+    nsteps = _read_mdp_value(md_mdp, "nsteps") or nsteps
+    nstxout_compressed = _read_mdp_value(md_mdp, "nstxout-compressed") or nstxout_compressed
+    nframes=int(nsteps)/int(nstxout_compressed)
+    MMPBSA_dir=f"{sandbox_dir}/{MMPBSA_DIRS[method]}"
+    os.makedirs(MMPBSA_dir, exist_ok=True)
 
     tpr_file=f"{sandbox_dir}/md.tpr"
-    xtc_file=f"{sandbox_dir}/md_noPBC.xtc"
+    reduced = Path(f"{sandbox_dir}/md_solute.tpr").exists()
+    if reduced:
+        # Reduced output policy: md_noPBC.xtc only holds protein+ligand, which come first in index.ndx
+        tpr_file=f"{sandbox_dir}/md_solute.tpr"
     index_file=f"{sandbox_dir}/index.ndx"
     topol_file=f"{sandbox_dir}/topol.top"
+    groups = ["1", "13"]
+    preparation = ""
+    try:
+        index_groups = read_index_groups(index_file)
+        names = resolve_groups(index_groups, ligand_name)
+        groups = [str(list(index_groups).index(name)) for name in names]
+    except (OSError, ValueError) as e:
+        preparation = f"Receptor and ligand groups not resolved ({e}), using groups 1 and 13 of index.ndx.\n"
+
+    # Pre-slice the frames used by gmx_MMPBSA out of md_noPBC.xtc, reduced to the complex atoms when the complex
+    # can be resolved (else as raw byte copies of the whole frames), so that gmx_MMPBSA only reads the frames and
+    # atoms it needs
+    xtc_file=f"{sandbox_dir}/md_noPBC.xtc"
+    interval=MMPBSA_FRAME_INTERVAL
+    frames, chunks = [], []
+    if Path(xtc_file).exists():
+        cache = TrajectoryCache(xtc_file)
+        frames = list(range(0, cache.n_frames, MMPBSA_FRAME_INTERVAL))
+        try:
+            prepared = prepare_complex(sandbox_dir, tpr_file, cache, frames, MMPBSA_dir, ligand_name)
+        except (OSError, ValueError) as e:
+            if reduced:
+                # The full-system topol.top and index.ndx do not match the solute-only md_solute.tpr and frames
+                return (f"MMPBSA failed with return code 1.\n{preparation}"
+                        f"Complex-only inputs not written ({e}); the solute-only md_noPBC.xtc and md_solute.tpr of the "
+                        f"reduced output policy cannot be run against the full-system topol.top and index.ndx.")
+            xtc_file = f"{MMPBSA_dir}/md_mmpbsa.xtc"
+            cache.extract_frames(frames, xtc_file)
+            preparation += f"Complex-only inputs not written ({e}), gmx_MMPBSA reads the full md_noPBC.xtc frames.\n"
+        else:
+            xtc_file, tpr_file = str(prepared["trajectory"]), str(prepared["structure"])
+            index_file, topol_file, groups = str(prepared["index"]), str(prepared["topology"]), ["0", "1"]
+            preparation += (f"Complex-only inputs: groups {' and '.join(prepared['groups'])} of index.ndx, {prepared['n_atoms']} of "
+                            f"{cache.n_atoms} atoms in md_complex.xtc, complex.pdb, complex.ndx and topol_complex.top.\n")
+            # md_complex.xtc holds the sampled frames only: frames are now positions in it
+            cache, frames = TrajectoryCache(xtc_file), list(range(len(frames)))
+        nframes = len(frames)
+        interval = 1
+        # PB energies are independent per frame: split the frames into contiguous chunks, one gmx_MMPBSA
+        # process each, run concurrently in their own working directories
+        n_workers = n_workers or constants.MMPBSA_WORKERS or os.cpu_count() or 1
+        chunks = _split_frames(frames, n_workers)
+    _write_mmpbsa_input(f"{MMPBSA_dir}/mmpbsa.in", pdb_id, nframes, interval, md_temp, method)
 
     cmd = [
         constants.MMPBSA_ENV_DIR,
@@ -81,13 +387,18 @@ verbose=2
         "-cs", tpr_file,
         "-ct", xtc_file,
         "-ci", index_file,
-        "-cg", "1", "13",
+        "-cg", *groups,
         "-cp", topol_file,
         "-o", "FINAL_RESULTS_MMPBSA.dat",
         "-eo", "FINAL_RESULTS_MMPBSA.csv",
         "-nogui"
     ]
 
+    if adaptive and frames:
+        return preparation + _run_adaptive(cmd, MMPBSA_dir, frames, cache, pdb_id, md_temp, n_workers, method)
+    if len(chunks) > 1:
+        return preparation + _run_chunks(cmd, MMPBSA_dir, chunks, cache, pdb_id, md_temp, method)
+
     result = subprocess.run(cmd, cwd=MMPBSA_dir, stdout=sys.stdout, stderr=sys.stderr, text=True)
 
     MMPBSA_output = ""
@@ -107,6 +418,208 @@ verbose=2
                 f"--- Shell Script Stderr ---\n"
                 f"{result.stderr or 'None captured directly'}")
     else:
-        return (f"MMPBSA complete! Files created: {MMPBSA_dir}/FINAL_RESULTS_MMPBSA.dat and {MMPBSA_dir}/FINAL_RESULTS_MMPBSA.csv."
+        return (f"{preparation}MMPBSA complete! Files created: {MMPBSA_dir}/FINAL_RESULTS_MMPBSA.dat and {MMPBSA_dir}/FINAL_RESULTS_MMPBSA.csv."
                 f"Full gmx_MMPBSA output:\n"
-                f"{MMPBSA_output}")
\ No newline at end of file
+                f"{MMPBSA_output}")
+
+
+def _split_frames(frames, n_workers: int) -> list[np.ndarray]:
+    return [c for c in np.array_split(np.asarray(frames), min(n_workers, len(frames))) if len(c)]
+
+
+def _run_frame_chunks(cmd: list, run_dir: Path, chunks: list, cache: TrajectoryCache, pdb_id: str, md_temp,
+                      method: str = "pb") -> tuple[list[Path], str | None]:
+    """
+    Run one gmx_MMPBSA process per chunk of frames of md_noPBC.xtc concurrently, each in run_dir/chunk_NNN.
+    Returns the chunk directories and an error report if a chunk failed.
+    """
+    chunk_dirs = []
+    for k, chunk in enumerate(chunks):
+        chunk_dir = run_dir / f"chunk_{k:03d}"
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+        cache.extract_frames(chunk, chunk_dir / "md_mmpbsa.xtc")
+        _write_mmpbsa_input(chunk_dir / "mmpbsa.in", pdb_id, len(chunk), 1, md_temp, method)
+        chunk_dirs.append(chunk_dir)
+    chunk_cmd = [str(c) for c in cmd]
+    chunk_cmd[chunk_cmd.index("-ct") + 1] = "md_mmpbsa.xtc"
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        returncodes = list(pool.map(lambda d: _run_chunk(chunk_cmd, d), chunk_dirs))
+
+    for chunk, chunk_dir, returncode in zip(chunks, chunk_dirs, returncodes):
+        if returncode != 0:
+            log_path = chunk_dir / "gmx_MMPBSA.log"
+            chunk_log = log_path.read_text(encoding="utf-8", errors="replace") if log_path.exists() else ""
+            output = (chunk_dir / "gmx_MMPBSA.out").read_text(encoding="utf-8", errors="replace")
+            return chunk_dirs, (f"MMPBSA failed with return code {returncode} in {chunk_dir.name} "
+                                f"(frames {chunk[0]}-{chunk[-1]} of {cache.trajectory.name}).\n"
+                                f"--- Full gmx_MMPBSA Log ---\n"
+                                f"{chunk_log}\n"
+                                f"--- gmx_MMPBSA Output ---\n"
+                                f"{output[-constants.MAX_CHARACTERS_TO_LOG:]}")
+    return chunk_dirs, None
+
+
+def _run_chunks(cmd: list, MMPBSA_dir: str, chunks: list, cache: TrajectoryCache, pdb_id: str, md_temp, method: str = "pb") -> str:
+    """Run gmx_MMPBSA on each chunk of frames concurrently and merge the per-frame energies."""
+    start = time.perf_counter()
+    chunk_dirs, error = _run_frame_chunks(cmd, Path(MMPBSA_dir), chunks, cache, pdb_id, md_temp, method)
+    if error:
+        return error
+
+    dat_file, csv_file = Path(MMPBSA_dir) / "FINAL_RESULTS_MMPBSA.dat", Path(MMPBSA_dir) / "FINAL_RESULTS_MMPBSA.csv"
+    n_frames = merge_energy_csvs([d / "FINAL_RESULTS_MMPBSA.csv" for d in chunk_dirs], csv_file, dat_file)
+    return (f"MMPBSA complete! Files created: {dat_file} and {csv_file}.\n"
+            f"{n_frames} frames in {len(chunks)} chunks run in parallel in {time.perf_counter() - start:.1f} s "
+            f"(per-chunk runs in {MMPBSA_dir}/chunk_*).\n"
+            f"{dat_file.read_text(encoding='utf-8')}")
+
+
+def delta_total(tables: dict) -> np.ndarray:
+    """Per-frame ΔTOTAL (binding free energy) of parsed energy tables, from the first model (PB before GB)."""
+    for (_, section), (columns, table) in tables.items():
+        if section.lower().startswith("delta"):
+            return table[:, [c.lstrip("Δ") for c in columns].index("TOTAL")]
+    raise ValueError("No Delta Energy Terms table with a TOTAL column in the gmx_MMPBSA energy file")
+
+
+def _run_adaptive(cmd: list, MMPBSA_dir: str, frames: list, cache: TrajectoryCache, pdb_id: str, md_temp, n_workers: int,
+                  method: str = "pb") -> str:
+    """
+    Adaptive frame sampling: a coarse, evenly spaced pass first, then passes filling in the midpoints (halving the
+    stride) until the standard error of ΔTOTAL, corrected for the correlation between sampled frames, falls below
+    MMPBSA_TARGET_SEM, the sampled frames become correlated (further passes would add little information) or all
+    frames are used.
+    """
+    start = time.perf_counter()
+    frames = np.asarray(frames)
+    stride = 1
+    while len(frames) // (2 * stride) >= constants.MMPBSA_ADAPTIVE_INITIAL_FRAMES:
+        stride *= 2
+    done = np.zeros(len(frames), dtype=bool)
+    csvs, csv_frames, lines = [], [], []
+    level = 0
+    while True:
+        new = frames[np.arange(0, len(frames), stride)[~done[::stride]]]
+        chunks = _split_frames(new, n_workers)
+        chunk_dirs, error = _run_frame_chunks(cmd, Path(MMPBSA_dir) / f"pass_{level}", chunks, cache, pdb_id, md_temp, method)
+        if error:
+            return error
+        done[::stride] = True
+        csvs += [d / "FINAL_RESULTS_MMPBSA.csv" for d in chunk_dirs]
+        csv_frames += [int(f) for c in chunks for f in c]
+
+        order = np.argsort(csv_frames, kind="stable")
+        delta = np.concatenate([delta_total(parse_energy_csv(p)) for p in csvs])[order]
+        g = statistical_inefficiency(delta)
+        sem = delta.std() * np.sqrt(g / len(delta))
+        lines.append(f"- pass {level}: every {stride * MMPBSA_FRAME_INTERVAL}th frame of md_noPBC.xtc, {len(delta)} frames, "
+                     f"ΔTOTAL = {delta.mean():.2f} ± {sem:.2f} kcal/mol (statistical inefficiency {g:.2f})")
+        if sem <= constants.MMPBSA_TARGET_SEM:
+            reason = f"standard error below the {constants.MMPBSA_TARGET_SEM} kcal/mol target"
+            break
+        if g >= constants.MMPBSA_ADAPTIVE_MAX_INEFFICIENCY:
+            reason = "sampled frames are correlated, denser sampling would add little information"
+            break
+        if stride == 1:
+            reason = f"all {len(frames)} frames sampled at the default interval"
+            break
+        stride //= 2
+        level += 1
+
+    dat_file, csv_file = Path(MMPBSA_dir) / "FINAL_RESULTS_MMPBSA.dat", Path(MMPBSA_dir) / "FINAL_RESULTS_MMPBSA.csv"
+    merge_energy_csvs(csvs, csv_file, dat_file, frames=csv_frames, correct_correlation=True,
+                      source=f"{level + 1} adaptive sampling pass(es) of {len(csvs)} frame chunks")
+    return (f"MMPBSA complete! Files created: {dat_file} and {csv_file}.\n"
+            f"Adaptive sampling: {len(delta)} of {len(frames)} frames in {level + 1} pass(es), "
+            f"{time.perf_counter() - start:.1f} s; stopped: {reason}.\n"
+            + "\n".join(lines) + "\n"
+            f"Achieved uncertainty: ΔTOTAL = {delta.mean():.2f} ± {sem:.2f} kcal/mol (standard error corrected for correlation).\n"
+            f"{dat_file.read_text(encoding='utf-8')}")
+
+
+def binding_estimate(csv_file) -> tuple[float, float, int]:
+    """Mean ΔTOTAL of a gmx_MMPBSA energy file with its standard error corrected for correlation, and the frame count."""
+    delta = delta_total(parse_energy_csv(csv_file))
+    return float(delta.mean()), float(delta.std() * np.sqrt(statistical_inefficiency(delta) / max(len(delta), 1))), len(delta)
+
+
+def _run_ligand(sandbox_dir: str) -> str | None:
+    """Ligand of a run, from the protonated ligand file (<ligand>_h.pdb) written by prepare_pdb_file_ligand, if unique."""
+    ligands = {path.name[:-len("_h.pdb")] for path in Path(sandbox_dir).glob("*_h.pdb")}
+    return ligands.pop() if len(ligands) == 1 else None
+
+
+def _run_tier(sandbox_dir: str, pdb_id: str, ligand_name: str | None, method: str, n_workers=None,
+              adaptive: bool = False) -> tuple[tuple[float, float, int] | None, str]:
+    """One gmx_MMPBSA run of a candidate, with the production settings read from its md.mdp."""
+    md_mdp = Path(f"{sandbox_dir}/md.mdp")
+    ref_t = _read_mdp_value(md_mdp, "ref-t")
+    if ref_t is None:
+        return None, f"{md_mdp} not found or without ref-t"
+    output = run_gmxMMPBSA(sandbox_dir, pdb_id, "0", "1", ref_t.split()[0], n_workers=n_workers,
+                           adaptive=adaptive, method=method, ligand_name=ligand_name)
+    csv_file = Path(sandbox_dir) / MMPBSA_DIRS[method] / "FINAL_RESULTS_MMPBSA.csv"
+    if " failed with return code " in output or not csv_file.exists():
+        return None, output[-constants.MAX_CHARACTERS_TO_LOG:]
+    return binding_estimate(csv_file), ""
+
+
+def rank_binding_affinities(sandbox_dirs: list[str], pdb_id: str, ligand_names: list[str | None] | None = None,
+                            top: int = constants.MMPBSA_ESCALATE_TOP, n_workers=None, adaptive: bool = False) -> str:
+    """
+    Tiered ranking of the ligands of several production runs against one target (pdb_id). Tier 1 computes the binding
+    free energy of every run with the generalized Born model (gmx_MMPBSA_GB/). The top candidates, plus those whose GB
+    estimate is within MMPBSA_ESCALATE_SIGMAS standard errors of the last of them (ambiguous ranks), are escalated
+    to the Poisson-Boltzmann model (gmx_MMPBSA/) in a batch pass. Both tiers are written to one binding_ranking.csv
+    in the parent directory of the first run, ranked by the PB estimate when available and by GB otherwise.
+    ligand_names gives the ligand of each run, in the order of sandbox_dirs; a missing one is read from the run's
+    <ligand>_h.pdb file.
+    """
+    if ligand_names is not None and len(ligand_names) != len(sandbox_dirs):
+        return (f"Binding affinity ranking failed with return code 1: {len(ligand_names)} ligand names "
+                f"for {len(sandbox_dirs)} runs.")
+    ligands = {d: (ligand_names[i] if ligand_names and ligand_names[i] else _run_ligand(d)) for i, d in enumerate(sandbox_dirs)}
+    start = time.perf_counter()
+    gb, errors = {}, {}
+    for sandbox_dir in sandbox_dirs:
+        gb[sandbox_dir], errors[sandbox_dir] = _run_tier(sandbox_dir, pdb_id, ligands[sandbox_dir], "gb", n_workers, adaptive)
+    ranked = sorted((d for d in sandbox_dirs if gb[d]), key=lambda d: gb[d][0])
+    if not ranked:
+        return "Binding affinity ranking failed with return code 1: no GB estimate.\n" + "\n".join(
+            f"--- {d} ---\n{e}" for d, e in errors.items())
+
+    # Ambiguous candidates: GB intervals overlapping the interval of the last escalated candidate
+    cutoff = gb[ranked[min(top, len(ranked)) - 1]]
+    sigmas = constants.MMPBSA_ESCALATE_SIGMAS
+    escalated = [d for i, d in enumerate(ranked)
+                 if i < top or gb[d][0] - sigmas * gb[d][1] <= cutoff[0] + sigmas * cutoff[1]]
+    gb_time = time.perf_counter() - start
+    pb = {}
+    for sandbox_dir in escalated:
+        pb[sandbox_dir], errors[sandbox_dir] = _run_tier(sandbox_dir, pdb_id, ligands[sandbox_dir], "pb", n_workers, adaptive)
+
+    # PB and GB energies are not on the same scale: PB-refined candidates rank ahead of GB-only ones
+    final = sorted(ranked, key=lambda d: (pb.get(d) is None, (pb.get(d) or gb[d])[0]))
+    ranking_file = Path(sandbox_dirs[0]).resolve().parent / "binding_ranking.csv"
+    with open(ranking_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "run", "tier", "dG_gb", "sem_gb", "frames_gb", "dG_pb", "sem_pb", "frames_pb", "gb_rank"])
+        for rank, d in enumerate(final, start=1):
+            pb_values = [f"{pb[d][0]:.2f}", f"{pb[d][1]:.2f}", pb[d][2]] if pb.get(d) else ["", "", ""]
+            writer.writerow([rank, d, "pb" if pb.get(d) else "gb", f"{gb[d][0]:.2f}", f"{gb[d][1]:.2f}", gb[d][2],
+                             *pb_values, ranked.index(d) + 1])
+
+    lines = [f"{rank}. {Path(d).name}: ΔG(GB) = {gb[d][0]:.2f} ± {gb[d][1]:.2f}"
+             + (f", ΔG(PB) = {pb[d][0]:.2f} ± {pb[d][1]:.2f}" if pb.get(d) else "") + " kcal/mol"
+             for rank, d in enumerate(final, start=1)]
+    failed = [f"{Path(d).name} ({'PB' if d in pb else 'GB'}): {e.splitlines()[0] if e else 'no result'}"
+              for d, e in errors.items() if e]
+    unknown = [Path(d).name for d in sandbox_dirs if ligands[d] is None]
+    return (f"Binding affinity ranking complete! File created: {ranking_file}.\n"
+            f"GB tier: {len(ranked)} of {len(sandbox_dirs)} runs in {gb_time:.1f} s; PB tier: {len(escalated)} escalated "
+            f"(top {top} and GB estimates within {sigmas:g} SEM of the cutoff) in {time.perf_counter() - start - gb_time:.1f} s.\n"
+            + "\n".join(lines)
+            + (f"\nFailed: {'; '.join(failed)}" if failed else "")
+            + (f"\nLigand unknown (not given, no unique <ligand>_h.pdb), groups resolved without it: {', '.join(unknown)}"
+               if unknown else ""))
@@ -1,49 +1,114 @@
-from paperqa import Docs, Settings
-from tqdm import tqdm
-import os
-import os.path
-import contextlib
-import pickle
+import threading
+import time
 from src import constants
-
-
-documents: Docs | None = None
-
-def _load_documents() -> Docs:
-    docs = Docs()
-
-    pdf_files = list(constants.PAPER_DIR.glob("*.pdf"))
-    total_files = len(pdf_files)
-
-    pickled_docs = "my_docs.pkl"
-
-    if not os.path.exists(pickled_docs):
-        with tqdm(
-            total=total_files,
-            desc="Loading PDFs",
-            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} ({percentage:.1f}%) [ time left: {remaining}, time spent: {elapsed}]",
-        ) as pbar:
-            for file_path in pdf_files:
-                # suppress output from docs.add()
-                with open(os.devnull, "w") as fnull:
-                    with contextlib.redirect_stdout(fnull), contextlib.redirect_stderr(fnull):
-                        docs.add(file_path)
-                pbar.update(1)
-        # save embeddings of the documents
-        with open(pickled_docs, "wb") as f:
-            pickle.dump(docs, f)
-    else:
-        # load embeddings of the documents
-        with open(pickled_docs, "rb") as f:
-            docs = pickle.load(f)
-
+from src.tools.paper_cache import QueryCache, normalize_query
+from src.tools.paper_index import PaperIndex
+from src.utils import get_class_logger
+
+logger = get_class_logger(__name__)
+
+
+documents = None  # paperqa Docs, or LocalPaperIndex with the local backend
+index_version: str | None = None
+# Warm-up state: the index is loaded once, by warm_up_documents() in the background or by the first search_papers call
+_load_lock = threading.Lock()
+_load_started: float | None = None
+_load_seconds: float | None = None
+_load_error: Exception | None = None
+_warm_up_thread: threading.Thread | None = None
+
+QUERY_SETTINGS = dict(
+    # Retrieval size — more is NOT always better
+    evidence_k=8,                   # retrieve top 8 chunks per query
+    max_chunk_size=800,             # avoid huge chunks; MD details are often local
+    rerank_k=20,                    # lightly expand initial search before reranking
+
+    # LLM settings
+    temperature=0.1,                # scientific, deterministic tone
+    answer_temperature=0.0,         # final answers must be strict, non-creative
+
+    # Trust/scientific correctness
+    require_citations=True,         # every claim must have a supporting doc
+    max_tokens=4096,                # MD methods can be verbose
+    summary_length=5,               # keep evidence chunks tight
+
+    # Error-handling / agent behavior
+    cohere_reranker=False,          # use built-in reranker (fast, good enough)
+    retries=2,                      # avoid failures during batch queries
+    timeout=120,                     # MD queries can be long
+)
+
+def _load_documents(redirect_output: bool = True):
+    # Only new or changed PDFs are embedded; the indexes live in constants.PAPER_INDEX_DIR
+    global index_version
+    if constants.PAPER_SEARCH_BACKEND == "local":
+        from src.tools.local_index import LocalPaperIndex
+        docs, _ = LocalPaperIndex().update()
+        index_version = docs.version
+        return docs
+    index = PaperIndex()
+    docs, _ = index.update(redirect_output=redirect_output)
+    index_version = index.version
     return docs
 
-def search_papers(query: dict):
-    global documents 
+def _cache_settings() -> dict:
+    """Settings that change the answers of the current backend (part of the query cache key)."""
+    if constants.PAPER_SEARCH_BACKEND == "local":
+        return {"backend": "local", "model": constants.LOCAL_EMBEDDING_MODEL, "top_k": constants.LOCAL_TOP_K,
+                "synthesize": constants.LOCAL_SYNTHESIZE_ANSWER, "llm": constants.MODEL_NAME}
+    return QUERY_SETTINGS
+
+def _ensure_documents(redirect_output: bool = True):
+    """The loaded index, loading it first or waiting for the background warm-up if it is still running."""
+    global documents, _load_started, _load_seconds, _load_error
+    with _load_lock:
+        if documents is None:
+            _load_started, _load_error = time.perf_counter(), None
+            try:
+                documents = _load_documents(redirect_output)
+            except Exception as e:
+                _load_error = e
+                raise
+            finally:
+                _load_seconds = time.perf_counter() - _load_started
+            logger.info(f"Paper index ready in {_load_seconds:.1f} s")
+    return documents
+
+def warm_up_documents() -> threading.Thread | None:
+    """
+    Load or update the paper index in a background thread, so that the first search_papers call does not wait for
+    it (unless it comes before the index is ready). Returns the thread, or None if the index is already loaded.
+    """
+    global _warm_up_thread
+    if documents is not None or _load_lock.locked() or (_warm_up_thread is not None and _warm_up_thread.is_alive()):
+        return None
+
+    def warm_up():
+        try:
+            # sys.stdout is shared with the agent loop: do not redirect it from this thread
+            _ensure_documents(redirect_output=False)
+        except Exception as e:
+            logger.warning(f"Paper index warm-up failed, search_papers will retry: {e}")
+
+    _warm_up_thread = threading.Thread(target=warm_up, name="paper-index-warm-up", daemon=True)
+    _warm_up_thread.start()
+    return _warm_up_thread
+
+def index_status() -> str:
+    """Readiness of the paper index: ready (with its load time), loading, failed or not loaded."""
+    if documents is not None:
+        return f"ready (loaded in {_load_seconds:.1f} s)"
+    if _load_error is not None:
+        return f"failed after {_load_seconds:.1f} s: {_load_error}"
+    if _warm_up_thread is not None and _warm_up_thread.is_alive():
+        return f"loading for {time.perf_counter() - (_load_started or time.perf_counter()):.1f} s"
+    return "not loaded"
 
-    if not documents:
-        documents = _load_documents()
+def search_papers(query: dict):
+    if documents is None:
+        waited = time.perf_counter()
+        _ensure_documents()
+        logger.info(f"search_papers waited {time.perf_counter() - waited:.1f} s for the paper index")
 
     if isinstance(query, dict):
         query = query.get("query")
@@ -56,30 +121,30 @@ def search_papers(query: dict):
         raise ValueError(
             "'paper_dir' is None. To use this tool, the user must provide a directory with PDFs at the start."
         )
-    
-    settings = Settings(
-        # Retrieval size — more is NOT always better
-        evidence_k=8,                   # retrieve top 8 chunks per query
-        max_chunk_size=800,             # avoid huge chunks; MD details are often local
-        rerank_k=20,                    # lightly expand initial search before reranking
-
-        # LLM settings
-        temperature=0.1,                # scientific, deterministic tone
-        answer_temperature=0.0,         # final answers must be strict, non-creative
-
-        # Trust/scientific correctness
-        require_citations=True,         # every claim must have a supporting doc
-        max_tokens=4096,                # MD methods can be verbose
-        summary_length=5,               # keep evidence chunks tight
-
-        # Error-handling / agent behavior
-        cohere_reranker=False,          # use built-in reranker (fast, good enough)
-        retries=2,                      # avoid failures during batch queries
-        timeout=120,                     # MD queries can be long
-    )
-
-    result = documents.query(query, settings=settings)
-    answer = result.formatted_answer
+
+    # Same (or, with PAPER_CACHE_SIMILARITY, similar) question on the same library and settings: cached answer
+    cache = QueryCache()
+    cache_settings = _cache_settings()
+    cached = cache.get(query, index_version, cache_settings)
+    if cached is not None:
+        answer, cached_query = cached
+        if normalize_query(cached_query) == normalize_query(query):
+            return answer
+        return f"(Cached answer to the similar question: {cached_query})\n{answer}"
+
+    fallback = False
+    if constants.PAPER_SEARCH_BACKEND == "local":
+        from src.tools.local_index import local_answer
+        answer, fallback = local_answer(documents, query)
+    else:
+        from paperqa import Settings
+        settings = Settings(**QUERY_SETTINGS)
+
+        result = documents.query(query, settings=settings)
+        answer = result.formatted_answer
     if "I cannot answer." in answer:
         answer += f" Check to ensure there's papers in {paper_directory}"
+    elif not fallback:
+        # A passages-only fallback is not the synthesized answer the cache settings describe
+        cache.put(query, index_version, cache_settings, answer)
     return answer
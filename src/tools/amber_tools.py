@@ -1,19 +1,87 @@
 import subprocess
+import math
 from pathlib import Path
 import parmed as pmd  # type: ignore
+from parmed.tools import HMassRepartition  # type: ignore
 from src import constants
 from src.utils import get_class_logger
 
 logger = get_class_logger(__name__)
 
 
-def run_tleap(sandbox_dir: str, input_pdb: str, pdb_id: str) -> str:
+def _repartition_hydrogen_masses(parmed_cm) -> None:
+    """
+    Repartition hydrogen masses (HMR) so that production MD can run with a 4 fs timestep.
+    Mass is moved from each heavy atom onto its bonded hydrogens; water is left rigid and untouched.
+    """
+    HMassRepartition(parmed_cm, constants.HMR_HYDROGEN_MASS).execute()
+    logger.info(f"Hydrogen masses repartitioned to {constants.HMR_HYDROGEN_MASS} amu")
+
+
+SOLVENT_RESIDUES = {"WAT", "HOH", "Na+", "Cl-", "K+"}
+SOLUTE_VOLUME_PER_ATOM = 8.6  # Å^3, from a protein density of ~1.35 g/cm^3 and ~7 Da per atom (hydrogens included)
+
+
+def _box_volume(box) -> float:
+    """Volume (Å^3) of a triclinic box given as [a, b, c, alpha, beta, gamma]."""
+    a, b, c = box[:3]
+    cos_a, cos_b, cos_g = (math.cos(math.radians(angle)) for angle in box[3:6])
+    return a * b * c * math.sqrt(1 - cos_a**2 - cos_b**2 - cos_g**2 + 2 * cos_a * cos_b * cos_g)
+
+
+def _solvation_report(solute_pdb: str, parmed_cm, box_shape: str, buffer: float) -> str:
+    """
+    Compare the solvated system against the historical rectangular box with a 16 Å buffer.
+    The atom count of the reference box is estimated from the solute extent and the solvent
+    density of the box tleap actually built; per-ns cost is assumed to scale as N log N (PME).
+    """
+    n_atoms = len(parmed_cm.atoms)
+    n_solute = sum(1 for atom in parmed_cm.atoms if atom.residue.name not in SOLVENT_RESIDUES)
+    volume = _box_volume(parmed_cm.box)
+
+    solute = pmd.load_file(solute_pdb)
+    extent = [
+        max(getattr(atom, axis) for atom in solute.atoms) - min(getattr(atom, axis) for atom in solute.atoms)
+        for axis in ("xx", "xy", "xz")
+    ]
+    reference_volume = math.prod(e + 2 * constants.REFERENCE_SOLVENT_BUFFER for e in extent)
+
+    solute_volume = n_solute * SOLUTE_VOLUME_PER_ATOM
+    solvent_density = (n_atoms - n_solute) / max(volume - solute_volume, 1.0)
+    reference_atoms = int(n_solute + solvent_density * max(reference_volume - solute_volume, 0.0))
+
+    relative_cost = (n_atoms * math.log(n_atoms)) / (reference_atoms * math.log(reference_atoms))
+
+    return (
+        f"Solvation report: {box_shape} box with a {buffer:g} Å buffer, {n_atoms} atoms "
+        f"({n_solute} solute), volume {volume / 1000:.1f} nm^3. "
+        f"Reference rectangular box with a {constants.REFERENCE_SOLVENT_BUFFER:g} Å buffer: ~{reference_atoms} atoms, "
+        f"volume {reference_volume / 1000:.1f} nm^3. "
+        f"Estimated per-ns cost: {100 * relative_cost:.0f}% of the reference."
+    )
+
+
+def run_tleap(
+    sandbox_dir: str,
+    input_pdb: str,
+    pdb_id: str,
+    hmr: bool = False,
+    box_shape: str = constants.BOX_SHAPE,
+    buffer: float = constants.SOLVENT_BUFFER,
+    align: bool = True,
+) -> str:
     """
     Run tleap preparation using run_tleap.sh.
+    If hmr is True, hydrogen masses are repartitioned before writing topol.top.
+    box_shape ("octahedron" or "rectangular") and buffer (Å) set the solvent box; with align the
+    solute is first rotated onto its principal axes.
     """
     script = constants.SCRIPTS_DIR / "run_tleap.sh"
     result = subprocess.run(
-        [str(script), sandbox_dir, input_pdb, pdb_id], cwd=sandbox_dir, capture_output=True, text=True
+        [str(script), sandbox_dir, input_pdb, pdb_id, box_shape, f"{float(buffer):g}", str(int(align))],
+        cwd=sandbox_dir,
+        capture_output=True,
+        text=True,
     )
     if result.returncode != 0:
         # tleap often puts errors in stdout
@@ -26,17 +94,38 @@ def run_tleap(sandbox_dir: str, input_pdb: str, pdb_id: str) -> str:
             inpcrd_path = f"{sandbox_dir}/{pdb_id}.inpcrd"
 
             parmed_cm = pmd.load_file(prmtop_path, inpcrd_path)
+            if hmr:
+                _repartition_hydrogen_masses(parmed_cm)
             parmed_cm.save(f"{sandbox_dir}/topol.top")
             parmed_cm.save(f"{sandbox_dir}/{pdb_id}.gro")
         except Exception as e:
             return f"ParmEd failed: {type(e).__name__}: {e}, {result}"
 
-        return f"tleap ran successfully with output: {result.stdout}. \n New files added: {sandbox_dir}/topol.top, {sandbox_dir}/{pdb_id}.gro"
+        try:
+            report = _solvation_report(f"{sandbox_dir}/{input_pdb}", parmed_cm, box_shape, float(buffer))
+            logger.info(report)
+        except Exception as e:
+            report = f"Solvation report unavailable: {type(e).__name__}: {e}"
+
+        return f"tleap ran successfully with output: {result.stdout}. \n New files added: {sandbox_dir}/topol.top, {sandbox_dir}/{pdb_id}.gro\n{report}"
 
 
-def run_tleap_ligand(sandbox_dir: str, input_pdb: str, pdb_id: str, ligand_files: str | list[str], ligand_name: str) -> str:
+def run_tleap_ligand(
+    sandbox_dir: str,
+    input_pdb: str,
+    pdb_id: str,
+    ligand_files: str | list[str],
+    ligand_name: str,
+    hmr: bool = False,
+    box_shape: str = constants.BOX_SHAPE,
+    buffer: float = constants.SOLVENT_BUFFER,
+    align: bool = True,
+) -> str:
     """
     Run tleap preparation using run_tleap.sh, for a protein-ligand complex.
+    If hmr is True, hydrogen masses are repartitioned before writing topol.top.
+    box_shape ("octahedron" or "rectangular") and buffer (Å) set the solvent box; with align the
+    solute is first rotated onto its principal axes.
     """
     # make sure it's a list
     if isinstance(ligand_files, str):
@@ -72,7 +161,7 @@ def run_tleap_ligand(sandbox_dir: str, input_pdb: str, pdb_id: str, ligand_files
         prepi_file = f"{ligand_stem}.prepi"
 
     result = subprocess.run(
-        [str(script), sandbox_dir, complex_pdb, f"{ligand_stem}.frcmod", prepi_file],
+        [str(script), sandbox_dir, complex_pdb, f"{ligand_stem}.frcmod", prepi_file, box_shape, f"{float(buffer):g}", str(int(align))],
         cwd=sandbox_dir,
         capture_output=True,
         text=True,
@@ -88,9 +177,17 @@ def run_tleap_ligand(sandbox_dir: str, input_pdb: str, pdb_id: str, ligand_files
             inpcrd_path = f"{sandbox_dir}/complex.inpcrd"
 
             parmed_cm = pmd.load_file(prmtop_path, inpcrd_path)
+            if hmr:
+                _repartition_hydrogen_masses(parmed_cm)
             parmed_cm.save(f"{sandbox_dir}/topol.top")
             parmed_cm.save(f"{sandbox_dir}/complex.gro")
         except Exception as e:
             return f"ParmEd failed: {type(e).__name__}: {e}"
 
-        return f"tleap ran successfully with output: {result.stdout}. \n New files added: {sandbox_dir}/topol.top, {sandbox_dir}/complex.gro"
+        try:
+            report = _solvation_report(complex_pdb, parmed_cm, box_shape, float(buffer))
+            logger.info(report)
+        except Exception as e:
+            report = f"Solvation report unavailable: {type(e).__name__}: {e}"
+
+        return f"tleap ran successfully with output: {result.stdout}. \n New files added: {sandbox_dir}/topol.top, {sandbox_dir}/complex.gro\n{report}"
@@ -1,10 +1,17 @@
+import filecmp
+import os
 import subprocess
 from pathlib import Path
 import re
 import shutil
 import sys
+import numpy as np
 from src import constants
 from src.utils import get_class_logger
+from src.analysis import LiveAnalysis, analyze_trajectory, cluster_trajectory, read_edr, summarize_results
+from src.analysis.edr import Energies
+from src.analysis.results import RESULTS_FILE, drift
+from src.tools.mdp_tools import equilibration_mdp, minimization_mdp, missing_index_groups, production_mdp, thermostat_groups
 import time
 
 logger = get_class_logger(__name__)
@@ -117,135 +124,14 @@ def gromacs_equil(sandbox_dir: str, input_gro: str, md_temp: str, ligand_name=No
 
     # -------------- Create em.mdp, nvt.mdp, npt.mdp files --------------
 
-    em_mdp_infile = open(f'{sandbox_dir}/em.mdp', 'w' )
-    em_mdp_infile.write(f'''; LINES STARTING WITH ';' ARE COMMENTS
-title		    = Minimization	; Title of run
-
-; Parameters describing what to do, when to stop and what to save
-integrator	    = steep		; Algorithm (steep = steepest descent minimization)
-emtol		    = 1000.0  	; Stop minimization when the maximum force < 10.0 kJ/mol
-emstep          = 0.01      ; Energy step size
-nsteps		    = 50000	  	; Maximum number of (minimization) steps to perform
-
-; Parameters describing how to find the neighbors of each atom and how to calculate the interactions
-nstlist		    = 1		        ; Frequency to update the neighbor list and long range forces
-cutoff-scheme   = Verlet
-ns_type		    = grid		    ; Method to determine neighbor list (simple, grid)
-rlist		    = 1.2		    ; Cut-off for making neighbor list (short range forces)
-coulombtype	    = PME		    ; Treatment of long range electrostatic interactions
-rcoulomb	    = 1.2		    ; long range electrostatic cut-off
-vdwtype         = cutoff
-vdw-modifier    = force-switch
-rvdw-switch     = 1.0
-rvdw		    = 1.2		    ; long range Van der Waals cut-off
-pbc             = xyz 		    ; Periodic Boundary Conditions
-DispCorr        = no
-''')
-    em_mdp_infile.close()
-
-    nvt_mdp_infile = open(f'{sandbox_dir}/nvt.mdp', 'w' )
-    nvt_mdp_infile.write(f'''title                   = Protein-ligand complex NPT equilibration 
-define                  = -DPOSRES  ; position restrain the protein and ligand
-; Run parameters
-integrator              = md        ; leap-frog integrator
-nsteps                  = 5000     ; 2 * 5000 = 10 ps
-dt                      = 0.002     ; 2 fs
-; Output control
-nstenergy               = 500       ; save energies every 1.0 ps
-nstlog                  = 500       ; update log file every 1.0 ps
-nstxout-compressed      = 500       ; save coordinates every 1.0 ps
-; Bond parameters
-continuation            = yes       ; continuing from NVT 
-constraint_algorithm    = lincs     ; holonomic constraints 
-constraints             = h-bonds   ; bonds to H are constrained 
-lincs_iter              = 1         ; accuracy of LINCS
-lincs_order             = 4         ; also related to accuracy
-; Neighbor searching and vdW
-cutoff-scheme           = Verlet
-ns_type                 = grid      ; search neighboring grid cells
-nstlist                 = 20        ; largely irrelevant with Verlet
-rlist                   = 1.2
-vdwtype                 = cutoff
-vdw-modifier            = force-switch
-rvdw-switch             = 1.0
-rvdw                    = 1.2       ; short-range van der Waals cutoff (in nm)
-; Electrostatics
-coulombtype             = PME       ; Particle Mesh Ewald for long-range electrostatics
-rcoulomb                = 1.2
-pme_order               = 4         ; cubic interpolation
-fourierspacing          = 0.16      ; grid spacing for FFT
-; Temperature coupling
-tcoupl                  = V-rescale                     ; modified Berendsen thermostat
-tc-grps                 = Protein Water_and_ions    ; two coupling groups - more accurate
-tau_t                   = 0.1   0.1                     ; time constant, in ps
-ref_t                   = {float(md_temp)}   {float(md_temp)}                     ; reference temperature, one for each group, in K
-; Pressure coupling
-pcoupl                  = Berendsen                     ; pressure coupling is on for NPT
-pcoupltype              = isotropic                     ; uniform scaling of box vectors
-tau_p                   = 2.0                           ; time constant, in ps
-ref_p                   = 1.0                           ; reference pressure, in bar
-compressibility         = 4.5e-5                        ; isothermal compressibility of water, bar^-1
-refcoord_scaling        = com
-; Periodic boundary conditions
-pbc                     = xyz       ; 3-D PBC
-; Dispersion correction is not used for proteins with the C36 additive FF
-DispCorr                = no 
-; Velocity generation
-gen_vel                 = no        ; velocity generation off after NVT 
-''')
-    nvt_mdp_infile.close()
-
-    npt_mdp_infile = open(f'{sandbox_dir}/npt.mdp', 'w' )
-    npt_mdp_infile.write(f'''title                   = Protein-ligand complex NPT equilibration 
-define                  = -DPOSRES  ; position restrain the protein and ligand
-; Run parameters
-integrator              = md        ; leap-frog integrator
-nsteps                  = 5000     ; 2 * 5000 = 10 ps
-dt                      = 0.002     ; 2 fs
-; Output control
-nstenergy               = 500       ; save energies every 1.0 ps
-nstlog                  = 500       ; update log file every 1.0 ps
-nstxout-compressed      = 500       ; save coordinates every 1.0 ps
-; Bond parameters
-continuation            = yes       ; continuing from NVT 
-constraint_algorithm    = lincs     ; holonomic constraints 
-constraints             = h-bonds   ; bonds to H are constrained 
-lincs_iter              = 1         ; accuracy of LINCS
-lincs_order             = 4         ; also related to accuracy
-; Neighbor searching and vdW
-cutoff-scheme           = Verlet
-ns_type                 = grid      ; search neighboring grid cells
-nstlist                 = 20        ; largely irrelevant with Verlet
-rlist                   = 1.2
-vdwtype                 = cutoff
-vdw-modifier            = force-switch
-rvdw-switch             = 1.0
-rvdw                    = 1.2       ; short-range van der Waals cutoff (in nm)
-; Electrostatics
-coulombtype             = PME       ; Particle Mesh Ewald for long-range electrostatics
-rcoulomb                = 1.2
-pme_order               = 4         ; cubic interpolation
-fourierspacing          = 0.16      ; grid spacing for FFT
-; Temperature coupling
-tcoupl                  = V-rescale                     ; modified Berendsen thermostat
-tc-grps                 = Protein Water_and_ions    ; two coupling groups - more accurate
-tau_t                   = 0.1   0.1                     ; time constant, in ps
-ref_t                   = {float(md_temp)}   {float(md_temp)}                     ; reference temperature, one for each group, in K
-; Pressure coupling
-pcoupl                  = Berendsen                     ; pressure coupling is on for NPT
-pcoupltype              = isotropic                     ; uniform scaling of box vectors
-tau_p                   = 2.0                           ; time constant, in ps
-ref_p                   = 1.0                           ; reference pressure, in bar
-compressibility         = 4.5e-5                        ; isothermal compressibility of water, bar^-1
-refcoord_scaling        = com
-; Periodic boundary conditions
-pbc                     = xyz       ; 3-D PBC
-; Dispersion correction is not used for proteins with the C36 additive FF
-DispCorr                = no 
-; Velocity generation
-gen_vel                 = no        ; velocity generation off after NVT 
-''')
-    npt_mdp_infile.close()
+    try:
+        tc_grps = thermostat_groups(Path(sandbox_dir) / input_gro, ligand_name)
+        minimization_mdp("steep", constants.EM_SD_STEPS).write(f"{sandbox_dir}/em_sd.mdp")
+        minimization_mdp("cg", constants.EM_MAX_STEPS - constants.EM_SD_STEPS * constants.EM_SD_MAX_SEGMENTS).write(f"{sandbox_dir}/em.mdp")
+        equilibration_mdp("nvt", md_temp, tc_grps).write(f"{sandbox_dir}/nvt.mdp")
+        equilibration_mdp("npt", md_temp, tc_grps).write(f"{sandbox_dir}/npt.mdp")
+    except (OSError, ValueError) as e:
+        return f"Equilibration failed with return code 1.\nCould not generate the .mdp files: {e}"
 
     # -------------- Run equil_Gromacs.sh script --------------
 
@@ -266,7 +152,10 @@ gen_vel                 = no        ; velocity generation off after NVT
         cmd.append(ligand_gro)
         print(cmd)  
 
-    result = subprocess.run(cmd, cwd=sandbox_dir, stdout=sys.stdout, stderr=sys.stderr, text=True)
+    # Switching rule of the segmented steepest descent (equil_Gromacs.sh)
+    env = {**os.environ, "EM_SD_MAX_SEGMENTS": str(constants.EM_SD_MAX_SEGMENTS),
+           "EM_SD_MIN_PROGRESS": str(constants.EM_SD_MIN_PROGRESS)}
+    result = subprocess.run(cmd, cwd=sandbox_dir, stdout=sys.stdout, stderr=sys.stderr, text=True, env=env)
 
     gromacs_output = ""
 
@@ -284,65 +173,187 @@ gen_vel                 = no        ; velocity generation off after NVT
                 f"{result.stderr or 'None captured directly'}") 
     else:
         return (f"Equilibration ran successfully. Full GROMACS output:\n"
-                f"{gromacs_output}")
+                f"{gromacs_output}\n"
+                f"{_minimization_report(sandbox_dir)}\n"
+                f"{_equilibration_energy_report(sandbox_dir, md_temp)}")
 
 
-def gromacs_production(sandbox_dir: str, input_gro: str, npt_cpt_file: str, md_temp: str, md_duration: str, ligand_name=None) -> str:
+def _minimization_log_summary(log_path: Path) -> dict | None:
+    """
+    Steps, final maximum force and wall time of an energy minimization, parsed from its mdrun log. A log holding
+    several consecutive runs (the steepest-descent segments in em_sd.log) gives their total steps and wall time,
+    the Fmax and convergence of the last one and the number of runs.
+    """
+    if not log_path.exists():
+        return None
+    text = log_path.read_text(encoding="utf-8", errors="replace")
+    results = re.findall(r"(converged to Fmax|did not converge to Fmax|converged to machine precision).*? in (\d+) steps", text)
+    max_forces = re.findall(r"Maximum force\s+=\s+(\S+)", text)
+    wall_times = re.findall(r"^\s*Time:\s+\S+\s+(\S+)", text, flags=re.M)
+    return {
+        "steps": sum(int(steps) for _, steps in results) if results else None,
+        "max_force": float(max_forces[-1]) if max_forces else None,
+        "wall_time": sum(float(t) for t in wall_times) if wall_times else None,
+        "converged": bool(results) and results[-1][0] == "converged to Fmax",
+        "runs": len(results),
+    }
+
+
+def _minimization_report(sandbox_dir: str) -> str:
+    """
+    Report on the two-stage minimization: steps, Fmax and wall time of each stage and their totals, and the steps
+    left unused compared with the former single-stage minimization (steepest descent of up to EM_MAX_STEPS steps).
+    That run would also have stopped at emtol, so the figure is an upper bound on the saving, not a measured one.
+    """
+    stages = [("steepest descent", _minimization_log_summary(Path(f"{sandbox_dir}/em_sd.log"))),
+              ("conjugate gradient", _minimization_log_summary(Path(f"{sandbox_dir}/em.log")))]
+    lines = ["Energy minimization report:"]
+    total_steps = 0
+    total_wall = 0.0
+    sd_time_per_step = None
+    for name, summary in stages:
+        if summary is None or summary["steps"] is None:
+            continue
+        total_steps += summary["steps"]
+        if summary["wall_time"] is not None and total_wall is not None:
+            total_wall += summary["wall_time"]
+        else:
+            total_wall = None
+        wall = f"{summary['wall_time']:.1f} s" if summary["wall_time"] is not None else "unknown"
+        segments = f" in {summary['runs']} segments" if summary["runs"] > 1 else ""
+        lines.append(f"- {name}: {summary['steps']} steps{segments}, Fmax = {summary['max_force']} kJ/mol/nm, "
+                     f"wall time {wall}, {'converged' if summary['converged'] else 'not converged'}")
+        if name == "steepest descent" and summary["wall_time"] and summary["steps"]:
+            sd_time_per_step = summary["wall_time"] / summary["steps"]
+    if total_steps == 0:
+        return ""
+    lines.append(f"- total: {total_steps} steps, wall time {f'{total_wall:.1f} s' if total_wall is not None else 'unknown'}.")
+    unused = constants.EM_MAX_STEPS - total_steps
+    if unused > 0:
+        saved = f" (~{unused * sd_time_per_step:.1f} s at the steepest-descent rate)" if sd_time_per_step else ""
+        lines.append(f"- versus the former single-stage steepest descent ({constants.EM_MAX_STEPS} steps at most): up to "
+                     f"{unused} steps saved{saved}. Upper bound: that run also stops once Fmax < emtol, which was not measured.")
+    return "\n".join(lines)
+
+
+def _minimization_energies(sandbox_dir: str) -> tuple[Energies, str]:
+    """
+    Energies of the two minimization stages as one series: the steepest-descent segments (em_sd_1.edr, em_sd_2.edr...,
+    or em_sd.edr) then em.edr, each numbered after the previous one, and a label of the stages they cover. em.edr is
+    left out when it is a copy of a converged steepest descent, and used alone when there is no steepest-descent stage.
+    """
+    sandbox = Path(sandbox_dir)
+    cg_path = sandbox / "em.edr"
+    segments = sorted(sandbox.glob("em_sd_*.edr"), key=lambda p: int(p.stem.rsplit("_", 1)[1]))
+    if not segments and (sandbox / "em_sd.edr").exists():
+        segments = [sandbox / "em_sd.edr"]
+    if not segments:
+        return read_edr(cg_path), "minimization"
+    # equil_Gromacs.sh copies em_sd.* to em.* when steepest descent converged
+    sd_log = _minimization_log_summary(sandbox / "em_sd.log")
+    if sd_log is not None and sd_log["steps"] is not None:
+        converged = sd_log["converged"]
+    else:
+        converged = (sandbox / "em_sd.edr").exists() and filecmp.cmp(sandbox / "em_sd.edr", cg_path, shallow=False)
+    parts = [read_edr(path) for path in segments] + ([] if converged else [read_edr(cg_path)])
+    names = [name for name in parts[-1].terms if all(name in part.terms for part in parts)]
+    time_offset = step_offset = 0
+    times, steps = [], []
+    for part in parts:
+        times.append(part.time - (part.time[0] if len(part.time) else 0) + time_offset)
+        steps.append(part.step - (part.step[0] if len(part.step) else 0) + step_offset)
+        if len(part.time):
+            time_offset, step_offset = times[-1][-1] + 1, steps[-1][-1] + 1
+    combined = Energies(time=np.concatenate(times), step=np.concatenate(steps),
+                        terms={name: np.concatenate([part.terms[name] for part in parts]) for name in names},
+                        units=parts[-1].units)
+    label = "steepest descent, converged" if converged else "steepest descent + conjugate gradient"
+    return combined, f"minimization ({label}{f', {len(segments)} SD segments' if len(segments) > 1 else ''})"
+
+
+# Energy terms of the equilibration stages written to .xvg files, as gmx energy -o did
+EQUILIBRATION_ENERGIES = (("em.edr", "Potential", "potential.xvg"), ("nvt.edr", "Temperature", "temperature.xvg"),
+                          ("npt.edr", "Pressure", "pressure.xvg"), ("npt.edr", "Density", "density.xvg"))
+
+
+def _equilibration_energy_report(sandbox_dir: str, md_temp) -> str:
+    """
+    Write potential.xvg (both minimization stages), temperature.xvg, pressure.xvg and density.xvg from the .edr files
+    of the minimization and equilibration (src.analysis.edr, no gmx energy calls), and report the final potential energy and the mean,
+    fluctuation and drift of the temperature, pressure and density.
+    """
+    lines = ["Equilibration energy report:"]
+    energies = {}
+    minimization_label = "minimization"
+    for edr_name, term, xvg_name in EQUILIBRATION_ENERGIES:
+        edr_path = Path(sandbox_dir) / edr_name
+        try:
+            if edr_name not in energies:
+                if edr_name == "em.edr":
+                    energies[edr_name], minimization_label = _minimization_energies(sandbox_dir)
+                else:
+                    energies[edr_name] = read_edr(edr_path)
+            energies[edr_name].write_xvg(Path(sandbox_dir) / xvg_name, term)
+        except (OSError, ValueError, KeyError) as e:
+            lines.append(f"- {xvg_name} not written: {e}")
+            continue
+        data = energies[edr_name]
+        values, unit = data[term], data.units[data.find(term)]
+        if edr_name == "em.edr":
+            lines.append(f"- {minimization_label}: potential energy {values[0]:.6g} -> {values[-1]:.6g} {unit} in {len(values)} frames")
+            continue
+        target = f" (target {float(md_temp):g} K)" if term == "Temperature" else ""
+        lines.append(f"- {edr_name[:3].upper()} {term.lower()}: {values.mean():.4g} ± {values.std():.3g} {unit}{target}, "
+                     f"drift {drift(data.time / 1000, values):+.3g} {unit}/ns")
+    return "\n".join(lines)
+
+
+def _topology_is_repartitioned(topol_path: Path) -> bool:
+    """
+    Check whether the non-water hydrogens in topol.top carry repartitioned (HMR) masses.
+    """
+    in_atoms = False
+    for line in topol_path.read_text(encoding="utf-8", errors="replace").splitlines():
+        stripped = line.split(";")[0].strip()
+        if stripped.startswith("["):
+            in_atoms = stripped.replace(" ", "") == "[atoms]"
+            continue
+        fields = stripped.split()
+        # id, type, resnr, residue, atom, cgnr, charge, mass
+        if not in_atoms or len(fields) < 8:
+            continue
+        if fields[4].startswith("H") and fields[3] not in ("WAT", "HOH", "SOL"):
+            return float(fields[7]) > 2.0
+    return False
+
+
+def gromacs_production(sandbox_dir: str, input_gro: str, npt_cpt_file: str, md_temp: str, md_duration: str, ligand_name=None, hmr: bool = False,
+                       output_policy: str = constants.PRODUCTION_OUTPUT_POLICY) -> str:
     """
     Run production MD with GROMACS using prod_Gromacs.sh.
+    If hmr is True, the topology must have repartitioned hydrogen masses and a 4 fs timestep is used.
+    With output_policy="reduced", md.xtc only holds protein(+ligand) and a solute-only md_solute.tpr is written for analysis.
     """
 
+    if hmr and not _topology_is_repartitioned(Path(f"{sandbox_dir}/topol.top")):
+        return (f"Production failed with return code 1.\n"
+                f"HMR was requested but the hydrogen masses in {sandbox_dir}/topol.top are not repartitioned. "
+                f"Re-run tleap with hydrogen mass repartitioning before the production run.")
+
     # ---------- Create md.mdp file --------------
-    nsteps = int(((float(md_duration)) * 1000000) / 2)  # Convert ns to number of steps (2 fs per step)
-    md_mdp_infile = open(f'{sandbox_dir}/md.mdp', 'w' )
-    md_mdp_infile.write(f'''title                   = Protein-ligand complex MD simulation 
-; Run parameters
-integrator              = md        ; leap-frog integrator
-nsteps                  = {nsteps}   ; 2 * 500,000 = 1000 ps (0.1 ns)
-dt                      = 0.002     ; 2 fs
-; Output control
-nstenergy               = 5000     ; save energies every 10.0 ps
-nstlog                  = 5000     ; update log file every 10.0 ps
-nstxout-compressed      = 5000     ; save coordinates every 10.0 ps
-; Bond parameters
-continuation            = yes       ; continuing from NPT 
-constraint_algorithm    = lincs     ; holonomic constraints 
-constraints             = h-bonds   ; bonds to H are constrained
-lincs_iter              = 1         ; accuracy of LINCS
-lincs_order             = 4         ; also related to accuracy
-; Neighbor searching and vdW
-cutoff-scheme           = Verlet
-ns_type                 = grid      ; search neighboring grid cells
-nstlist                 = 20        ; largely irrelevant with Verlet
-rlist                   = 1.2
-vdwtype                 = cutoff
-vdw-modifier            = force-switch
-rvdw-switch             = 1.0
-rvdw                    = 1.2       ; short-range van der Waals cutoff (in nm)
-; Electrostatics
-coulombtype             = PME       ; Particle Mesh Ewald for long-range electrostatics
-rcoulomb                = 1.2
-pme_order               = 4         ; cubic interpolation
-fourierspacing          = 0.16      ; grid spacing for FFT
-; Temperature coupling
-tcoupl                  = V-rescale                     ; modified Berendsen thermostat
-tc-grps                 = Protein Water_and_ions        ; two coupling groups - more accurate
-tau_t                   = 0.1   0.1                     ; time constant, in ps
-ref_t                   = {float(md_temp)}   {float(md_temp)}                     ; reference temperature, one for each group, in K
-; Pressure coupling 
-pcoupl                  = Parrinello-Rahman             ; pressure coupling is on for NPT
-pcoupltype              = isotropic                     ; uniform scaling of box vectors
-tau_p                   = 2.0                           ; time constant, in ps
-ref_p                   = 1.0                           ; reference pressure, in bar
-compressibility         = 4.5e-5                        ; isothermal compressibility of water, bar^-1
-; Periodic boundary conditions
-pbc                     = xyz       ; 3-D PBC
-; Dispersion correction is not used for proteins with the C36 additive FF
-DispCorr                = no 
-; Velocity generation
-gen_vel                 = no        ; continuing from NPT equilibration 
-''')
-    md_mdp_infile.close()
+    dt = constants.HMR_TIMESTEP if hmr else constants.MD_TIMESTEP
+    index_path = Path(f"{sandbox_dir}/index.ndx")
+    try:
+        tc_grps = thermostat_groups(Path(sandbox_dir) / input_gro, ligand_name)
+        md_mdp = production_mdp(md_temp, md_duration, tc_grps, dt=dt, output_policy=output_policy, solute_group=tc_grps[0])
+    except (OSError, ValueError) as e:
+        return f"Production failed with return code 1.\nCould not generate md.mdp: {e}"
+    missing = missing_index_groups(md_mdp, index_path) if index_path.exists() else []
+    if missing:
+        return (f"Production failed with return code 1.\n"
+                f"Index groups {', '.join(missing)} used in md.mdp are missing from {index_path}. "
+                f"Re-run the equilibration to create them.")
+    md_mdp.write(f"{sandbox_dir}/md.mdp")
 
     # ---------- Run prod_Gromacs.sh script --------------
 
@@ -355,7 +366,10 @@ gen_vel                 = no        ; continuing from NPT equilibration
         cmd.append(ligand_name)
         cmd.append(f"{sandbox_dir}/{ligand_name}.gro")
 
-    result = subprocess.run(cmd, cwd=sandbox_dir, stdout=sys.stdout, stderr=sys.stderr, text=True)
+    # md.xtc is analysed on the fly while mdrun writes it, so that gromacs_analysis only has to write the results
+    live = LiveAnalysis(sandbox_dir, "md.xtc", ligand_name=ligand_name)
+    result = subprocess.Popen(cmd, cwd=sandbox_dir, stdout=sys.stdout, stderr=sys.stderr, text=True)
+    live_report = live.follow(result)
 
     gromacs_output = ""
 
@@ -370,41 +384,60 @@ gen_vel                 = no        ; continuing from NPT equilibration
                 f"--- Full GROMACS Log ---\n"
                 f"{gromacs_output}\n"
                 f"--- Shell Script Stderr ---\n"
-                f"{result.stderr or 'None captured directly'}")
+                f"{result.stderr or 'None captured directly'}\n"
+                f"{live_report}")
     else:
         return (f"Equilibration ran successfully. Full GROMACS output:\n"
-                f"{gromacs_output}")
+                f"{gromacs_output}\n"
+                f"{live_report}")
 
 
 def gromacs_analysis(sandbox_dir: str, input_xtc: str, ligand_name=None) -> str:
     """
-    Run production MD with GROMACS using prod_Gromacs.sh.
+    Analyse the production trajectory in a single streaming pass (src.analysis), with blocks of frames processed in parallel:
+    PBC removal to <name>_noPBC.xtc, backbone RMSD, Cα RMSF, radius of gyration and hydrogen-bond counts, written to the usual .xvg files.
     """
-    script = constants.SCRIPTS_DIR / "analysis_Gromacs.sh"
     log_file_path = Path(f"{sandbox_dir}/gromacs_analysis.log")
+    try:
+        report = analyze_trajectory(sandbox_dir, input_xtc, ligand_name=ligand_name)
+    except Exception as e:
+        logger.exception("Trajectory analysis failed")
+        log_file_path.write_text(f"{type(e).__name__}: {e}\n", encoding="utf-8")
+        return (f"Analysis failed with return code 1.\n"
+                f"{type(e).__name__}: {e}")
 
-    cmd = [str(script), input_xtc, log_file_path]
+    log_file_path.write_text(report + "\n", encoding="utf-8")
+    return (f"Analysis ran successfully.\n"
+            f"{report}")
 
-    if ligand_name is not None:
-        cmd.append(ligand_name)
-        cmd.append(f"{sandbox_dir}/{ligand_name}.gro")
 
-    result = subprocess.run(cmd, cwd=sandbox_dir, stdout=sys.stdout, stderr=sys.stderr, text=True)
-
-    gromacs_output = ""
+def summarize_analysis(sandbox_dir: str, series=None, points: int = constants.SUMMARY_POINTS) -> str:
+    """
+    Statistics of the analysis results store written by gromacs_analysis (analysis_results.npz): mean/std, drift,
+    block averages and a downsampled trend per series, instead of the raw .xvg data.
+    """
+    results_path = Path(sandbox_dir) / RESULTS_FILE
+    if not results_path.exists():
+        return f"{RESULTS_FILE} not found in {sandbox_dir}. Run the gromacs_analysis tool first."
+    if isinstance(series, str):
+        series = [series]
+    return summarize_results(results_path, names=series or None, points=int(points))
 
-    if log_file_path.exists():
-        try:
-            gromacs_output = log_file_path.read_text(encoding="utf-8")
-        except Exception as e:
-            gromacs_output = f"Could not read GROMACS log file: {e}"
 
-    if result.returncode != 0:
-        return (f"Equilibration script failed with return code {result.returncode}.\n"
-                f"--- Full GROMACS Log ---\n"
-                f"{gromacs_output}\n"
-                f"--- Shell Script Stderr ---\n"
-                f"{result.stderr or 'None captured directly'}") 
-    else:
-        return (f"Equilibration ran successfully. Full GROMACS output:\n"
-                f"{gromacs_output}")
\ No newline at end of file
+def gromacs_clustering(sandbox_dir: str, input_xtc: str, ligand_name=None, cutoff: float = constants.CLUSTER_CUTOFF) -> str:
+    """
+    Cluster the PBC-corrected production trajectory (<name>_noPBC.xtc) into representative conformations (src.analysis.clustering):
+    cluster populations in clusters.csv, the cluster of each frame in clust-id.xvg and medoid structures in clusters/.
+    """
+    log_file_path = Path(f"{sandbox_dir}/gromacs_clustering.log")
+    try:
+        report = cluster_trajectory(sandbox_dir, input_xtc, ligand_name=ligand_name, cutoff=float(cutoff))
+    except Exception as e:
+        logger.exception("Trajectory clustering failed")
+        log_file_path.write_text(f"{type(e).__name__}: {e}\n", encoding="utf-8")
+        return (f"Clustering failed with return code 1.\n"
+                f"{type(e).__name__}: {e}")
+
+    log_file_path.write_text(report + "\n", encoding="utf-8")
+    return (f"Clustering ran successfully.\n"
+            f"{report}")
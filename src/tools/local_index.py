@@ -0,0 +1,297 @@
+"""
+Offline retrieval backend for search_papers: a local embedding model and an on-disk vector index over chunked PDF text.
+
+The text of each PDF (PyMuPDF, else pypdf) is split into overlapping chunks of LOCAL_CHUNK_SIZE characters, embedded
+in batches of LOCAL_EMBEDDING_BATCH and stored as unit float32 vectors in vectors.npy, memory-mapped at query time,
+with the chunk texts and their source (file, page) in chunks.jsonl. Queries are an exact top-k search by cosine
+similarity, computed blockwise over the memory map. The index is updated incrementally with the same content-hash
+manifest as PaperIndex: only new and changed PDFs are embedded. Each update writes a new generation of the vector and
+chunk files, then atomically replaces the manifest that names them, so an interrupted update leaves the previous
+index intact. No network access is needed, neither at ingest nor at query time.
+
+Embedding models: "hashing" (default) is a dependency-free signed feature-hashing embedding of words and word
+bigrams, with sublinear term frequencies; any other name is loaded with sentence-transformers (a local model
+directory or a model already in its cache).
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from src import constants
+from src.tools.paper_index import PaperIndex
+from src.utils import get_class_logger
+
+logger = get_class_logger(__name__)
+
+LOCAL_INDEX_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+SEARCH_BLOCK_ROWS = 65536  # vectors scored per block of the memory map
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams into dim dimensions, L2-normalized."""
+
+    def __init__(self, dim: int = constants.LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> dict[int, float]:
+        words = re.findall(r"[a-z0-9]+(?:[.+-][a-z0-9]+)*", text.lower())
+        counts = {}
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+            counts[h] = counts.get(h, 0) + 1
+        return counts
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for h, count in self._features(text).items():
+                vectors[i, h % self.dim] += (1.0 if (h >> 32) & 1 else -1.0) * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model run locally, with unit-normalized outputs."""
+
+    def __init__(self, model: str):
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+        except ImportError as e:
+            raise ImportError(f"The local embedding model {model} needs the sentence-transformers package; "
+                              f"set LOCAL_EMBEDDING_MODEL = \"hashing\" to index without it") from e
+        self.model = SentenceTransformer(model)
+        self.name = Path(model).name
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                            show_progress_bar=False), dtype=np.float32)
+
+
+def make_embedder(model: str = constants.LOCAL_EMBEDDING_MODEL):
+    return HashingEmbedder() if model == "hashing" else SentenceTransformerEmbedder(model)
+
+
+def pdf_pages(path) -> list[str]:
+    """Text of each page of a PDF, with PyMuPDF or else pypdf."""
+    try:
+        import fitz  # type: ignore
+    except ImportError:
+        try:
+            from pypdf import PdfReader  # type: ignore
+        except ImportError as e:
+            raise ImportError("Reading PDFs for the local paper index needs PyMuPDF or pypdf") from e
+        return [page.extract_text() or "" for page in PdfReader(str(path)).pages]
+    with fitz.open(str(path)) as document:
+        return [page.get_text() for page in document]
+
+
+def chunk_text(text: str, size: int = constants.LOCAL_CHUNK_SIZE, overlap: int = constants.LOCAL_CHUNK_OVERLAP) -> list[str]:
+    """Chunks of at most size characters overlapping by overlap, split at whitespace where possible."""
+    text = re.sub(r"\s+", " ", text).strip()
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + size // 2, end)
+            end = space if space > 0 else end
+        chunks.append(text[start:end].strip())
+        if end == len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [c for c in chunks if c]
+
+
+def _pdf_chunks(path: Path) -> list[dict]:
+    return [{"file": path.name, "page": page, "text": chunk}
+            for page, text in enumerate(pdf_pages(path), start=1) for chunk in chunk_text(text)]
+
+
+@dataclass
+class Passage:
+    """A retrieved chunk with its cosine similarity to the query."""
+    score: float
+    file: str
+    page: int
+    text: str
+
+
+class LocalPaperIndex:
+    """
+    On-disk vector index of the PDFs of paper_dir, in index_dir/local_v<LOCAL_INDEX_VERSION>/<embedding model>.
+
+    Args:
+        paper_dir: directory of the PDFs.
+        index_dir: root of the paper indexes (PAPER_INDEX_DIR).
+        embedder: embedding model, by default make_embedder().
+        workers: PDFs read concurrently.
+    """
+
+    def __init__(self, paper_dir=None, index_dir=None, embedder=None, workers: int | None = None):
+        self.paper_dir = Path(paper_dir or constants.PAPER_DIR)
+        self.embedder = embedder or make_embedder()
+        self.directory = Path(index_dir or constants.PAPER_INDEX_DIR) / f"local_v{LOCAL_INDEX_VERSION}" / self.embedder.name
+        self.workers = workers or constants.PAPER_INGEST_WORKERS
+        self._vectors = self._chunks = None
+
+    @property
+    def version(self) -> str:
+        """Identifier of the content of the index and its embedding model."""
+        manifest = self.manifest()
+        return hashlib.sha256(json.dumps([self.embedder.name] + sorted((n, e["sha256"]) for n, e in manifest.items())).encode()).hexdigest()[:16]
+
+    def _manifest_record(self) -> dict:
+        path = self.directory / MANIFEST_FILE
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def manifest(self) -> dict[str, dict]:
+        return self._manifest_record().get("files", {})
+
+    def _load_chunks(self) -> list[dict]:
+        name = self._manifest_record().get("chunks")
+        if name is None:
+            return []
+        with open(self.directory / name, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def vectors(self) -> np.ndarray:
+        """Read-only memory map of the (n_chunks, dim) unit vectors."""
+        if self._vectors is None:
+            name = self._manifest_record().get("vectors")
+            self._vectors = np.load(self.directory / name, mmap_mode="r") if name else np.zeros((0, 1), dtype=np.float32)
+        return self._vectors
+
+    def chunks(self) -> list[dict]:
+        if self._chunks is None:
+            self._chunks = self._load_chunks()
+        return self._chunks
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        batch = constants.LOCAL_EMBEDDING_BATCH
+        return np.concatenate([self.embedder.embed(texts[i:i + batch]) for i in range(0, len(texts), batch)]) if texts \
+            else np.zeros((0, 1), dtype=np.float32)
+
+    def _save(self, generation: int, keep: list[int], new_vectors: np.ndarray, chunks: list[dict], entries: dict) -> None:
+        """
+        Write generation-numbered vector and chunk files, then atomically replace the manifest naming them (the commit
+        point of the update) and delete the files of earlier generations.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        vectors_name, chunks_name = f"vectors-{generation}.npy", f"chunks-{generation}.jsonl"
+        old_vectors = self.vectors()
+        dim = new_vectors.shape[1] if len(new_vectors) else old_vectors.shape[1]
+        vectors = np.lib.format.open_memmap(self.directory / vectors_name, mode="w+", dtype=np.float32,
+                                            shape=(len(chunks), dim))
+        # Kept rows are copied block by block from the memory map of the previous generation
+        for i in range(0, len(keep), SEARCH_BLOCK_ROWS):
+            block = keep[i:i + SEARCH_BLOCK_ROWS]
+            vectors[i:i + len(block)] = old_vectors[block]
+        vectors[len(keep):] = new_vectors
+        vectors.flush()
+        del vectors
+        with open(self.directory / chunks_name, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(chunk) + "\n" for chunk in chunks)
+        tmp = self.directory / f"{MANIFEST_FILE}.tmp"
+        tmp.write_text(json.dumps({"version": LOCAL_INDEX_VERSION, "model": self.embedder.name, "generation": generation,
+                                   "vectors": vectors_name, "chunks": chunks_name, "files": entries}, indent=1),
+                       encoding="utf-8")
+        os.replace(tmp, self.directory / MANIFEST_FILE)
+        self._vectors, self._chunks = None, chunks
+        for path in list(self.directory.glob("vectors-*.npy")) + list(self.directory.glob("chunks-*.jsonl")):
+            if path.name not in (vectors_name, chunks_name):
+                path.unlink(missing_ok=True)
+
+    def update(self) -> tuple["LocalPaperIndex", dict]:
+        """
+        Embed the chunks of new and changed PDFs, drop those of changed and removed ones and save the index.
+        Returns the index and a summary as PaperIndex.update. PDFs that cannot be read are retried at the next update,
+        but the index is not rewritten when they are the only change.
+        """
+        start = time.perf_counter()
+        record = self._manifest_record()
+        manifest = record.get("files", {})
+        entries = PaperIndex(self.paper_dir, workers=self.workers).scan(manifest)
+        added = [name for name in entries if name not in manifest]
+        changed = [name for name in entries if name in manifest and entries[name]["sha256"] != manifest[name]["sha256"]]
+        removed = [name for name in manifest if name not in entries]
+        new = added + changed
+
+        failed, new_chunks = [], []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {name: pool.submit(_pdf_chunks, self.paper_dir / name) for name in new}
+            for name, future in futures.items():
+                try:
+                    new_chunks.extend(future.result())
+                except Exception as e:
+                    logger.warning(f"Could not index {name}: {e}")
+                    failed.append(name)
+                    del entries[name]  # retried at the next update
+
+        summary = {"added": [n for n in added if n not in failed], "changed": [n for n in changed if n not in failed],
+                   "removed": removed, "failed": failed, "unchanged": len(entries) - len(new) + len(failed)}
+        # A changed PDF that fails still has its old chunks removed, so it needs a rewrite like a removed one
+        if not (summary["added"] or changed or removed) and "vectors" in record:
+            summary["seconds"] = time.perf_counter() - start
+            return self, summary
+
+        old_chunks = self._load_chunks()
+        stale = set(changed) | set(removed)
+        keep = [i for i, chunk in enumerate(old_chunks) if chunk["file"] not in stale]
+        self._save(record.get("generation", 0) + 1, keep, self._embed([chunk["text"] for chunk in new_chunks]),
+                   [old_chunks[i] for i in keep] + new_chunks, entries)
+
+        summary["seconds"] = time.perf_counter() - start
+        logger.info(f"Local paper index {self.directory}: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+                    f"{len(removed)} removed, {len(failed)} failed, {summary['unchanged']} unchanged, "
+                    f"{len(self.chunks())} chunks ({summary['seconds']:.1f} s)")
+        return self, summary
+
+    def search(self, query: str, k: int = constants.LOCAL_TOP_K) -> list[Passage]:
+        """Exact top-k chunks by cosine similarity to the query."""
+        vectors, chunks = self.vectors(), self.chunks()
+        if not len(chunks):
+            return []
+        q = self.embedder.embed([query])[0]
+        scores = np.concatenate([vectors[i:i + SEARCH_BLOCK_ROWS] @ q for i in range(0, len(vectors), SEARCH_BLOCK_ROWS)])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [Passage(float(scores[i]), chunks[i]["file"], chunks[i]["page"], chunks[i]["text"]) for i in top]
+
+
+def format_passages(passages: list[Passage]) -> str:
+    return "\n\n".join(f"[{i}] {p.file}, p. {p.page} (similarity {p.score:.2f}):\n{p.text}" for i, p in enumerate(passages, start=1))
+
+
+def local_answer(index: LocalPaperIndex, query: str, k: int = constants.LOCAL_TOP_K,
+                 synthesize: bool = constants.LOCAL_SYNTHESIZE_ANSWER) -> tuple[str, bool]:
+    """
+    The top-k passages for query; with synthesize, followed by an answer written by the LLM (constants.MODEL_NAME)
+    from these passages only, citing them as [n]. The passages are returned alone if the LLM cannot be reached.
+    Returns the answer and whether it is the passages-only fallback of a failed synthesis, which does not match the
+    requested settings and must not be cached as their answer.
+    """
+    passages = index.search(query, k)
+    if not passages:
+        return f"I cannot answer. No indexed text in {index.paper_dir}.", False
+    context = format_passages(passages)
+    if not synthesize:
+        return f"Passages from the local paper index most relevant to: {query}\n\n{context}", False
+    try:
+        from litellm import completion
+        response = completion(model=constants.MODEL_NAME, temperature=0.0, messages=[
+            {"role": "system", "content": "Answer the question using only the numbered passages, citing them as [n]. "
+                                          "If they do not contain the answer, reply: I cannot answer."},
+            {"role": "user", "content": f"Passages:\n{context}\n\nQuestion: {query}"}])
+        answer = response.choices[0].message.content
+    except Exception as e:
+        logger.warning(f"Local paper search: answer synthesis failed, returning the passages: {e}")
+        return f"Passages from the local paper index most relevant to: {query}\n\n{context}", True
+    references = "\n".join(f"[{i}] {p.file}, p. {p.page}" for i, p in enumerate(passages, start=1))
+    return f"{answer}\n\nReferences:\n{references}", False
@@ -1,15 +1,47 @@
+import importlib
 import os
-from src.tools.amber_tools import run_tleap, run_tleap_ligand
-from src.tools.gromacs_tools import gromacs_equil, gromacs_production, gromacs_analysis
-from src.tools.pdb_tools import fix_pdb_file
-from src.tools.ligand_tools import param_ligand
-from src.tools.pdb_tools import prepare_pdb_file_ligand, add_caps, rename_histidines, fetch_and_save_pdb
-from src.tools.coding_tools import read_file, edit_file, list_files, find_input
-from src.tools.RAG_tools import search_papers
-from src.tools.MMPBSA import run_gmxMMPBSA
 from src import constants
 
 
+class LazyTool:
+    """
+    A tool function imported from its module on the first call, so that importing the tool map (and the agents) does
+    not import every tool's dependencies (litellm, paperqa, pdbfixer/openmm, Bio.PDB, MDAnalysis, parmed...).
+    """
+
+    def __init__(self, module: str, name: str):
+        self.module = module
+        self.name = name
+        self._func = None
+
+    def resolve(self):
+        if self._func is None:
+            self._func = getattr(importlib.import_module(self.module), self.name)
+        return self._func
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"LazyTool({self.module}.{self.name})"
+
+
+def _lazy(module: str, *names: str) -> list[LazyTool]:
+    return [LazyTool(f"src.tools.{module}", name) for name in names]
+
+
+run_tleap, run_tleap_ligand = _lazy("amber_tools", "run_tleap", "run_tleap_ligand")
+gromacs_equil, gromacs_production, gromacs_analysis, gromacs_clustering, summarize_analysis = _lazy(
+    "gromacs_tools", "gromacs_equil", "gromacs_production", "gromacs_analysis", "gromacs_clustering", "summarize_analysis")
+fix_pdb_file, prepare_pdb_file_ligand, add_caps, rename_histidines, fetch_and_save_pdb = _lazy(
+    "pdb_tools", "fix_pdb_file", "prepare_pdb_file_ligand", "add_caps", "rename_histidines", "fetch_and_save_pdb")
+param_ligand, = _lazy("ligand_tools", "param_ligand")
+read_file, edit_file, list_files, find_input = _lazy("coding_tools", "read_file", "edit_file", "list_files", "find_input")
+search_papers, = _lazy("RAG_tools", "search_papers")
+rank_binding_affinities, run_gmxMMPBSA = _lazy("MMPBSA", "rank_binding_affinities", "run_gmxMMPBSA")
+query_binding_energies, = _lazy("mmpbsa_results", "query_binding_energies")
+
+
 def truncate_file_output(full_content: str) -> str:
     """Truncate long file outputs to prevent LLM token overload."""
     if len(full_content) <= 2 * constants.MAX_CHARACTERS_TO_LOG:
@@ -32,21 +64,43 @@ TOOL_MAP = {
     # Ligand handling
     "param_ligand": lambda s, i: param_ligand(s.sandbox_dir, i["ligand_files"] if isinstance(i["ligand_files"], list) else [i["ligand_files"]], i["ligand_name"]),
     # AMBER-related
-    "run_tleap": lambda s, i: run_tleap(s.sandbox_dir, i["input_pdb"], i["pdb_id"]),
+    "run_tleap": lambda s, i: run_tleap(
+        s.sandbox_dir, i["input_pdb"], i["pdb_id"], hmr=s.hmr,
+        box_shape=i.get("box_shape", constants.BOX_SHAPE), buffer=i.get("buffer", constants.SOLVENT_BUFFER),
+    ),
     "run_tleap_ligand": lambda s, i: run_tleap_ligand(
-        s.sandbox_dir, i["input_pdb"], i["pdb_id"], i["ligand_files"] if isinstance(i["ligand_files"], list) else [i["ligand_files"]], i["ligand_name"]
+        s.sandbox_dir, i["input_pdb"], i["pdb_id"], i["ligand_files"] if isinstance(i["ligand_files"], list) else [i["ligand_files"]], i["ligand_name"], hmr=s.hmr,
+        box_shape=i.get("box_shape", constants.BOX_SHAPE), buffer=i.get("buffer", constants.SOLVENT_BUFFER),
     ),
     # GROMACS-related
     "gromacs_equil": lambda s, i: gromacs_equil(
         s.sandbox_dir, i["input_gro"], i["md_temp"], ligand_name=i.get("ligand_name"), ligand_files=i.get("ligand_files")
     ),
     "gromacs_production": lambda s, i: gromacs_production(
-        s.sandbox_dir, i["input_gro"], i["npt_cpt_file"], i["md_temp"], i["md_duration"], ligand_name=i.get("ligand_name")
+        s.sandbox_dir, i["input_gro"], i["npt_cpt_file"], i["md_temp"], i["md_duration"], ligand_name=i.get("ligand_name"), hmr=s.hmr,
+        output_policy=i.get("output_policy", constants.PRODUCTION_OUTPUT_POLICY),
     ),
     "gromacs_analysis": lambda s, i: gromacs_analysis(s.sandbox_dir, i["input_xtc"], ligand_name=i.get("ligand_name")),
+    "summarize_analysis": lambda s, i: summarize_analysis(
+        s.sandbox_dir, series=i.get("series"), points=i.get("points") or constants.SUMMARY_POINTS,
+    ),
+    "gromacs_clustering": lambda s, i: gromacs_clustering(
+        s.sandbox_dir, i["input_xtc"], ligand_name=i.get("ligand_name"), cutoff=i.get("cutoff") or constants.CLUSTER_CUTOFF,
+    ),
     # MMPBSA-related
     "run_gmxMMPBSA": lambda s, i: run_gmxMMPBSA(
         s.sandbox_dir, i["pdb_id"], i["nsteps"], i["nstxout_compressed"], i["md_temp"],
+        adaptive=bool(i.get("adaptive", constants.MMPBSA_ADAPTIVE)),
+        method=i.get("method") or "pb", ligand_name=s.ligand_name,
+    ),
+    "rank_binding_affinities": lambda s, i: rank_binding_affinities(
+        i.get("sandbox_dirs") or [str(s.sandbox_dir)], i.get("pdb_id") or s.pdb_id,
+        ligand_names=i.get("ligand_names") or (None if i.get("sandbox_dirs") else [s.ligand_name]),
+        top=i.get("top") or constants.MMPBSA_ESCALATE_TOP,
+        adaptive=bool(i.get("adaptive", constants.MMPBSA_ADAPTIVE)),
+    ),
+    "query_binding_energies": lambda s, i: query_binding_energies(
+        i.get("pdb_id"), i.get("ligand_name"), i.get("md_temp"), i.get("method"),
     ),
     # # RAG tools
     "search_papers": lambda _, i: search_papers(i["query"]),
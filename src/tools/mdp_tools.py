@@ -0,0 +1,304 @@
+import re
+from math import gcd
+from pathlib import Path
+from pydantic import BaseModel, model_validator
+from src import constants
+
+# Pair-list lifetime targeted when deriving nstlist; mdrun may still increase it at runtime on GPUs
+PAIR_LIST_LIFETIME = 0.04  # ps
+MAX_PAIR_LIST_LIFETIME = 0.1  # ps, longer lifetimes blow up the Verlet buffer
+DEFAULT_NSTCALCENERGY = 100
+ION_RESIDUES = ("Na+", "Cl-")
+
+# Comments written next to each entry in the .mdp files
+COMMENTS = {
+    "integrator": "md = leap-frog integrator, steep/cg = minimization",
+    "emtol": "stop minimization when the maximum force < emtol kJ/mol/nm",
+    "emstep": "initial step size (nm)",
+    "nsteps": "maximum number of steps",
+    "nstcgsteep": "steepest-descent step every nstcgsteep conjugate gradient steps",
+    "dt": "time step (ps)",
+    "nstenergy": "steps between energy frames",
+    "nstlog": "steps between log file updates",
+    "nstcalcenergy": "steps between energy calculations, divides nstenergy and nstlog",
+    "nstxout-compressed": "steps between compressed coordinate frames",
+    "compressed-x-grps": "group written to the compressed trajectory",
+    "nstxout": "steps between full-precision coordinate frames",
+    "nstvout": "steps between velocity frames",
+    "continuation": "do not constrain the starting configuration",
+    "constraint-algorithm": "holonomic constraints",
+    "constraints": "bonds to H are constrained",
+    "lincs-iter": "accuracy of LINCS",
+    "lincs-order": "also related to accuracy",
+    "nstlist": "pair-list update interval (steps)",
+    "verlet-buffer-tolerance": "sets rlist automatically (kJ/mol/ps per atom)",
+    "rvdw": "short-range van der Waals cutoff (nm)",
+    "coulombtype": "Particle Mesh Ewald for long-range electrostatics",
+    "pme-order": "cubic interpolation",
+    "fourierspacing": "grid spacing for FFT",
+    "tcoupl": "modified Berendsen thermostat",
+    "tc-grps": "coupling groups, must exist in index.ndx",
+    "tau-t": "time constant (ps)",
+    "ref-t": "reference temperature, one for each group (K)",
+    "pcoupl": "pressure coupling",
+    "pcoupltype": "uniform scaling of box vectors",
+    "tau-p": "time constant (ps)",
+    "ref-p": "reference pressure (bar)",
+    "compressibility": "isothermal compressibility of water (bar^-1)",
+    "pbc": "3-D PBC",
+    "gen-vel": "no velocity generation, continuing from the previous stage",
+}
+
+
+class MdpParameters(BaseModel):
+    """
+    Typed parameters of a GROMACS .mdp file. Unset (None) entries are not written.
+    Cross-field consistency is checked on construction so that grompp does not fail later on.
+    """
+
+    title: str
+    define: str | None = None
+    # Run parameters
+    integrator: str = "md"
+    emtol: float | None = None
+    emstep: float | None = None
+    nsteps: int
+    nstcgsteep: int | None = None
+    dt: float | None = None
+    # Output control
+    nstenergy: int | None = None
+    nstlog: int | None = None
+    nstcalcenergy: int | None = None
+    nstxout_compressed: int | None = None
+    compressed_x_grps: str | None = None
+    nstxout: int | None = None
+    nstvout: int | None = None
+    # Bond parameters
+    continuation: str | None = None
+    constraint_algorithm: str | None = None
+    constraints: str | None = None
+    lincs_iter: int | None = None
+    lincs_order: int | None = None
+    # Neighbor searching and vdW
+    cutoff_scheme: str = "Verlet"
+    nstlist: int
+    verlet_buffer_tolerance: float | None = None
+    vdwtype: str = "cutoff"
+    vdw_modifier: str = "force-switch"
+    rvdw_switch: float = 1.0
+    rvdw: float = 1.2
+    # Electrostatics
+    coulombtype: str = "PME"
+    rcoulomb: float = 1.2
+    pme_order: int | None = None
+    fourierspacing: float | None = None
+    # Temperature coupling
+    tcoupl: str | None = None
+    tc_grps: list[str] | None = None
+    tau_t: list[float] | None = None
+    ref_t: list[float] | None = None
+    # Pressure coupling
+    pcoupl: str | None = None
+    pcoupltype: str | None = None
+    tau_p: float | None = None
+    ref_p: float | None = None
+    compressibility: float | None = None
+    refcoord_scaling: str | None = None
+    # Periodic boundary conditions and dispersion correction
+    pbc: str = "xyz"
+    DispCorr: str = "no"
+    # Velocity generation
+    gen_vel: str | None = None
+
+    @model_validator(mode="after")
+    def _check_consistency(self):
+        if self.integrator in ("md", "sd"):
+            if self.dt is None:
+                raise ValueError(f"{self.title}: dynamics requires dt")
+            if self.nstlist * self.dt > MAX_PAIR_LIST_LIFETIME:
+                raise ValueError(
+                    f"{self.title}: nstlist = {self.nstlist} with dt = {self.dt} gives a pair-list lifetime above {MAX_PAIR_LIST_LIFETIME} ps"
+                )
+            if self.nstcalcenergy is not None:
+                for name in ("nstenergy", "nstlog"):
+                    value = getattr(self, name)
+                    if value and value % self.nstcalcenergy:
+                        raise ValueError(f"{self.title}: {name} = {value} must be a multiple of nstcalcenergy = {self.nstcalcenergy}")
+        if self.tcoupl not in (None, "no"):
+            n_groups = len(self.tc_grps or [])
+            if n_groups == 0 or len(self.tau_t or []) != n_groups or len(self.ref_t or []) != n_groups:
+                raise ValueError(f"{self.title}: tc-grps, tau-t and ref-t must have the same number of entries")
+        if self.integrator in ("cg", "l-bfgs"):
+            # grompp rejects constraints with these minimizers; SETTLE water counts as one unless FLEXIBLE is defined
+            if self.constraints not in (None, "none"):
+                raise ValueError(f"{self.title}: integrator = {self.integrator} does not support constraints = {self.constraints}")
+            if "-DFLEXIBLE" not in (self.define or "").split():
+                raise ValueError(f"{self.title}: integrator = {self.integrator} needs flexible water (define = -DFLEXIBLE)")
+        if self.compressed_x_grps and not self.nstxout_compressed:
+            raise ValueError(f"{self.title}: compressed-x-grps requires nstxout-compressed > 0")
+        if self.nstlist < 1:
+            raise ValueError(f"{self.title}: nstlist must be at least 1")
+        return self
+
+    def index_groups(self) -> list[str]:
+        """Index groups referenced by these parameters."""
+        groups = list(self.tc_grps or [])
+        if self.compressed_x_grps:
+            groups.append(self.compressed_x_grps)
+        return groups
+
+    def render(self) -> str:
+        lines = []
+        for name, value in self.model_dump(exclude_none=True).items():
+            key = name if name == "DispCorr" else name.replace("_", "-")
+            if isinstance(value, list):
+                value = "   ".join(f"{v:g}" if isinstance(v, float) else str(v) for v in value)
+            elif isinstance(value, float):
+                value = f"{value:g}"
+            comment = COMMENTS.get(key)
+            entry = f"{key:<24}= {value}"
+            lines.append(f"{entry:<47} ; {comment}" if comment else entry)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str | Path) -> None:
+        Path(path).write_text(self.render(), encoding="utf-8")
+
+
+def pair_list_interval(dt: float) -> int:
+    """nstlist giving a pair-list lifetime of PAIR_LIST_LIFETIME ps (20 steps at 2 fs, 10 at 4 fs)."""
+    return max(10, int(round(PAIR_LIST_LIFETIME / dt)))
+
+
+def output_interval(nsteps: int, target_frames: int, dt: float, min_interval: float) -> int:
+    """Steps between output frames so that a run of nsteps yields about target_frames frames."""
+    interval = max(min_interval, nsteps * dt / target_frames)
+    return max(1, int(round(interval / dt)))
+
+
+def energy_calc_interval(*intervals: int) -> int:
+    """Largest nstcalcenergy (at most the GROMACS default of 100) dividing all the given output intervals."""
+    result = DEFAULT_NSTCALCENERGY
+    for interval in intervals:
+        result = gcd(result, interval)
+    return result
+
+
+def thermostat_groups(structure_gro: str | Path, ligand_name=None) -> list[str]:
+    """
+    Temperature coupling groups matching the index groups created by equil_Gromacs.sh:
+    the solute (Protein or Protein_<ligand>) and the solvent (Water_and_ions when ions are present, else Water).
+    """
+    residues = set()
+    with open(structure_gro, encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines()[2:-1]
+    for line in lines:
+        residues.add(line[5:10].strip())
+    solute = f"Protein_{ligand_name}" if ligand_name else "Protein"
+    solvent = "Water_and_ions" if residues.intersection(ION_RESIDUES) else "Water"
+    return [solute, solvent]
+
+
+def read_index_groups(index_path: str | Path) -> list[str]:
+    """Names of the groups defined in a GROMACS index file."""
+    text = Path(index_path).read_text(encoding="utf-8", errors="replace")
+    return re.findall(r"^\s*\[\s*(\S+)\s*\]", text, flags=re.M)
+
+
+def missing_index_groups(params: MdpParameters, index_path: str | Path) -> list[str]:
+    """Index groups referenced by params that do not exist in index_path."""
+    available = set(read_index_groups(index_path))
+    return [group for group in params.index_groups() if group not in available]
+
+
+def _dynamics_defaults(dt: float) -> dict:
+    return dict(
+        integrator="md",
+        dt=dt,
+        constraint_algorithm="lincs",
+        constraints="h-bonds",
+        lincs_iter=1,
+        lincs_order=4,
+        nstlist=pair_list_interval(dt),
+        verlet_buffer_tolerance=0.005,
+        pme_order=4,
+        fourierspacing=0.16,
+        tcoupl="V-rescale",
+        tau_t=[0.1, 0.1],
+        pcoupltype="isotropic",
+        tau_p=2.0,
+        ref_p=1.0,
+        compressibility=4.5e-5,
+        gen_vel="no",
+    )
+
+
+def minimization_mdp(integrator: str = "steep", nsteps: int = constants.EM_MAX_STEPS) -> MdpParameters:
+    """
+    Energy minimization: em_sd.mdp (one steepest-descent segment, removing clashes)
+    or em.mdp (conjugate gradient continuing from it, with flexible water since cg allows no constraints).
+    """
+    return MdpParameters(
+        title="Minimization" if integrator == "cg" else "Steepest-descent minimization",
+        define="-DFLEXIBLE" if integrator == "cg" else None,
+        integrator=integrator,
+        emtol=constants.EM_TOLERANCE,
+        emstep=0.01 if integrator == "steep" else None,
+        nsteps=nsteps,
+        nstcgsteep=1000 if integrator == "cg" else None,
+        nstlist=10,
+    )
+
+
+def equilibration_mdp(stage: str, md_temp: float, tc_grps: list[str], nsteps: int = 5000) -> MdpParameters:
+    """Position-restrained equilibration (nvt.mdp, npt.mdp): 10 ps at 2 fs with outputs every 1 ps."""
+    dt = constants.MD_TIMESTEP
+    nstout = int(round(1.0 / dt))
+    return MdpParameters(
+        title=f"Protein-ligand complex {stage.upper()} equilibration",
+        define="-DPOSRES",
+        nsteps=nsteps,
+        nstenergy=nstout,
+        nstlog=nstout,
+        nstcalcenergy=energy_calc_interval(nstout),
+        nstxout_compressed=nstout,
+        continuation="yes",
+        tc_grps=tc_grps,
+        ref_t=[float(md_temp)] * len(tc_grps),
+        pcoupl="Berendsen",
+        refcoord_scaling="com",
+        **_dynamics_defaults(dt),
+    )
+
+
+def production_mdp(
+    md_temp: float,
+    md_duration: float,
+    tc_grps: list[str],
+    dt: float = constants.MD_TIMESTEP,
+    output_policy: str = "full",
+    solute_group: str | None = None,
+) -> MdpParameters:
+    """
+    Production MD (md.mdp). Energies and log are written every MD_OUTPUT_INTERVAL ps.
+    In "reduced" mode only solute_group goes to md.xtc, at an interval giving ~ANALYSIS_TARGET_FRAMES frames,
+    and the full system is written FULL_SYSTEM_FRAMES times to md.trr as sparse snapshots (restarts use md.cpt).
+    """
+    nsteps = int(round(float(md_duration) * 1000 / dt))
+    nstout = int(round(constants.MD_OUTPUT_INTERVAL / dt))
+    outputs = dict(nstenergy=nstout, nstlog=nstout, nstcalcenergy=energy_calc_interval(nstout), nstxout_compressed=nstout)
+
+    if output_policy == "reduced":
+        nstout_xtc = output_interval(nsteps, constants.ANALYSIS_TARGET_FRAMES, dt, constants.ANALYSIS_MIN_FRAME_INTERVAL)
+        nstout_full = max(nsteps // constants.FULL_SYSTEM_FRAMES, nstout_xtc)
+        outputs.update(nstxout_compressed=nstout_xtc, compressed_x_grps=solute_group, nstxout=nstout_full, nstvout=nstout_full)
+
+    return MdpParameters(
+        title="Protein-ligand complex MD simulation",
+        nsteps=nsteps,
+        continuation="yes",
+        tc_grps=tc_grps,
+        ref_t=[float(md_temp)] * len(tc_grps),
+        pcoupl="Parrinello-Rahman",
+        **outputs,
+        **_dynamics_defaults(dt),
+    )
@@ -0,0 +1,258 @@
+"""
+Structured gmx_MMPBSA results and a local database of binding free energies across runs.
+
+The Delta (Complex - Receptor - Ligand) section of FINAL_RESULTS_MMPBSA.dat is parsed into one BindingResult per
+solvation model (POISSON BOLTZMANN, GENERALIZED BORN), with the average, SD and SEM of each energy term (ΔVDWAALS,
+ΔEEL, ΔEPB/ΔEGB, ΔENPOLAR, ΔGGAS, ΔGSOLV, ΔTOTAL), plus the per-residue decomposition when gmx_MMPBSA wrote one
+(FINAL_DECOMP_MMPBSA.csv). Results are stored in an indexed SQLite database keyed by PDB ID, ligand, temperature
+and run ID, so that runs are compared with a query instead of opening the result files of each run directory.
+"""
+import csv
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+from src import constants
+
+RESULTS_DAT = "FINAL_RESULTS_MMPBSA.dat"
+RESULTS_CSV = "FINAL_RESULTS_MMPBSA.csv"
+DECOMP_CSV = "FINAL_DECOMP_MMPBSA.csv"
+_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?|nan", re.IGNORECASE)
+
+
+@dataclass
+class EnergyTerm:
+    """Average, standard deviation and standard error of the mean of one energy term (kcal/mol)."""
+    name: str
+    average: float
+    sd: float
+    sem: float
+
+
+@dataclass
+class ResidueContribution:
+    """Total contribution of one residue to the binding free energy (kcal/mol), from the decomposition."""
+    residue: str
+    total: float
+    sd: float
+    sem: float
+
+
+@dataclass
+class BindingResult:
+    """
+    Binding free energy of one gmx_MMPBSA run with one solvation model.
+
+    Args:
+        pdb_id: PDB ID of the target.
+        ligand: ligand residue name (empty if unknown).
+        temperature: MD temperature (K).
+        run_id: identifier of the run, by default the name of its sandbox directory.
+        method: "pb" or "gb".
+        terms: Delta energy terms keyed by name without the Δ prefix (e.g. "VDWAALS", "TOTAL").
+        residues: per-residue decomposition, if computed.
+        n_frames: frames in the per-frame energy file (0 if missing).
+        path: directory of the result files.
+    """
+    pdb_id: str
+    ligand: str
+    temperature: float
+    run_id: str
+    method: str
+    terms: dict[str, EnergyTerm]
+    residues: list[ResidueContribution] = field(default_factory=list)
+    n_frames: int = 0
+    path: str = ""
+
+    @property
+    def delta_g(self) -> EnergyTerm:
+        return self.terms["TOTAL"]
+
+
+def _numbers(cells) -> list[float]:
+    return [float(c) for c in cells if _NUMBER.fullmatch(c)]
+
+
+def parse_energy_csv(path) -> dict[tuple[str, str], tuple[list[str], np.ndarray]]:
+    """
+    Per-frame energy terms of a gmx_MMPBSA energy file (-eo): {(model, section): (columns, rows)}, e.g.
+    ("POISSON BOLTZMANN", "Delta Energy Terms"), with one row per frame (the first column is the frame number).
+    """
+    tables, rows = {}, {}
+    model = section = ""
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        for line in csv.reader(f):
+            cells = [c.strip() for c in line]
+            if not any(cells):
+                continue
+            first = cells[0]
+            if first.lower().startswith("frame"):
+                tables[(model, section)] = cells
+                rows[(model, section)] = []
+            elif re.fullmatch(r"[-+]?\d+(\.\d*)?", first) and (model, section) in rows:
+                rows[(model, section)].append([float(c) for c in cells if c])
+            elif first.endswith(":") and first[:-1].isupper():
+                model = first[:-1]
+            else:
+                section = first
+    return {key: (columns, np.array(rows[key], dtype=float).reshape(-1, len(columns))) for key, columns in tables.items()}
+
+
+def parse_results_dat(path, model: str = "pb") -> dict[str, dict[str, EnergyTerm]]:
+    """
+    Delta energy terms of a FINAL_RESULTS_MMPBSA.dat file per model: {"pb"|"gb": {name: EnergyTerm}}. Terms before
+    any model heading are attributed to model.
+    """
+    models, columns, in_delta = {}, [], False
+    for line in Path(path).read_text(encoding="utf-8", errors="replace").splitlines():
+        stripped = line.strip()
+        if stripped.startswith(("POISSON BOLTZMANN", "GENERALIZED BORN")):
+            model, in_delta = "pb" if stripped.startswith("POISSON") else "gb", False
+        elif stripped.endswith(":"):
+            in_delta = stripped.startswith("Delta")
+        elif stripped.startswith("Energy Component"):
+            columns = re.split(r"\s{2,}", stripped)[1:]
+        elif in_delta and stripped and not stripped.startswith("-"):
+            name, *cells = stripped.split()
+            values = dict(zip(columns, _numbers(cells)))
+            if "Average" in values:
+                name = name.lstrip("Δ")
+                models.setdefault(model, {})[name] = EnergyTerm(name, values["Average"], values.get("SD", float("nan")),
+                                                                 values.get("SEM", float("nan")))
+    return models
+
+
+def parse_decomposition_csv(path) -> list[ResidueContribution]:
+    """Per-residue total contributions of the DELTAS section of a gmx_MMPBSA decomposition file in .csv format."""
+    contributions, total, in_deltas = [], None, False
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        for row in csv.reader(f):
+            cells = [c.strip() for c in row]
+            if not any(cells):
+                continue
+            if cells[0].endswith(":"):
+                in_deltas = cells[0].upper().startswith("DELTA") or (in_deltas and cells[0].startswith("Total"))
+            elif in_deltas and cells[0] == "Residue" and "TOTAL" in cells:
+                total = cells.index("TOTAL")
+            elif in_deltas and total is not None and cells[0]:
+                values = _numbers(cells[total:total + 3])
+                if len(values) == 3:
+                    contributions.append(ResidueContribution(cells[0], *values))
+    return contributions
+
+
+def read_mmpbsa_results(run_dir, pdb_id: str, ligand: str | None, temperature, run_id: str | None = None,
+                        method: str | None = None) -> list[BindingResult]:
+    """BindingResults of the result files of a gmx_MMPBSA output directory (one per model found in the .dat file)."""
+    run_dir = Path(run_dir)
+    models = parse_results_dat(run_dir / RESULTS_DAT, method or "pb")
+    residues = parse_decomposition_csv(run_dir / DECOMP_CSV) if (run_dir / DECOMP_CSV).exists() else []
+    n_frames = 0
+    if (run_dir / RESULTS_CSV).exists():
+        n_frames = max((len(rows) for _, rows in parse_energy_csv(run_dir / RESULTS_CSV).values()), default=0)
+    return [BindingResult(pdb_id, ligand or "", float(temperature), run_id or run_dir.resolve().parent.name, model, terms,
+                          residues, n_frames, str(run_dir.resolve()))
+            for model, terms in models.items() if "TOTAL" in terms and (method is None or model == method)]
+
+
+class BindingDatabase:
+    """
+    SQLite database of binding free energies. One row per (run_id, method) in results, replaced when a run is
+    recorded again, with its energy terms and per-residue contributions in child tables.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, pdb_id TEXT NOT NULL, ligand TEXT NOT NULL,
+            temperature REAL NOT NULL, method TEXT NOT NULL, dg REAL, sd REAL, sem REAL, n_frames INTEGER,
+            path TEXT, recorded REAL, UNIQUE (run_id, method));
+        CREATE INDEX IF NOT EXISTS results_key ON results (pdb_id, ligand, temperature);
+        CREATE TABLE IF NOT EXISTS terms (
+            result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE, name TEXT NOT NULL,
+            average REAL, sd REAL, sem REAL, PRIMARY KEY (result_id, name));
+        CREATE TABLE IF NOT EXISTS residues (
+            result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE, residue TEXT NOT NULL,
+            total REAL, sd REAL, sem REAL, PRIMARY KEY (result_id, residue));
+        CREATE INDEX IF NOT EXISTS residues_residue ON residues (residue);
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or constants.MMPBSA_DATABASE)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add(self, results: list[BindingResult]) -> None:
+        with self.connection:
+            for r in results:
+                self.connection.execute("DELETE FROM results WHERE run_id = ? AND method = ?", (r.run_id, r.method))
+                result_id = self.connection.execute(
+                    "INSERT INTO results (run_id, pdb_id, ligand, temperature, method, dg, sd, sem, n_frames, path, recorded) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (r.run_id, r.pdb_id.upper(), r.ligand, r.temperature, r.method, r.delta_g.average, r.delta_g.sd,
+                     r.delta_g.sem, r.n_frames, r.path, time.time())).lastrowid
+                self.connection.executemany("INSERT INTO terms VALUES (?, ?, ?, ?, ?)",
+                                            [(result_id, t.name, t.average, t.sd, t.sem) for t in r.terms.values()])
+                self.connection.executemany("INSERT INTO residues VALUES (?, ?, ?, ?, ?)",
+                                            [(result_id, c.residue, c.total, c.sd, c.sem) for c in r.residues])
+
+    def query(self, pdb_id: str | None = None, ligand: str | None = None, temperature=None,
+              method: str | None = None) -> list[dict]:
+        """Results matching the given keys, most favourable binding free energy first, with their energy terms."""
+        filters = {"pdb_id": pdb_id.upper() if pdb_id else None, "ligand": ligand, "temperature": temperature, "method": method}
+        where = [f"{key} = ?" for key, value in filters.items() if value is not None]
+        rows = self.connection.execute(
+            "SELECT * FROM results" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY dg",
+            [value for value in filters.values() if value is not None]).fetchall()
+        results = [dict(row) for row in rows]
+        for result in results:
+            result["terms"] = {t["name"]: t["average"] for t in self.connection.execute(
+                "SELECT name, average FROM terms WHERE result_id = ?", (result["id"],))}
+        return results
+
+    def residue_contributions(self, residue: str) -> list[dict]:
+        """Contribution of one residue (as named in the decomposition) across all the recorded runs."""
+        return [dict(row) for row in self.connection.execute(
+            "SELECT results.run_id, results.pdb_id, results.ligand, results.method, residues.total, residues.sem "
+            "FROM residues JOIN results ON residues.result_id = results.id WHERE residues.residue = ? ORDER BY residues.total",
+            (residue,))]
+
+
+def record_mmpbsa_results(run_dir, pdb_id: str, ligand: str | None, temperature, run_id: str | None = None,
+                          method: str | None = None, database=None) -> list[BindingResult]:
+    """Parse the results of a gmx_MMPBSA output directory and add them to the binding free energy database."""
+    results = read_mmpbsa_results(run_dir, pdb_id, ligand, temperature, run_id, method)
+    with BindingDatabase(database) as db:
+        db.add(results)
+    return results
+
+
+def query_binding_energies(pdb_id: str | None = None, ligand: str | None = None, temperature=None,
+                           method: str | None = None, database=None) -> str:
+    """Table of the recorded binding free energies matching the given keys."""
+    with BindingDatabase(database) as db:
+        results = db.query(pdb_id, ligand, temperature, method)
+        path = db.path
+    if not results:
+        return f"No binding free energies recorded in {path} for these criteria."
+    lines = [f"{len(results)} binding free energies from {path} (kcal/mol, most favourable first):",
+             "run_id, pdb_id, ligand, temperature (K), method, frames, ΔTOTAL ± SEM, ΔVDWAALS, ΔEEL, ΔGSOLV"]
+    for r in results:
+        terms = r["terms"]
+        lines.append(f"{r['run_id']}, {r['pdb_id']}, {r['ligand'] or '-'}, {r['temperature']:g}, {r['method']}, {r['n_frames']}, "
+                     f"{r['dg']:.2f} ± {r['sem']:.2f}, "
+                     + ", ".join(f"{terms[name]:.2f}" if name in terms else "-" for name in ("VDWAALS", "EEL", "GSOLV")))
+    return "\n".join(lines)
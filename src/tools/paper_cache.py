@@ -0,0 +1,108 @@
+"""
+Persistent cache of search_papers answers.
+
+Answers are stored in a SQLite file keyed by the normalized query text (case, accents, punctuation and spacing
+ignored), the version of the paper index (PaperIndex.version) and a hash of the paperqa query settings, so that a
+question asked again on an unchanged library returns without a paperqa query. Optionally (PAPER_CACHE_SIMILARITY), a
+query that differs from a cached one only by stopwords, word order and plural endings reuses its answer: a single
+different content word (a residue name, a ligand, a PDB ID) can change the scientific answer entirely. The cache
+keeps at most PAPER_CACHE_MAX_ENTRIES answers, evicting the least recently used ones.
+"""
+import contextlib
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from pathlib import Path
+from src import constants
+
+_STOPWORDS = {"a", "an", "the", "of", "for", "in", "on", "at", "to", "and", "or", "is", "are", "what", "which", "with", "by",
+              "do", "does", "how", "be", "should", "can", "it", "its", "this", "that", "these", "those", "from", "as"}
+
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize("NFKD", query).encode("ascii", "ignore").decode().lower()
+    return " ".join(re.findall(r"[a-z0-9]+(?:[.+-][a-z0-9]+)*", text))
+
+
+def _words(normalized: str) -> set[str]:
+    """Words of a normalized query, with plural "s" endings removed."""
+    return {w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") and w not in _STOPWORDS else w
+            for w in normalized.split()}
+
+
+def settings_hash(settings: dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class QueryCache:
+    """
+    Size-bounded answer cache.
+
+    Args:
+        path: SQLite file of the cache.
+        max_entries: answers kept (least recently used evicted first).
+        similarity: minimum Jaccard index of the query words for a similar-query hit, which must also differ only
+            by stopwords; None for exact matches only.
+    """
+
+    def __init__(self, path=None, max_entries: int | None = None, similarity: float | None = constants.PAPER_CACHE_SIMILARITY):
+        self.path = Path(path or constants.PAPER_CACHE_FILE)
+        self.max_entries = max_entries or constants.PAPER_CACHE_MAX_ENTRIES
+        self.similarity = similarity
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, scope TEXT NOT NULL, query TEXT NOT NULL, "
+                "normalized TEXT NOT NULL, answer TEXT NOT NULL, created REAL, used REAL, hits INTEGER DEFAULT 0)")
+            connection.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope)")
+            connection.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, so that the cache can be used from any thread
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _scope(index_version: str, settings: dict) -> str:
+        return f"{index_version}:{settings_hash(settings)}"
+
+    def get(self, query: str, index_version: str, settings: dict) -> tuple[str, str] | None:
+        """(answer, cached query) for query, an exact or similar match in the same index version and settings, or None."""
+        normalized, scope = normalize_query(query), self._scope(index_version, settings)
+        with self._connect() as connection:
+            row = connection.execute("SELECT key, query, answer FROM answers WHERE key = ?",
+                                     (hashlib.sha256(f"{scope}:{normalized}".encode()).hexdigest(),)).fetchone()
+            if row is None and self.similarity is not None:
+                words = _words(normalized)
+                best = 0.0
+                for key, cached_query, cached_normalized, answer in connection.execute(
+                        "SELECT key, query, normalized, answer FROM answers WHERE scope = ?", (scope,)):
+                    cached_words = _words(cached_normalized)
+                    if not (words ^ cached_words) <= _STOPWORDS:
+                        continue
+                    score = len(words & cached_words) / len(words | cached_words) if words | cached_words else 0.0
+                    if score >= self.similarity and score > best:
+                        best, row = score, (key, cached_query, answer)
+            if row is None:
+                return None
+            connection.execute("UPDATE answers SET used = ?, hits = hits + 1 WHERE key = ?", (time.time(), row[0]))
+        return row[2], row[1]
+
+    def put(self, query: str, index_version: str, settings: dict, answer: str) -> None:
+        normalized, scope = normalize_query(query), self._scope(index_version, settings)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO answers (key, scope, query, normalized, answer, created, used) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (hashlib.sha256(f"{scope}:{normalized}".encode()).hexdigest(), scope, query, normalized,
+                                answer, now, now))
+            connection.execute("DELETE FROM answers WHERE key NOT IN (SELECT key FROM answers ORDER BY used DESC LIMIT ?)",
+                               (self.max_entries,))
@@ -0,0 +1,176 @@
+"""
+Incremental index of the papers in PAPER_DIR for search_papers.
+
+The paperqa Docs object is pickled in a fixed, versioned location (PAPER_INDEX_DIR/v<INDEX_VERSION>) next to a
+manifest of the indexed PDFs (content hash, size and modification time, paperqa dockey). Each update hashes the PDFs
+(only those whose size or modification time changed since the manifest), ingests the new and changed ones concurrently
+and deletes the removed ones, so that adding a paper to a large library only embeds that paper.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tqdm import tqdm
+from src import constants
+from src.utils import get_class_logger
+
+# paperqa is imported when the index is loaded or updated: the manifest and file scan are shared with the local
+# backend (src.tools.local_index), which does not need it
+
+logger = get_class_logger(__name__)
+
+INDEX_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+DOCS_FILE = "docs.pkl"
+
+
+def file_hash(path) -> str:
+    """SHA-256 of the content of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PaperIndex:
+    """
+    Paper library index with a content-hash manifest.
+
+    Args:
+        paper_dir: directory of the PDFs.
+        index_dir: root of the index; the files of this version are in index_dir/v<INDEX_VERSION>.
+        workers: PDFs parsed and embedded concurrently.
+    """
+
+    def __init__(self, paper_dir=None, index_dir=None, workers: int | None = None):
+        self.paper_dir = Path(paper_dir or constants.PAPER_DIR)
+        self.directory = Path(index_dir or constants.PAPER_INDEX_DIR) / f"v{INDEX_VERSION}"
+        self.workers = workers or constants.PAPER_INGEST_WORKERS
+
+    @property
+    def version(self) -> str:
+        """Identifier of the current content of the index (changes whenever a paper is added, changed or removed)."""
+        manifest = self.manifest()
+        return hashlib.sha256(json.dumps(sorted((name, entry["sha256"]) for name, entry in manifest.items())).encode()).hexdigest()[:16]
+
+    def manifest(self) -> dict[str, dict]:
+        path = self.directory / MANIFEST_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))["files"]
+
+    def load(self) -> "Docs":
+        """The indexed Docs, or an empty Docs if the index was never built."""
+        from paperqa import Docs
+        path = self.directory / DOCS_FILE
+        if not path.exists():
+            return Docs()
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _save(self, docs: "Docs", manifest: dict) -> None:
+        """Write the Docs and the manifest through temporary files, so that an interrupted update keeps the last index."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, write in ((DOCS_FILE, lambda f: pickle.dump(docs, f)),
+                            (MANIFEST_FILE, lambda f: f.write(json.dumps({"version": INDEX_VERSION, "files": manifest},
+                                                                         indent=1).encode()))):
+            tmp = self.directory / f"{name}.tmp"
+            with open(tmp, "wb") as f:
+                write(f)
+            os.replace(tmp, self.directory / name)
+
+    def scan(self, manifest: dict) -> dict[str, dict]:
+        """Current entries of the PDFs in paper_dir; files whose size and modification time are unchanged are not re-hashed."""
+        entries = {}
+        to_hash = []
+        for path in sorted(self.paper_dir.glob("*.pdf")):
+            stat = path.stat()
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+            previous = manifest.get(path.name)
+            if previous and previous["size"] == entry["size"] and previous["mtime"] == entry["mtime"]:
+                entry["sha256"] = previous["sha256"]
+            else:
+                to_hash.append(path)
+            entries[path.name] = entry
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path, digest in zip(to_hash, pool.map(file_hash, to_hash)):
+                entries[path.name]["sha256"] = digest
+        return entries
+
+    async def _ingest(self, docs: "Docs", paths: list[Path], keys: list[str], progress: bool = True) -> list[BaseException | None]:
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def add(path, key):
+            async with semaphore:
+                try:
+                    await docs.aadd(path, dockey=key)
+                except Exception as e:
+                    return e
+                return None
+
+        tasks = [asyncio.ensure_future(add(p, k)) for p, k in zip(paths, keys)]
+        with tqdm(total=len(tasks), desc="Indexing PDFs", file=sys.__stderr__, disable=not progress,
+                  bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} ({percentage:.1f}%) [ time left: {remaining}, time spent: {elapsed}]") as pbar:
+            for task in asyncio.as_completed(tasks):
+                await task
+                pbar.update(1)
+        return [task.result() for task in tasks]
+
+    def update(self, redirect_output: bool = True) -> tuple["Docs", dict]:
+        """
+        Bring the index up to date with paper_dir: ingest new and changed PDFs, delete removed ones, save.
+        Returns the Docs and a summary (added, changed, removed, failed file names, unchanged count, seconds).
+        Without redirect_output (e.g. in a background thread, where redirecting sys.stdout would also silence the
+        main thread), paperqa output is not suppressed and the progress bar is disabled.
+        """
+        from paperqa import Docs
+        start = time.perf_counter()
+        manifest = self.manifest()
+        docs = self.load() if manifest else Docs()
+        entries = self.scan(manifest)
+
+        added = [name for name in entries if name not in manifest]
+        changed = [name for name in entries if name in manifest and entries[name]["sha256"] != manifest[name]["sha256"]]
+        removed = [name for name in manifest if name not in entries]
+        current = {entry["sha256"] for entry in entries.values()}
+        for name in changed + removed:
+            # Identical PDFs share their dockey: keep it while another copy remains
+            if manifest[name]["dockey"] not in current:
+                docs.delete(dockey=manifest[name]["dockey"])
+
+        new = added + changed
+        failed = []
+        if new:
+            keys = [entries[name]["sha256"] for name in new]
+            paths = [self.paper_dir / name for name in new]
+            if redirect_output:
+                # suppress output from docs.aadd()
+                with open(os.devnull, "w") as fnull:
+                    with contextlib.redirect_stdout(fnull), contextlib.redirect_stderr(fnull):
+                        errors = asyncio.run(self._ingest(docs, paths, keys))
+            else:
+                errors = asyncio.run(self._ingest(docs, paths, keys, progress=False))
+            for name, error in zip(new, errors):
+                if error is not None:
+                    logger.warning(f"Could not index {name}: {error}")
+                    failed.append(name)
+                    del entries[name]  # retried at the next update
+
+        for name, entry in entries.items():
+            entry["dockey"] = entry["sha256"]
+        if new or removed or not (self.directory / DOCS_FILE).exists():
+            self._save(docs, entries)
+        summary = {"added": [n for n in added if n not in failed], "changed": [n for n in changed if n not in failed],
+                   "removed": removed, "failed": failed, "unchanged": len(entries) - len(new) + len(failed),
+                   "seconds": time.perf_counter() - start}
+        logger.info(f"Paper index {self.directory}: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+                    f"{len(removed)} removed, {len(failed)} failed, {summary['unchanged']} unchanged "
+                    f"({summary['seconds']:.1f} s)")
+        return docs, summary
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Any, Dict
+from src import constants
 
 
 class Tool(BaseModel):
@@ -197,6 +198,7 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                 "The tleap process parameterizes the biomolecule using the Amber force field ff14sb, "
                 f"generates Amber topology ({pdb_id}.prmtop) and coordinate ({pdb_id}.inpcrd) files. "
                 f"ParmEd is then used to convert these files to GROMACS format (topol.top, {pdb_id}.gro). "
+                "The output reports the atom count of the solvated system and its estimated cost relative to a 16 Å rectangular box. "
                 "It executes the shell script 'run_tleap.sh' in the working directory specified by sandbox_dir ({sandbox_dir}). "
                 "All input and output files are read from and written to this directory. "
                 "If tleap fails, inspect the PDB for missing atoms or nonstandard residues."
@@ -222,6 +224,21 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                         "type": "string",
                         "description": (f"The PDB ID of the structure to be prepared: {pdb_id}. "),
                     },
+                    "box_shape": {
+                        "type": "string",
+                        "enum": ["octahedron", "rectangular"],
+                        "description": (
+                            "Shape of the solvent box. A truncated octahedron (default) needs ~25% fewer water molecules than a rectangular box "
+                            "for the same buffer. The solute is rotated onto its principal axes before solvation."
+                        ),
+                    },
+                    "buffer": {
+                        "type": "number",
+                        "description": (
+                            "Minimum distance in Å between the solute and the box edge (default 16). "
+                            "Keep it above 10 Å so periodic images stay further apart than the 1.2 nm cut-off."
+                        ),
+                    },
                 },
                 "required": ["sandbox_dir", "input_pdb", "pdb_id"],
             },
@@ -322,6 +339,21 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                             f"The three-letter residue name of the ligand to extract from the PDB file, in capital letters, called {ligand_name}."
                         ),
                     },
+                    "box_shape": {
+                        "type": "string",
+                        "enum": ["octahedron", "rectangular"],
+                        "description": (
+                            "Shape of the solvent box. A truncated octahedron (default) needs ~25% fewer water molecules than a rectangular box "
+                            "for the same buffer. The solute is rotated onto its principal axes before solvation."
+                        ),
+                    },
+                    "buffer": {
+                        "type": "number",
+                        "description": (
+                            "Minimum distance in Å between the solute and the box edge (default 16). "
+                            "Keep it above 10 Å so periodic images stay further apart than the 1.2 nm cut-off."
+                        ),
+                    },
                 },
                 "required": ["sandbox_dir", "input_pdb", "pdb_id", "ligand_files", "ligand_name"],
             },
@@ -340,6 +372,8 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                 Parameter (.mdp) files can be found in the sandbox_dir. All intermediate and output files —
                 including md.tpr, md.xtc, md.edr, and md.log — are generated in the same
                 'sandbox_dir'.
+                The energy files are then read to write potential.xvg (minimization), temperature.xvg (NVT),
+                pressure.xvg and density.xvg (NPT), and the tool output reports their mean, fluctuation and drift.
                 """
             ),
             parameters={
@@ -399,7 +433,9 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                     The script performs production MD using the provided checkpoint file from NPT equilibration, npt.cpt.
                     All intermediate and output files — including md.tpr, md.xtc, md.edr, and md.log are generated in the same 'sandbox_dir'.
                     If the user requests another production run length than the default 0.1 ns, the md.mdp file must be edited accordingly before running this tool.
+                    If hydrogen mass repartitioning (hmr) is enabled in the plan parameters, md.mdp uses a 4 fs timestep (dt = 0.004) instead of 2 fs, so nsteps is halved for the same duration.
                     The output trajectory file is md.xtc.
+                    md.xtc is analysed while the run progresses (RMSD, RMSF, radius of gyration, hydrogen bonds); the result reports warnings if the backbone RMSD, the radius of gyration or the ligand contacts indicate an unstable system, and gromacs_analysis then reuses this analysis.
                     """
             ),
             parameters={
@@ -442,7 +478,17 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                         "description": (
                             "Three-character residue name of the ligand (capital letters or numbers). If no ligand was provided by user, do not input this argument."
                         ),
-                    }
+                    },
+                    "output_policy": {
+                        "type": "string",
+                        "enum": ["full", "reduced"],
+                        "description": (
+                            "'full' (default) writes the whole solvated system to md.xtc every 10 ps. "
+                            "'reduced' writes only the protein (and ligand) to md.xtc, with about 1000 frames over the run, "
+                            "plus sparse full-system snapshots in md.trr and a matching md_solute.tpr. "
+                            "Use 'reduced' for long runs of large solvated systems; protein-water hydrogen bonds are then not analysed."
+                        ),
+                    },
                 },
                 "required": ["sandbox_dir", "input_gro", "npt_cpt_file", "md_temp", "md_duration"],
             },
@@ -455,12 +501,16 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                     This tool should be executed AFTER production with the gromacs_production tool is COMPLETE.
                     The input is the production trajectory md.xtc.
                     The output trajectory file is md.xtc.
-                    PBC is removed to generate md_noPBC.xtc which is used for analysis. 
-                    RMSD analysis is performed to create rmsd.xvg (with respect to the initial structure of the trajectory) and rmsd_xtal.xvg (with respect to the crystal structure). 
+                    All analyses are computed in a single pass over the trajectory, which also writes the PBC-corrected md_noPBC.xtc.
+                    RMSD analysis is performed to create rmsd.xvg (with respect to the initial structure of the trajectory) and rmsd_xtal.xvg (with respect to the minimized crystal structure em.gro). 
                     RMSF analysis is performed to create rmsf.xvg.
                     Radius of gyration analysis is performed to create gyrate.xvg.
+                    Essential dynamics (principal component analysis of the fitted backbone) is performed to create eigenval.xvg (eigenvalues), proj.xvg (projections of the trajectory on the main modes), pca.npz (mean structure, modes and projections) and pca_extreme_pc1.pdb to pca_extreme_pc3.pdb (structures interpolated between the extreme projections on the first three modes); the variance captured by the first modes is summarized in the tool output.
                     Hydrogen bond analysis is performed to create hbnum_mainchain.xvg (number of hydrogen bonds in the protein backbone), hbnum_sidechain.xvg (number of hydrogen bonds in the protein side chains), and hbnum_prot_wat.xvg (total number of hydrogen bonds between the protein and water molecules).
                     If a ligand is present, hbnum_prot_lig.xvg (number of hydrogen bonds between the protein and the ligand) is also created.
+                    If a ligand is present, a protein-ligand interaction fingerprint is also computed: interactions.csv lists, for each residue interacting with the ligand, the fraction of frames with a contact, hydrogen bond, salt bridge or pi-stacking interaction (per-frame data in interaction_fingerprint.npz), and the most persistent interactions are summarized in the tool output.
+                    The convergence of the run is assessed from the backbone RMSD, the radius of gyration and the ligand contacts (block averages, autocorrelation times and effective sample sizes, in convergence.csv): the tool output says whether the production run is long enough, and otherwise by how much it should be extended.
+                    All the results are also stored in analysis_results.npz and summarized in the tool output (mean, drift, block averages and trend of each series); the same summary is available later with the summarize_analysis tool.
                     """
             ),
             parameters={
@@ -490,6 +540,83 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                 "required": ["sandbox_dir", "input_xtc"],
             },
         ),
+        Tool(
+            name="gromacs_clustering",
+            description=(
+                """
+                    Cluster the production trajectory into representative protein (and ligand) conformations.
+                    This tool should be executed AFTER the gromacs_analysis tool successfully created the md_noPBC.xtc trajectory file.
+                    Frames are fitted on the C-alpha atoms to the average structure and clustered by the RMSD of the C-alpha atoms (and of the ligand heavy atoms if a ligand is present) after this common fit, with the GROMOS method or, for very long trajectories, an incremental leader method. This RMSD is an upper bound on the pairwise-fitted RMSD used by gmx cluster, so clusters are somewhat tighter than gmx cluster's at the same cutoff.
+                    clusters.csv lists the size, population fraction and medoid (most representative) frame of each cluster, clust-id.xvg gives the cluster of every frame, and the medoid structures of the most populated clusters are written as PDB files to the clusters directory (clusters/cluster_001.pdb is the most populated).
+                    """
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "sandbox_dir": {
+                        "type": "string",
+                        "description": (
+                            "Absolute path to the working directory of the production run. Outputs are written here."
+                        ),
+                    },
+                    "input_xtc": {
+                        "type": "string",
+                        "description": (
+                            "Trajectory file from the production run. It should be called md.xtc (without full file path). "
+                            "Must be located within sandbox_dir, together with md_noPBC.xtc written by gromacs_analysis."
+                        ),
+                    },
+                    "ligand_name": {
+                        "type": ["string", "null"],
+                        "description": (
+                            f"The three-letter residue name of the ligand in capital letters {ligand_name}. "
+                            "If no ligand is present, this can be left null."
+                        ),
+                    },
+                    "cutoff": {
+                        "type": ["number", "null"],
+                        "description": (
+                            f"RMSD cutoff in nm for two frames to belong to the same cluster. Defaults to {constants.CLUSTER_CUTOFF} nm; "
+                            "use a larger cutoff for fewer, broader clusters."
+                        ),
+                    },
+                },
+                "required": ["sandbox_dir", "input_xtc"],
+            },
+        ),
+        Tool(
+            name="summarize_analysis",
+            description=(
+                """
+                    Summarize the results of the gromacs_analysis tool, stored in analysis_results.npz in the sandbox directory.
+                    This tool should be executed AFTER the gromacs_analysis tool is COMPLETE, and used to write analysis.txt instead of reading the .xvg files, which are too long to be read in full.
+                    For each time series (rmsd, rmsd_xtal, gyrate, hbnum_mainchain, hbnum_sidechain, hbnum_prot_wat, hbnum_prot_lig, ligand_contacts) it gives the mean and standard deviation, the range, the drift over the run, the block averages with their standard error (convergence) and a downsampled trend.
+                    For rmsf it gives the most flexible residues and a downsampled profile, and for pca_variance the share of the backbone fluctuations along each essential mode.
+                    """
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "sandbox_dir": {
+                        "type": "string",
+                        "description": "Absolute path to the working directory of the production run, where gromacs_analysis was run.",
+                    },
+                    "series": {
+                        "type": ["array", "null"],
+                        "items": {"type": "string"},
+                        "description": "Names of the series to summarize, e.g. [\"rmsd\", \"gyrate\"]. Leave null to summarize all of them.",
+                    },
+                    "points": {
+                        "type": ["integer", "null"],
+                        "description": (
+                            f"Number of points of the downsampled trend of each series. Defaults to {constants.SUMMARY_POINTS}; "
+                            "use more points for a finer view of a specific series."
+                        ),
+                    },
+                },
+                "required": ["sandbox_dir"],
+            },
+        ),
         Tool(
             name="run_gmxMMPBSA",
             description=(
@@ -499,6 +626,8 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                     nsteps and nstxout values can be found in the md.mdp file used for the production run, located in sandbox_dir.
                     The temperature used during the MD simulation is also required for the MMPBSA calculation.
                     A new directory called gmx_MMPBSA is created and all MMPBSA output files are saved there, including the final binding energy summary file called FINAL_RESULTS_MMPBSA.dat.
+                    The frames are split into chunks computed concurrently by independent gmx_MMPBSA processes (gmx_MMPBSA/chunk_* directories), and their per-frame energies are merged into FINAL_RESULTS_MMPBSA.csv, with the statistics over all frames in FINAL_RESULTS_MMPBSA.dat.
+                    The receptor (Protein) and ligand groups are resolved by name from index.ndx, and gmx_MMPBSA is given a complex-only trajectory of the sampled frames (md_complex.xtc) with the matching complex.pdb, complex.ndx and solvent-free topol_complex.top.
                     The final binding energy can be found in FINAL_RESULTS_MMPBSA.dat at the last ΔTOTAL line.
                     """
             ),
@@ -527,10 +656,101 @@ def create_tool_schema_md(sandbox_dir, ligand_name, pdb_id):
                         "type": ["string"],
                         "description": ("Temperature used during the MD simulation, found in the md.mdp file located in sandbox_dir. This value is an integer with base 10."),
                     },
+                    "adaptive": {
+                        "type": ["boolean", "null"],
+                        "description": (
+                            "Adaptive frame sampling: evenly spaced frames first, then progressively denser passes, stopping once the standard "
+                            f"error of the binding free energy is below {constants.MMPBSA_TARGET_SEM} kcal/mol or the frames are correlated. "
+                            "Much cheaper than processing every sampled frame; the achieved uncertainty is reported. Defaults to false."
+                        ),
+                    },
+                    "method": {
+                        "type": "string",
+                        "enum": ["pb", "gb"],
+                        "description": (
+                            "Solvation model: 'pb' (Poisson-Boltzmann, default, output in gmx_MMPBSA) or 'gb' (generalized Born, "
+                            "much faster and less accurate, output in gmx_MMPBSA_GB)."
+                        ),
+                    },
                 },
                 "required": ["sandbox_dir", "pdb_id", "nsteps", "nstxout_compressed", "md_temp"],
             },
         ),
+        Tool(
+            name="rank_binding_affinities",
+            description=(
+                f"""
+                    Rank the ligands of several protein-ligand production runs against the same target by binding free energy.
+                    Run it AFTER the gromacs_analysis tool created md_noPBC.xtc in every run directory; the settings are read from each md.mdp.
+                    The fast generalized Born model (gmx_MMPBSA_GB directory) is computed for every run, then only the top-ranked candidates,
+                    and those whose GB estimate is within {constants.MMPBSA_ESCALATE_SIGMAS:g} standard errors of the last of them, are escalated to the
+                    full Poisson-Boltzmann model (gmx_MMPBSA directory). Both tiers are written to binding_ranking.csv in the parent directory of the runs.
+                    """
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "sandbox_dirs": {
+                        "type": ["array", "null"],
+                        "items": {"type": "string"},
+                        "description": f"Absolute paths of the run directories to rank. Defaults to the current one: {sandbox_dir}.",
+                    },
+                    "pdb_id": {
+                        "type": ["string", "null"],
+                        "description": f"The PDB ID of the common target, recorded with every result. Defaults to {pdb_id}.",
+                    },
+                    "ligand_names": {
+                        "type": ["array", "null"],
+                        "items": {"type": "string"},
+                        "description": (
+                            "Ligand residue name of each run, in the order of sandbox_dirs. "
+                            "When omitted, each run's ligand is read from its <ligand>_h.pdb file."
+                        ),
+                    },
+                    "top": {
+                        "type": ["integer", "null"],
+                        "description": f"Number of best GB candidates escalated to Poisson-Boltzmann. Defaults to {constants.MMPBSA_ESCALATE_TOP}.",
+                    },
+                    "adaptive": {
+                        "type": ["boolean", "null"],
+                        "description": "Adaptive frame sampling of each gmx_MMPBSA run, as for run_gmxMMPBSA. Defaults to false.",
+                    },
+                },
+                "required": [],
+            },
+        ),
+        Tool(
+            name="query_binding_energies",
+            description=(
+                """
+                    Query the database of binding free energies recorded by every run_gmxMMPBSA calculation, across all runs.
+                    Returns one line per run and solvation model, most favourable first: ΔTOTAL ± SEM and its main components (kcal/mol).
+                    Use it to compare the current result with previous runs of the same target or ligand instead of opening their result files.
+                    """
+            ),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "pdb_id": {
+                        "type": ["string", "null"],
+                        "description": f"PDB ID of the target, e.g. {pdb_id}. All targets if omitted.",
+                    },
+                    "ligand_name": {
+                        "type": ["string", "null"],
+                        "description": "Ligand residue name. All ligands if omitted.",
+                    },
+                    "md_temp": {
+                        "type": ["number", "null"],
+                        "description": "MD temperature (K). All temperatures if omitted.",
+                    },
+                    "method": {
+                        "type": ["string", "null"],
+                        "description": "'pb' (Poisson-Boltzmann) or 'gb' (generalized Born). Both if omitted.",
+                    },
+                },
+                "required": [],
+            },
+        ),
         Tool(
             name="find_input",
             description="Find the uploaded file from the user. This always searches the sandbox directory automatically.",